@@ -0,0 +1,124 @@
+"""Офлайн-перевірка прогнозу відключень на збереженій історії.
+
+Проганяє історію по порядку: після кожного відключення навчає модель на
+даних до цього моменту і порівнює прогноз із фактичним початком
+наступного відключення. Для порівняння — наївний прогноз «останнє
+відключення + середній інтервал між попередніми».
+
+Запуск:
+  python backtest.py                    # історія основного сенсора з DATA_DIR
+  python backtest.py --sensor kitchen   # інший сенсор
+  python backtest.py --synthetic 26     # згенерована історія на 26 тижнів
+"""
+import argparse
+import os
+import time
+import numpy as np
+from datetime import datetime
+
+from bot import (DATA_DIR, DEFAULT_SENSOR, ForecastEngine, OutageJournal, PowerMonitor,
+                 to_seconds, from_seconds)
+
+def load_history(data_dir, sensor_id):
+    monitor = PowerMonitor(sensor_id=sensor_id)
+    path = data_dir if sensor_id == DEFAULT_SENSOR else os.path.join(data_dir, 'sensors', sensor_id)
+    # Лише читання: журнал може належати запущеному боту
+    OutageJournal(path).load(monitor)
+    return monitor
+
+def synthetic_history(weeks, seed=1):
+    """Графік із двома-трьома «черговими» відключеннями на добу, зсувами
+    і випадковими аваріями — приблизно як у реальних даних"""
+    rng = np.random.default_rng(seed)
+    monitor = PowerMonitor(sensor_id='synthetic')
+    start = to_seconds(datetime(2026, 1, 5))
+    slots = [(weekday, hour) for weekday in range(7) for hour in rng.choice(24, 3, replace=False)]
+    outages = []
+    for week in range(weeks):
+        for weekday, hour in slots:
+            if rng.random() < 0.8:
+                at = start + (week * 7 + weekday) * 86400 + int(hour) * 3600 + int(rng.normal(0, 1200))
+                outages.append((at, at + int(rng.uniform(1.5, 4) * 3600)))
+        for _ in range(rng.poisson(2)):
+            at = start + week * 7 * 86400 + int(rng.uniform(0, 7 * 86400))
+            outages.append((at, at + int(rng.uniform(0.3, 2) * 3600)))
+    outages.sort()
+    starts, ends, last_end = [], [], 0
+    for at, end in outages:
+        if at > last_end:
+            starts.append(at)
+            ends.append(end)
+            last_end = end
+    monitor.load_state(np.array(starts), np.array(ends), None)
+    return monitor
+
+def backtest(monitor, warmup_weeks=2, naive_window=10):
+    index = monitor.index
+    engine = ForecastEngine(index, monitor.analytics)
+    warmup_until = index.starts[0] + warmup_weeks * 7 * 86400
+    errors, naive_errors, fit_ms, missed = [], [], [], 0
+    for k in range(1, len(index)):
+        now, actual = index.ends[k - 1], index.starts[k]
+        if now < warmup_until:
+            continue
+        started = time.perf_counter()
+        engine.fit(now)
+        fit_ms.append((time.perf_counter() - started) * 1000)
+        forecast = engine.predict(now)
+        if forecast is None or forecast['next'] is None:
+            missed += 1
+            continue
+        errors.append(abs(forecast['next'] - actual) / 3600)
+
+        lo = max(1, k - naive_window)
+        gaps = [index.starts[i] - index.ends[i - 1] for i in range(lo, k)]
+        if gaps:
+            naive_errors.append(abs(now + sum(gaps) / len(gaps) - actual) / 3600)
+    return {
+        'errors': np.array(errors),
+        'naive_errors': np.array(naive_errors),
+        'fit_ms': np.array(fit_ms),
+        'missed': missed,
+    }
+
+def report(monitor, result):
+    errors, naive = result['errors'], result['naive_errors']
+    print(f"📚 Відключень: {len(monitor.index)} "
+          f"({from_seconds(monitor.index.starts[0]):%d.%m.%Y} – {from_seconds(monitor.index.ends[-1]):%d.%m.%Y})")
+    if not len(errors):
+        print("Недостатньо даних для перевірки")
+        return
+    print(f"🔔 Прогнозів: {len(errors)}, без прогнозу: {result['missed']}")
+    print()
+    print(f"{'':18}{'модель':>10}{'наївний':>10}")
+    for title, model_value, naive_value in (
+        ('MAE, год', errors.mean(), naive.mean()),
+        ('медіана, год', np.median(errors), np.median(naive)),
+        ('у межах ±1 год', (errors <= 1).mean() * 100, (naive <= 1).mean() * 100),
+        ('у межах ±3 год', (errors <= 3).mean() * 100, (naive <= 3).mean() * 100),
+    ):
+        print(f"{title:18}{model_value:>10.1f}{naive_value:>10.1f}")
+    print()
+    fit_ms = result['fit_ms']
+    print(f"⏱ Навчання: p50 {np.percentile(fit_ms, 50):.2f} мс, p99 {np.percentile(fit_ms, 99):.2f} мс, "
+          f"макс {fit_ms.max():.2f} мс")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--sensor', default=DEFAULT_SENSOR)
+    parser.add_argument('--synthetic', type=int, metavar='WEEKS')
+    parser.add_argument('--warmup-weeks', type=int, default=2)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        monitor = synthetic_history(args.synthetic)
+    else:
+        monitor = load_history(args.data_dir, args.sensor)
+    if len(monitor.index) < 2:
+        print("Недостатньо даних: потрібно мінімум 2 відключення")
+        return
+    report(monitor, backtest(monitor, args.warmup_weeks))
+
+if __name__ == '__main__':
+    main()
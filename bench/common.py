@@ -0,0 +1,84 @@
+"""Спільне для бенчмарків: перцентилі, RSS, таблиця, порівняння з базовим прогоном."""
+import json
+import os
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+def rss_mb(pid='self'):
+    """Поточний RSS процесу, МБ (Linux)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float('nan')
+
+def summarize(name, latencies, elapsed=None, **extra):
+    """Рядок результату: кількість, пропускна здатність, p50/p99 (мс)"""
+    latencies = np.asarray(latencies, dtype=float)
+    count = len(latencies)
+    elapsed = latencies.sum() if elapsed is None else elapsed
+    row = {
+        'name': name,
+        'count': count,
+        'ops_per_s': count / elapsed if elapsed else 0.0,
+        'p50_ms': float(np.percentile(latencies, 50)) * 1000 if count else 0.0,
+        'p99_ms': float(np.percentile(latencies, 99)) * 1000 if count else 0.0,
+    }
+    row.update(extra)
+    return row
+
+def print_table(rows):
+    columns = ['name', 'count', 'ops_per_s', 'p50_ms', 'p99_ms'] + sorted(
+        {key for row in rows for key in row} - {'name', 'count', 'ops_per_s', 'p50_ms', 'p99_ms'})
+    width = max(len(row['name']) for row in rows) + 2
+    print(f"{'':{width}}" + ''.join(f"{column:>12}" for column in columns[1:]))
+    for row in rows:
+        cells = []
+        for column in columns[1:]:
+            value = row.get(column, '')
+            cells.append(f"{value:>12.3f}" if isinstance(value, float) else f"{value!s:>12}")
+        print(f"{row['name']:{width}}" + ''.join(cells))
+
+def save_results(path, rows):
+    with open(path, 'w') as f:
+        json.dump(rows, f, ensure_ascii=False, indent=1)
+
+def compare_results(path, rows, tolerance):
+    """Порівняти p99 з базовим прогоном; повертає список регресій"""
+    with open(path) as f:
+        baseline = {row['name']: row for row in json.load(f)}
+    regressions = []
+    for row in rows:
+        base = baseline.get(row['name'])
+        if base and base['p99_ms'] and row['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+            regressions.append((row['name'], base['p99_ms'], row['p99_ms']))
+    return regressions
+
+def report(rows, args):
+    """Таблиця, збереження і перевірка на регресії (--save / --compare)"""
+    print_table(rows)
+    if args.save:
+        save_results(args.save, rows)
+        print(f"\n💾 Результати збережено в {args.save}")
+    if args.compare:
+        regressions = compare_results(args.compare, rows, args.tolerance)
+        if regressions:
+            print(f"\n❌ Регресії p99 (допуск {args.tolerance:.0%}):")
+            for name, before, after in regressions:
+                print(f"  {name}: {before:.3f} -> {after:.3f} мс")
+            return 1
+        print(f"\n✅ Регресій p99 немає (допуск {args.tolerance:.0%})")
+    return 0
+
+def add_report_arguments(parser):
+    parser.add_argument('--save', metavar='JSON', help='зберегти результати')
+    parser.add_argument('--compare', metavar='JSON', help='порівняти з базовими результатами')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='допустиме погіршення p99')
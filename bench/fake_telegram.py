@@ -0,0 +1,138 @@
+"""Локальна заглушка Telegram Bot API для бенчмарків.
+
+Відповідає на методи, якими користується бот (getMe, getUpdates,
+sendMessage, ...), і рахує затримку відповіді на кожен апдейт:
+від моменту, коли бот забрав апдейт через getUpdates, до sendMessage
+в той самий чат.
+
+Окремо: python bench/fake_telegram.py --port 8081
+Бот: TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_TOKEN=1:bench python bot.py
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict, deque
+
+from aiohttp import web
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Power Bench', 'username': 'power_bench_bot'}
+
+class FakeTelegram:
+    def __init__(self, send_delay=0.0):
+        self.send_delay = send_delay   # імітація затримки мережі до Telegram
+        self.updates = deque()
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.new_updates = asyncio.Event()
+        self.waiting = defaultdict(deque)  # chat_id -> моменти видачі апдейтів боту
+        self.reply_latencies = []
+        self.sent = defaultdict(int)       # chat_id -> кількість sendMessage
+        self.calls = defaultdict(int)
+        self.app = web.Application()
+        self.app.router.add_post('/bot{token}/{method}', self.handle)
+        self.app.router.add_get('/bot{token}/{method}', self.handle)
+
+    # --- Апдейти від «користувачів» ---
+
+    def push_text(self, chat_id, text):
+        update_id = next(self.update_ids)
+        self.updates.append({
+            'update_id': update_id,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private', 'first_name': f'user{chat_id}'},
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': f'user{chat_id}'},
+                'text': text,
+            },
+        })
+        self.new_updates.set()
+
+    def total_sent(self):
+        return sum(self.sent.values())
+
+    # --- Bot API ---
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        self.calls[method] += 1
+        params = dict(request.query)
+        if request.can_read_body:
+            if request.content_type == 'application/json':
+                params.update(await request.json())
+            else:
+                params.update(await request.post())
+        handler = getattr(self, f'api_{method.lower()}', None)
+        result = await handler(params) if handler else True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def api_getme(self, params):
+        return BOT_USER
+
+    async def api_getupdates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        while self.updates and self.updates[0]['update_id'] < offset:
+            self.updates.popleft()
+        if not self.updates and timeout:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        batch = list(itertools.islice(self.updates, limit))
+        now = time.perf_counter()
+        for update in batch:
+            if not update.get('handed_out'):
+                update['handed_out'] = True
+                self.waiting[update['message']['chat']['id']].append(now)
+        return [{key: value for key, value in update.items() if key != 'handed_out'} for update in batch]
+
+    async def api_sendmessage(self, params):
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        chat_id = int(params['chat_id'])
+        self.sent[chat_id] += 1
+        waiting = self.waiting.get(chat_id)
+        if waiting:
+            self.reply_latencies.append(time.perf_counter() - waiting.popleft())
+        return self._message(chat_id, params.get('text', ''))
+
+    async def api_editmessagetext(self, params):
+        return self._message(int(params.get('chat_id') or 0), params.get('text', ''))
+
+    def _message(self, chat_id, text):
+        return {
+            'message_id': next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': text,
+        }
+
+async def start_fake_telegram(port, send_delay=0.0):
+    fake = FakeTelegram(send_delay)
+    runner = web.AppRunner(fake.app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return fake, runner
+
+async def serve(port, send_delay):
+    fake, runner = await start_fake_telegram(port, send_delay)
+    print(f"🧪 Заглушка Bot API на http://127.0.0.1:{port}")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(json.dumps({'calls': fake.calls, 'sent': fake.total_sent()}, ensure_ascii=False))
+    finally:
+        await runner.cleanup()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--send-delay', type=float, default=0.0, help='секунд на кожен sendMessage')
+    args = parser.parse_args()
+    asyncio.run(serve(args.port, args.send_delay))
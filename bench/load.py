@@ -0,0 +1,135 @@
+"""Навантажувальний тест: bot.py проти локальної заглушки Telegram Bot API.
+
+Запускає заглушку (bench/fake_telegram.py) і bot.py окремим процесом з
+тимчасовим DATA_DIR, потім:
+  1. шторм вебхуків: сенсори шлють power_lost/power_restored паралельно;
+  2. потік апдейтів: користувачі натискають кнопки (long-polling);
+і звітує пропускну здатність, p50/p99 і RSS процесу бота.
+
+  python bench/load.py
+  python bench/load.py --events 20000 --sensors 500 --concurrency 128 --updates 5000
+  python bench/load.py --compare bench/load_baseline.json
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from common import ROOT, add_report_arguments, report, rss_mb, summarize
+from fake_telegram import start_fake_telegram
+
+BUTTONS = ["⚡ Статус", "📊 Статистика", "🕐 Історія", "📈 Аналітика", "🗓 Карта відключень", "🔔 Прогноз"]
+
+async def wait_ready(session, url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.returncode is not None:
+            raise RuntimeError(f"bot.py завершився з кодом {process.returncode}")
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("bot.py не відповів на /health")
+
+async def webhook_storm(session, base_url, events, sensors, concurrency):
+    """events запитів: кожен сенсор по черзі шле power_lost і power_restored"""
+    latencies = []
+    per_sensor = max(1, events // sensors)
+    queue = asyncio.Queue()
+    for sensor in range(sensors):
+        queue.put_nowait(sensor)
+
+    async def sensor_worker():
+        while not queue.empty():
+            sensor = queue.get_nowait()
+            for i in range(per_sensor):
+                kind = 'power_lost' if i % 2 == 0 else 'power_restored'
+                started = time.perf_counter()
+                async with session.post(f'{base_url}/sensors/bench{sensor}/{kind}',
+                                        headers={'Idempotency-Key': f'{sensor}-{i}'}) as response:
+                    await response.read()
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sensor_worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+async def update_flood(fake, updates, chats, timeout=120):
+    """updates натискань кнопок від chats користувачів; чекаємо всі відповіді"""
+    before = len(fake.reply_latencies)
+    started = time.perf_counter()
+    for i in range(updates):
+        fake.push_text(10_000_000 + i % chats, BUTTONS[i % len(BUTTONS)])
+    deadline = time.monotonic() + timeout
+    while len(fake.reply_latencies) - before < updates and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    return fake.reply_latencies[before:], time.perf_counter() - started
+
+async def run(args):
+    fake, fake_runner = await start_fake_telegram(args.telegram_port, args.send_delay)
+    data_dir = tempfile.mkdtemp(prefix='power-bench-')
+    env = dict(os.environ,
+               BOT_TOKEN='1:bench', CHAT_ID='42', PORT=str(args.port), DATA_DIR=data_dir,
+               TELEGRAM_API_URL=f'http://127.0.0.1:{args.telegram_port}',
+               TG_GLOBAL_RATE='100000', TG_CHAT_RATE='100000', PYTHONUNBUFFERED='1')
+    env.pop('TELEGRAM_WEBHOOK_URL', None)
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, 'bot.py'), env=env,
+        stdout=asyncio.subprocess.DEVNULL if not args.verbose else None,
+        stderr=asyncio.subprocess.STDOUT if not args.verbose else None)
+    base_url = f'http://127.0.0.1:{args.port}'
+    rows = []
+    try:
+        connector = aiohttp.TCPConnector(limit=args.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            await wait_ready(session, f'{base_url}/health', process)
+            idle_rss = rss_mb(process.pid)
+
+            latencies, elapsed = await webhook_storm(session, base_url, args.events, args.sensors, args.concurrency)
+            rows.append(summarize('webhook storm', latencies, elapsed, rss_mb=rss_mb(process.pid)))
+
+            latencies, elapsed = await update_flood(fake, args.updates, args.chats)
+            rows.append(summarize('button replies', latencies, elapsed, rss_mb=rss_mb(process.pid)))
+            if len(latencies) < args.updates:
+                print(f"⚠️ Отримано лише {len(latencies)} з {args.updates} відповідей", file=sys.stderr)
+
+            scrape_started = time.perf_counter()
+            async with session.get(f'{base_url}/metrics') as response:
+                await response.read()
+            print(f"🧪 RSS бота: {idle_rss:.0f} МБ на старті; sendMessage у заглушку: {fake.total_sent()}; "
+                  f"/metrics {(time.perf_counter() - scrape_started) * 1000:.1f} мс", file=sys.stderr)
+    finally:
+        if process.returncode is None:
+            process.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(process.wait(), 20)
+            except asyncio.TimeoutError:
+                process.kill()
+        await fake_runner.cleanup()
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=18080, help='порт бота')
+    parser.add_argument('--telegram-port', type=int, default=18081, help='порт заглушки Bot API')
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--sensors', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--chats', type=int, default=500)
+    parser.add_argument('--send-delay', type=float, default=0.0, help='імітація затримки Telegram, с')
+    parser.add_argument('--verbose', action='store_true', help='показувати лог бота')
+    add_report_arguments(parser)
+    args = parser.parse_args()
+    sys.exit(report(asyncio.run(run(args)), args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Мікробенчмарки PowerMonitor і обробників кнопок на історіях різного розміру.
+
+Для кожного розміру історії (за замовчуванням 1k, 10k, 100k, 1M) будує
+монітор із синтетичною історією і міряє кожен метод і рендер: операцій
+за секунду, p50/p99 і RSS процесу після заповнення.
+
+  python bench/micro.py
+  python bench/micro.py --sizes 1000,1000000 --save bench/baseline.json
+  python bench/micro.py --compare bench/baseline.json   # код 1 при регресії p99
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+import time
+
+import numpy as np
+
+from common import add_report_arguments, report, rss_mb, summarize
+
+import bot
+from bot import (ForecastEngine, PowerMonitor, from_seconds, render_analytics, render_forecast,
+                 render_heatmap, render_history, render_stats, render_status, to_seconds)
+
+def seed_history(size, now, seed=1):
+    """size відключень, що закінчуються за годину до now: інтервали 1–12 год, тривалість 0.5–4 год"""
+    rng = np.random.default_rng(seed)
+    durations = rng.integers(1800, 4 * 3600, size)
+    gaps = rng.integers(3600, 12 * 3600, size)
+    ends = now - 3600 - np.concatenate([[0], np.cumsum(durations[1:] + gaps[1:])])[::-1]
+    starts = ends - durations
+    sensor = PowerMonitor(sensor_id=f'bench{size}')
+    sensor.load_state(starts, ends, None)
+    return sensor
+
+def measure(name, func, budget, max_calls=100000):
+    """Викликати func до вичерпання budget секунд; затримки кожного виклику"""
+    latencies = []
+    deadline = time.perf_counter() + budget
+    while len(latencies) < max_calls:
+        started = time.perf_counter()
+        func()
+        finished = time.perf_counter()
+        latencies.append(finished - started)
+        if finished > deadline:
+            break
+    return name, latencies
+
+class FakeMessage:
+    async def reply_text(self, text, **kwargs):
+        pass
+
+class FakeUpdate:
+    message = FakeMessage()
+
+def bench_size(size, budget):
+    now = to_seconds(bot.datetime.now())
+    started = time.perf_counter()
+    sensor = seed_history(size, now)
+    seed_ms = (time.perf_counter() - started) * 1000
+    rss = rss_mb()
+    bot.monitor = sensor
+    loop = asyncio.new_event_loop()
+    week = now - 7 * 86400
+    cursor = [int(sensor.index.ends[-1]) + 60]
+
+    def add_outage():
+        start = cursor[0]
+        cursor[0] += 120
+        sensor.add_outage(from_seconds(start), from_seconds(start + 60))
+
+    def lost_restored():
+        start = cursor[0]
+        cursor[0] += 120
+        sensor.power_lost(from_seconds(start))
+        sensor.power_restored(from_seconds(start + 60))
+
+    def heatmap_cold():
+        sensor.analytics._compute_long_term(now)
+
+    engine = ForecastEngine(sensor.index, sensor.analytics)
+
+    cases = [
+        ('get_today_stats', sensor.get_today_stats),
+        ('get_stats', sensor.get_stats),
+        ('get_range_stats(week)', lambda: sensor.get_range_stats(from_seconds(week), from_seconds(now))),
+        ('get_outages(week)', lambda: sensor.get_outages(from_seconds(week), from_seconds(now))),
+        ('analytics.summary(month)', lambda: sensor.analytics.summary('month', now)),
+        ('analytics.long_term(cold)', heatmap_cold),
+        ('forecast.fit(cold)', lambda: ForecastEngine(sensor.index, sensor.analytics).fit(now)),
+        ('forecast.fit(warm)', lambda: engine.fit(now)),
+        ('render_status', lambda: render_status(sensor)),
+        ('render_stats', lambda: render_stats(sensor)),
+        ('render_history', lambda: render_history(sensor)),
+        ('render_analytics(week)', lambda: render_analytics(sensor, 'week')),
+        ('render_heatmap', lambda: render_heatmap(sensor)),
+        ('render_forecast', lambda: render_forecast(sensor)),
+    ]
+    for handler in (bot.show_status, bot.show_stats, bot.show_history, bot.show_analytics,
+                    bot.show_heatmap, bot.show_forecast):
+        cases.append((f'{handler.__name__}(cached)',
+                      lambda handler=handler: loop.run_until_complete(handler(FakeUpdate(), None))))
+    # Зміни стану — останніми, щоб не впливати на решту вимірів
+    cases += [('add_outage', add_outage), ('power_lost+restored', lost_restored)]
+
+    rows = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for name, func in cases:
+            func()  # прогрів
+            name, latencies = measure(name, func, budget)
+            rows.append(summarize(f'{size:>7} {name}', latencies, rss_mb=rss))
+    loop.close()
+    print(f"📚 {size} відключень: заповнення {seed_ms:.0f} мс, RSS {rss:.0f} МБ", file=sys.stderr)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000')
+    parser.add_argument('--budget', type=float, default=0.3, help='секунд на кожен вимір')
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    rows = []
+    for size in map(int, args.sizes.split(',')):
+        rows += bench_size(size, args.budget)
+    sys.exit(report(rows, args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Бекенди стану: файловий журнал (стан у пам'яті) проти спільної бази SQLite.
+
+  1. запис з кількох процесів: кожен процес шле події power_lost/power_restored
+     своїм сенсорам через PowerMonitor і журнал, до повного запису на диск;
+     файловий бекенд — окремий DATA_DIR на процес, SQLite — одна база на всіх;
+  2. читання: відключення за тиждень з індексу в пам'яті і запитом до SQLite;
+  3. затримка реплікації: від події в одному екземплярі до її появи в changes
+     для іншого.
+
+  python bench/store.py
+  python bench/store.py --processes 1,4 --events 50000 --history 1000000
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from common import add_report_arguments, report, summarize
+
+import bot
+from bot import (OutageJournal, SqliteJournal, SqliteStore, from_seconds, get_journal_writer,
+                 to_seconds, timedelta)
+from micro import measure, seed_history
+
+def read_outages(store, sensor_id, lo, hi):
+    """Відключення сенсора, що перетинають [lo, hi), прямо з таблиці"""
+    # Відключення не перетинаються: перше з потрібних — останнє, що почалось до lo
+    return store.reader.execute(
+        'SELECT start_ts, end_ts FROM outages WHERE sensor_id = ?1 AND start_ts < ?3 AND end_ts > ?2 '
+        'AND start_ts >= coalesce((SELECT max(start_ts) FROM outages WHERE sensor_id = ?1 AND start_ts <= ?2), ?2) '
+        'ORDER BY start_ts', (sensor_id, lo, hi)).fetchall()
+
+def write_worker(backend, path, worker, events, barrier, results):
+    """events подій (пари lost/restored) у сенсори одного процесу"""
+    bot.log.disabled = True
+    sensors = [bot.PowerMonitor(sensor_id=f'w{worker}s{i}') for i in range(10)]
+    if backend == 'sqlite':
+        store = SqliteStore(path, instance=f'bench{worker}')
+        journals = [SqliteJournal(store, sensor.sensor_id, sensor.group) for sensor in sensors]
+    else:
+        journals = [OutageJournal(os.path.join(path, f'worker{worker}', sensor.sensor_id)) for sensor in sensors]
+    for sensor, journal in zip(sensors, journals):
+        sensor.attach_journal(journal)
+        sensor.events = bot.PowerEventMachine(sensor, window=0)
+    base = to_seconds(bot.datetime.now()) - events * 60
+    barrier.wait()
+    started = time.perf_counter()
+    for i in range(events // 2):
+        sensor = sensors[i % len(sensors)]
+        at = base + i * 120
+        sensor.events.feed('lost', from_seconds(at))
+        sensor.events.feed('restored', from_seconds(at + 60))
+    get_journal_writer().stop(timeout=600)
+    results.put(time.perf_counter() - started)
+
+def bench_writes(backend, processes, events):
+    directory = tempfile.mkdtemp(prefix='power-store-')
+    path = os.path.join(directory, 'state.db') if backend == 'sqlite' else directory
+    if backend == 'sqlite':
+        SqliteStore(path).reader.close()  # схема до старту процесів
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(processes)
+    results = context.Queue()
+    workers = [context.Process(target=write_worker, args=(backend, path, worker, events, barrier, results))
+               for worker in range(processes)]
+    for process in workers:
+        process.start()
+    elapsed = max(results.get() for _ in workers)
+    for process in workers:
+        process.join()
+    return summarize(f'{backend:>6} write x{processes}', [elapsed / events] * (events * processes), elapsed)
+
+def bench_reads(history, budget):
+    now = to_seconds(bot.datetime.now())
+    sensor = seed_history(history, now)
+    path = os.path.join(tempfile.mkdtemp(prefix='power-store-'), 'state.db')
+    store = SqliteStore(path)
+    starts, ends = sensor.index.columns()
+
+    def fill():
+        store._begin()
+        store.db.executemany('INSERT INTO outages VALUES (?, ?, ?)',
+                             zip([sensor.sensor_id] * len(starts), starts.tolist(), ends.tolist()))
+    store.writer.submit(None, 'call', fill)
+    get_journal_writer().stop(timeout=600)
+    week = now - 7 * 86400
+    rows = []
+    for name, func in [
+        ('memory get_outages(week)', lambda: sensor.get_outages(from_seconds(week), from_seconds(now))),
+        ('sqlite read_outages(week)', lambda: read_outages(store, sensor.sensor_id, week, now)),
+        ('sqlite read_sensor(all)', lambda: store.read_sensor(sensor.sensor_id)),
+    ]:
+        func()
+        name, latencies = measure(f'{history:>7} {name}', func, budget)
+        rows.append(summarize(name, latencies))
+    return rows
+
+def bench_replication(count):
+    """Від feed() у екземплярі A до появи зміни в changes_since() екземпляра B"""
+    path = os.path.join(tempfile.mkdtemp(prefix='power-store-'), 'state.db')
+    writer_store = SqliteStore(path, instance='A')
+    reader_store = SqliteStore(path, instance='B')
+    sensor = bot.PowerMonitor(sensor_id='replica')
+    sensor.attach_journal(SqliteJournal(writer_store, sensor.sensor_id, sensor.group))
+    sensor.events = bot.PowerEventMachine(sensor, window=0)
+    at = bot.datetime.now() - timedelta(days=1)
+    latencies = []
+    for i in range(count):
+        started = time.perf_counter()
+        sensor.events.feed('lost' if i % 2 == 0 else 'restored', at + timedelta(minutes=i))
+        while not reader_store.changes_since():
+            time.sleep(0.0005)
+        latencies.append(time.perf_counter() - started)
+    get_journal_writer().stop()
+    return summarize('sqlite replication lag', latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', default='1,2,4')
+    parser.add_argument('--events', type=int, default=20000, help='подій на процес')
+    parser.add_argument('--history', type=int, default=100000, help='відключень для вимірів читання')
+    parser.add_argument('--budget', type=float, default=0.3, help='секунд на кожен вимір читання')
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    bot.log.disabled = True
+    rows = []
+    for processes in map(int, args.processes.split(',')):
+        for backend in ('files', 'sqlite'):
+            rows.append(bench_writes(backend, processes, args.events))
+    rows += bench_reads(args.history, args.budget)
+    rows.append(bench_replication(200))
+    sys.exit(report(rows, args))
+
+if __name__ == '__main__':
+    main()
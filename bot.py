@@ -1,98 +1,1685 @@
 import os
+import re
+import io
+import json
+import atexit
+import logging
+import random
+import sys
+import functools
+import hashlib
 import asyncio
+import mmap
+import multiprocessing
+import queue
+import socket
+import sqlite3
+import struct
+import tempfile
+import threading
+from logging.handlers import QueueHandler, QueueListener
+import time
 import aiohttp
 from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler, MessageHandler, filters
+from telegram.ext import Application, BaseUpdateProcessor, CommandHandler, ContextTypes, CallbackQueryHandler, MessageHandler, filters
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
 from aiohttp import web
-from collections import Counter
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from collections.abc import Sequence
+from bisect import bisect_left, bisect_right
+from array import array
+import numpy as np
 
 # Конфігурація
 BOT_TOKEN = os.environ.get('BOT_TOKEN')
 CHAT_ID = os.environ.get('CHAT_ID')
 DTEK_GROUP = os.environ.get('DTEK_GROUP', '3.2')
+DTEK_SCHEDULE_URL = os.environ.get('DTEK_SCHEDULE_URL', 'https://www.dtek-krem.com.ua/ua/shutdowns')
+SCHEDULE_REFRESH_INTERVAL = int(os.environ.get('SCHEDULE_REFRESH_INTERVAL', 900))
+HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', 15))
 PORT = int(os.environ.get('PORT', 10000))
+# Публічна адреса сервера (https://...). Якщо задана — апдейти приходять
+# вебхуком на TELEGRAM_WEBHOOK_PATH замість long-polling
+TELEGRAM_WEBHOOK_URL = os.environ.get('TELEGRAM_WEBHOOK_URL')
+TELEGRAM_WEBHOOK_PATH = os.environ.get('TELEGRAM_WEBHOOK_PATH', '/telegram')
+TELEGRAM_WEBHOOK_SECRET = os.environ.get('TELEGRAM_WEBHOOK_SECRET') or (
+    hashlib.sha256(BOT_TOKEN.encode()).hexdigest()[:32] if BOT_TOKEN else None)
+UPDATE_CONCURRENCY = int(os.environ.get('UPDATE_CONCURRENCY', 64))
+# Інший сервер Bot API (локальний telegram-bot-api або заглушка з bench/)
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL')
+DATA_DIR = os.environ.get('DATA_DIR', 'data')
+STATE_BACKEND = os.environ.get('STATE_BACKEND', 'files')  # files | sqlite
+STATE_DB = os.environ.get('STATE_DB') or os.path.join(DATA_DIR, 'state.db')
+INSTANCE_ID = os.environ.get('INSTANCE_ID') or f'{socket.gethostname()}:{os.getpid()}'
+LEADER_LEASE = float(os.environ.get('LEADER_LEASE', 15))  # секунд
+STATE_SYNC_INTERVAL = float(os.environ.get('STATE_SYNC_INTERVAL', 1))
+CHANGES_RETENTION = 86400  # секунд: скільки зберігати журнал змін для інших екземплярів
+DEFAULT_SENSOR = os.environ.get('DEFAULT_SENSOR', 'default')
+MAX_SENSORS = int(os.environ.get('MAX_SENSORS', 10000))
+HISTORY_LIMIT = int(os.environ.get('HISTORY_LIMIT', 0))  # відключень на сенсор; 0 = вся історія
+SNAPSHOT_INTERVAL = int(os.environ.get('SNAPSHOT_INTERVAL', 3600))
+JOURNAL_FLUSH_INTERVAL = float(os.environ.get('JOURNAL_FLUSH_INTERVAL', 0.05))
+NOTIFY_WORKERS = int(os.environ.get('NOTIFY_WORKERS', 32))  # одночасних запитів до Telegram
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get('NOTIFY_MAX_ATTEMPTS', 5))
+TG_GLOBAL_RATE = float(os.environ.get('TG_GLOBAL_RATE', 30))  # повідомлень/с на бота
+TG_CHAT_RATE = float(os.environ.get('TG_CHAT_RATE', 1))       # повідомлень/с в один чат
+MAX_BATCH_EVENTS = int(os.environ.get('MAX_BATCH_EVENTS', 100000))
+EVENT_CLOCK_SKEW = float(os.environ.get('EVENT_CLOCK_SKEW', 300))  # на скільки секунд годинник сенсора може поспішати
+BATCH_SUMMARY_LINES = 10
+CHART_WORKERS = int(os.environ.get('CHART_WORKERS', 1))
+CHART_CACHE_BYTES = int(os.environ.get('CHART_CACHE_BYTES', 8 * 1024 * 1024))
+CHART_REFRESH = 300  # секунд: як часто перемальовувати графік, на якому є «зараз»
+EXPORT_CHUNK = int(os.environ.get('EXPORT_CHUNK', 2000))  # відключень у шматку експорту
+RENDER_CACHE_SIZE = int(os.environ.get('RENDER_CACHE_SIZE', 16))  # на монітор
+FORECAST_ALPHA = float(os.environ.get('FORECAST_ALPHA', 0.3))  # вага останнього тижня
+FORECAST_REFIT_DELAY = float(os.environ.get('FORECAST_REFIT_DELAY', 5))
+SUBSCRIBERS_SAVE_DELAY = float(os.environ.get('SUBSCRIBERS_SAVE_DELAY', 1))
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')  # text | json
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 1))  # частка рядків про кожен запит
+FLAP_WINDOW = float(os.environ.get('FLAP_WINDOW', 30))  # секунд стабільного світла до підтвердження
+HEARTBEAT_TIMEOUT = float(os.environ.get('HEARTBEAT_TIMEOUT', 90))  # секунд тиші до «світло зникло»
+HEARTBEAT_TICK = float(os.environ.get('HEARTBEAT_TICK', 1))        # крок колеса таймерів, с
+
+# Точка відліку для секунд: наївний локальний час, без часових поясів,
+# тому доба завжди має 86400 секунд і межі днів рахуються арифметикою
+EPOCH = datetime(1970, 1, 1)
+
+def to_seconds(dt):
+    """datetime -> секунди від EPOCH (локальний час)"""
+    return int((dt - EPOCH).total_seconds())
+
+def from_seconds(seconds):
+    """Секунди від EPOCH -> datetime"""
+    return EPOCH + timedelta(seconds=seconds)
+
+# ========== ЛОГИ ==========
+
+class SampledLogger(logging.LoggerAdapter):
+    """Логер, що пропускає лише частку rate записів.
+
+    Рішення приймається в isEnabledFor — ще до створення LogRecord,
+    тож відкинутий запис майже нічого не коштує.
+    """
+    def __init__(self, logger, rate=1.0):
+        super().__init__(logger, {})
+        self.rate = rate
+
+    def isEnabledFor(self, level):
+        return self.logger.isEnabledFor(level) and (self.rate >= 1 or random.random() < self.rate)
+
+    def process(self, msg, kwargs):
+        return msg, kwargs
+
+log = logging.getLogger('powerbot')
+# Рядки про кожен запит (кнопки, вебхуки, статистика) — їх можна проріджувати
+request_log = SampledLogger(logging.getLogger('powerbot.requests'))
+
+LOG_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+class JsonFormatter(logging.Formatter):
+    """Один JSON-об'єкт на рядок; поля з extra= потрапляють у нього як є"""
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in LOG_RECORD_FIELDS)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class LogQueueHandler(QueueHandler):
+    """Кладе запис у чергу без форматування.
+
+    Стандартний QueueHandler форматує повідомлення ще в потоці, що пише
+    лог; тут рядок збирається лише у фоновому потоці, тож у event loop
+    лишається створення запису і put у чергу.
+    """
+    def prepare(self, record):
+        return record
+
+_log_listener = None
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, sample_rate=LOG_SAMPLE_RATE):
+    """Усі логи — через чергу; у stdout пише фоновий потік"""
+    global _log_listener
+    if _log_listener is not None:
+        return
+    # Ім'я файлу/рядок, потік і процес у форматі не використовуються —
+    # не збираємо їх для кожного запису (findCaller обходить стек)
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    handler = logging.StreamHandler(sys.stdout)
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s', '%Y-%m-%d %H:%M:%S'))
+    records = queue.SimpleQueue()
+    _log_listener = QueueListener(records, handler)
+    _log_listener.start()
+    root = logging.getLogger()
+    root.handlers = [LogQueueHandler(records)]
+    # Бібліотеки (httpx пише рядок на кожен запит) — лише попередження
+    root.setLevel(logging.WARNING)
+    log.setLevel(level)
+    request_log.rate = sample_rate
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Дописати чергу логів і зупинити потік"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+# ========== МЕТРИКИ ==========
+
+# Межі гістограм затримок, секунди
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class CounterValue:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+class HistogramValue:
+    """Лічильники по кошиках; observe — один bisect і два додавання"""
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class MetricFamily:
+    """Метрика з мітками; значення для набору міток створюється при першому зверненні.
+
+    На гарячому шляху значення беруть один раз через labels() і далі
+    викликають лише inc/observe.
+    """
+    def __init__(self, kind, name, help, labelnames=(), bounds=LATENCY_BUCKETS, collect=None):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.bounds = bounds
+        self.collect = collect  # для gauge: () -> [(значення міток, число)]
+        self.children = {}
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = HistogramValue(self.bounds) if self.kind == 'histogram' else CounterValue()
+        return child
+
+    def _labels(self, values, le=None):
+        pairs = list(zip(self.labelnames, values))
+        if le is not None:
+            pairs.append(('le', le))
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        if self.kind == 'gauge':
+            for values, value in self.collect():
+                lines.append(f'{self.name}{self._labels(values)} {value}')
+        elif self.kind == 'counter':
+            for values, child in list(self.children.items()):
+                lines.append(f'{self.name}{self._labels(values)} {child.value}')
+        else:
+            for values, child in list(self.children.items()):
+                total = 0
+                for bound, count in zip(self.bounds + (float('inf'),), child.counts):
+                    total += count
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append(f'{self.name}_bucket{self._labels(values, le)} {total}')
+                lines.append(f'{self.name}_sum{self._labels(values)} {child.sum}')
+                lines.append(f'{self.name}_count{self._labels(values)} {total}')
+        return '\n'.join(lines)
+
+class MetricsRegistry:
+    """Метрики у форматі Prometheus (text 0.0.4)"""
+    def __init__(self):
+        self.families = []
+
+    def _add(self, *args, **kwargs):
+        family = MetricFamily(*args, **kwargs)
+        self.families.append(family)
+        return family
+
+    def counter(self, name, help, labelnames=()):
+        return self._add('counter', name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), bounds=LATENCY_BUCKETS):
+        return self._add('histogram', name, help, labelnames, bounds=bounds)
+
+    def gauge(self, name, help, collect, labelnames=()):
+        """Gauge рахується лише при зчитуванні — на гарячому шляху нічого не коштує"""
+        return self._add('gauge', name, help, labelnames, collect=collect)
+
+    def render(self):
+        return '\n'.join(family.render() for family in self.families) + '\n'
+
+def timed(histogram):
+    """Декоратор: тривалість async-обробника в гістограму"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+metrics = MetricsRegistry()
+HTTP_SECONDS = metrics.histogram('powerbot_http_request_duration_seconds', 'Час обробки HTTP-запитів (вебхуки сенсорів тощо)', ('route',))
+HANDLER_SECONDS = metrics.histogram('powerbot_handler_duration_seconds', 'Час відповіді на кнопки та команди', ('handler',))
+SEND_SECONDS = metrics.histogram('powerbot_telegram_send_duration_seconds', 'Час запиту send_message до Telegram').labels()
+JOURNAL_ERRORS = metrics.counter('powerbot_journal_errors_total', 'Помилок запису журналу чи знімка на диск').labels()
+OUTAGES_TOTAL = metrics.counter('powerbot_outages_total', 'Нових відключень в історії з моменту запуску', ('source',))
+EVENTS_TOTAL = metrics.counter('powerbot_power_events_total', 'Подій від сенсорів', ('source', 'result'))
+TELEGRAM_ERRORS = metrics.counter('powerbot_telegram_errors_total', 'Помилок відправки в Telegram', ('error',))
+metrics.gauge('powerbot_sensors', 'Зареєстрованих сенсорів', lambda: [((), len(registry))])
+metrics.gauge('powerbot_subscribers', 'Чатів з підпискою', lambda: [((), len(subscribers))])
+metrics.gauge('powerbot_current_outage_seconds', 'Тривалість поточного відключення (0 — світло є)',
+              lambda: [((sensor.sensor_id,), int(sensor.get_current_duration().total_seconds()))
+                       for sensor in list(registry.monitors.values())], ('sensor',))
+metrics.gauge('powerbot_history_outages', 'Відключень в історії',
+              lambda: [((sensor.sensor_id,), len(sensor.index)) for sensor in list(registry.monitors.values())], ('sensor',))
+metrics.gauge('powerbot_journal_writer_up', 'Потік запису на диск живий і без помилок останню хвилину',
+              lambda: [((), int(_journal_writer is None or _journal_writer.healthy()))])
+metrics.gauge('powerbot_journal_queue_depth', 'Операцій у черзі потоку запису',
+              lambda: [((), _journal_writer.queue.qsize() if _journal_writer else 0)])
+
+class Outage:
+    """Одне відключення — легкий запис поверх секунд.
+
+    Підтримує і атрибути, і старий доступ як до dict: o['start'],
+    o['end'], o['duration'].
+    """
+    __slots__ = ('start_ts', 'end_ts')
+
+    def __init__(self, start_ts, end_ts):
+        self.start_ts = start_ts
+        self.end_ts = end_ts
+
+    @property
+    def start(self):
+        return from_seconds(self.start_ts)
+
+    @property
+    def end(self):
+        return from_seconds(self.end_ts)
+
+    @property
+    def duration(self):
+        return timedelta(seconds=self.end_ts - self.start_ts)
+
+    def __getitem__(self, key):
+        if key not in OUTAGE_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in OUTAGE_FIELDS
+
+    def __eq__(self, other):
+        return isinstance(other, Outage) and (self.start_ts, self.end_ts) == (other.start_ts, other.end_ts)
+
+    def __repr__(self):
+        return f"Outage({self.start:%Y-%m-%d %H:%M:%S} - {self.end:%H:%M:%S})"
+
+OUTAGE_FIELDS = ('start', 'end', 'duration')
+
+class FrozenIndex:
+    """Незмінна копія колонок OutageIndex для читання з іншого потоку.
+
+    Має ті самі span() і columns(), що потрібні hourly_activity.
+    """
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, starts, ends):
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self):
+        return len(self.starts)
+
+    def span(self, lo, hi):
+        i = int(np.searchsorted(self.ends, lo, side='right'))
+        j = int(np.searchsorted(self.starts, hi, side='left'))
+        return i, max(i, j)
+
+    def columns(self, i=0, j=None):
+        return self.starts[i:j], self.ends[i:j]
+
+class OutageIndex:
+    """Колонкове сховище і часовий індекс відключень.
+
+    Початки і кінці зберігаються як int64 секунди в array, префіксні суми
+    тривалостей — поруч; дерева відрізків для найдовшого/найкоротшого —
+    int32 індекси. Разом це кілька десятків байт на відключення.
+
+    Відключення не перетинаються, тому, відсортовані за початком, вони
+    відсортовані і за кінцем. Це дає бінарний пошук по обох масивах і
+    будь-який діапазон за O(log n). Агрегати по масивах рахує NumPy.
+    """
+    def __init__(self):
+        self.starts = array('q')   # секунди, за зростанням
+        self.ends = array('q')
+        self.prefix = array('q', [0])  # prefix[i] = сумарна тривалість перших i відключень
+        self._capacity = 1
+        self._max_tree = array('i', [-1, -1])  # індекси, листя з позиції _capacity
+        self._min_tree = array('i', [-1, -1])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        return Outage(self.starts[i], self.ends[i])
+
+    def duration(self, i):
+        return self.ends[i] - self.starts[i]
+
+    def columns(self, i=0, j=None):
+        """Копії колонок [i, j) як масиви NumPy (starts, ends)"""
+        # frombuffer тримає буфер array, поки жива проекція, тому копіюємо —
+        # інакше наступний append впав би з BufferError
+        starts = np.frombuffer(self.starts, dtype=np.int64)[i:j].copy()
+        ends = np.frombuffer(self.ends, dtype=np.int64)[i:j].copy()
+        return starts, ends
+
+    def frozen(self):
+        """Копія колонок для читання з іншого потоку (знімається в event loop)"""
+        # np.array копіює через буферний протокол і одразу відпускає буфер
+        return FrozenIndex(np.array(self.starts, dtype=np.int64), np.array(self.ends, dtype=np.int64))
+
+    def load(self, starts, ends):
+        """Масове завантаження колонок (NumPy) з повною перебудовою індексу"""
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        if len(starts) > 1 and np.any((starts[1:] < starts[:-1]) | ((starts[1:] == starts[:-1]) & (ends[1:] < ends[:-1]))):
+            # За початком, а при рівних — за кінцем: нульове відключення перед тим, що почалось тієї ж секунди
+            order = np.lexsort((ends, starts))
+            starts, ends = starts[order], ends[order]
+        self.starts = array('q', starts.tobytes())
+        self.ends = array('q', ends.tobytes())
+        self._rebuild()
+
+    def trim(self, limit):
+        """Залишити лише останні limit відключень.
+
+        Обрізаємо із запасом у 1/8, щоб перебудова індексу траплялась
+        раз на багато додавань, а не на кожне.
+        """
+        if len(self.starts) <= limit + max(limit // 8, 1):
+            return False
+        drop = len(self.starts) - limit
+        self.starts = self.starts[drop:]
+        self.ends = self.ends[drop:]
+        self._rebuild()
+        return True
+
+    def _better(self, a, b, longest):
+        """Вибір між двома індексами (-1 = порожньо)"""
+        if a < 0:
+            return b
+        if b < 0:
+            return a
+        da, db = self.duration(a), self.duration(b)
+        if longest:
+            return a if da >= db else b
+        return a if da <= db else b
+
+    def _build_tree(self, durations, longest):
+        """Дерево відрізків знизу вгору, рівень за рівнем векторно"""
+        cap = self._capacity
+        tree = np.full(2 * cap, -1, dtype=np.int32)
+        tree[cap:cap + len(durations)] = np.arange(len(durations), dtype=np.int32)
+        # Порожнє листя завжди програє порівняння
+        values = np.full(cap, -1 if longest else np.iinfo(np.int64).max, dtype=np.int64)
+        values[:len(durations)] = durations
+        level = cap
+        while level > 1:
+            left_v, right_v = values[0::2], values[1::2]
+            pick_left = left_v >= right_v if longest else left_v <= right_v
+            tree[level // 2:level] = np.where(pick_left, tree[level:2 * level:2], tree[level + 1:2 * level:2])
+            values = np.where(pick_left, left_v, right_v)
+            level //= 2
+        return array('i', tree.tobytes())
+
+    def _rebuild(self):
+        """Повна перебудова префіксів і дерев (при вставці не в кінець)"""
+        starts, ends = self.columns()
+        durations = ends - starts
+        n = len(durations)
+        prefix = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(durations, out=prefix[1:])
+        self.prefix = array('q', prefix.tobytes())
+        self._capacity = 1
+        while self._capacity < n:
+            self._capacity *= 2
+        self._max_tree = self._build_tree(durations, True)
+        self._min_tree = self._build_tree(durations, False)
+
+    def _update_leaf(self, i):
+        for tree, longest in ((self._max_tree, True), (self._min_tree, False)):
+            node = self._capacity + i
+            tree[node] = i
+            node //= 2
+            while node:
+                best = self._better(tree[2 * node], tree[2 * node + 1], longest)
+                if tree[node] == best:
+                    break  # вище нічого не зміниться
+                tree[node] = best
+                node //= 2
+
+    def add(self, start, end):
+        """Додати відключення [start, end) у секундах, повертає його позицію"""
+        if not self.starts or (start, end) >= (self.starts[-1], self.ends[-1]):
+            # Звичайний випадок — нове відключення в кінці, O(log n)
+            self.starts.append(start)
+            self.ends.append(end)
+            self.prefix.append(self.prefix[-1] + end - start)
+            i = len(self.starts) - 1
+            if i >= self._capacity:
+                self._rebuild()
+            else:
+                self._update_leaf(i)
+            return i
+        i = bisect_right(self.starts, start)
+        while i and self.starts[i - 1] == start and self.ends[i - 1] > end:
+            i -= 1
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self._rebuild()
+        return i
+
+    def _query(self, tree, lo, hi, longest):
+        """Індекс найкращого відключення серед позицій [lo, hi)"""
+        best = -1
+        lo += self._capacity
+        hi += self._capacity
+        while lo < hi:
+            if lo & 1:
+                best = self._better(best, tree[lo], longest)
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                best = self._better(best, tree[hi], longest)
+            lo //= 2
+            hi //= 2
+        return best
+
+    def span(self, lo, hi):
+        """Позиції [i, j) відключень, що перетинають [lo, hi)"""
+        i = bisect_right(self.ends, lo)
+        j = bisect_left(self.starts, hi)
+        return i, max(i, j)
+
+    def clipped(self, i, lo, hi):
+        """Відключення i, обрізане до меж [lo, hi)"""
+        return max(self.starts[i], lo), min(self.ends[i], hi)
+
+    def clipped_columns(self, lo, hi):
+        """Колонки відключень у [lo, hi), обрізані до меж діапазону"""
+        starts, ends = self.columns(*self.span(lo, hi))
+        return np.maximum(starts, lo), np.minimum(ends, hi)
+
+    def range_stats(self, lo, hi):
+        """Кількість, загальна тривалість, найдовше і найкоротше в [lo, hi).
+
+        Відключення на межі діапазону (наприклад, через північ) рахуються
+        лише тією частиною, що потрапила в діапазон.
+        """
+        i, j = self.span(lo, hi)
+        if i == j:
+            return None
+        # Внутрішні відключення повністю всередині діапазону
+        inner_i = i + 1 if self.starts[i] < lo else i
+        inner_j = j - 1 if self.ends[j - 1] > hi else j
+        inner_j = max(inner_i, inner_j)
+
+        total = 0
+        candidates = []
+        if inner_i < inner_j:
+            total += self.prefix[inner_j] - self.prefix[inner_i]
+            candidates.append(self.clipped(self._query(self._max_tree, inner_i, inner_j, True), lo, hi))
+            candidates.append(self.clipped(self._query(self._min_tree, inner_i, inner_j, False), lo, hi))
+        for edge in {i, j - 1}:
+            if edge < inner_i or edge >= inner_j:
+                piece = self.clipped(edge, lo, hi)
+                total += piece[1] - piece[0]
+                candidates.append(piece)
+
+        return {
+            'count': j - i,
+            'total': total,
+            'longest': max(candidates, key=lambda p: p[1] - p[0]),
+            'shortest': min(candidates, key=lambda p: p[1] - p[0]),
+            'last': self.clipped(j - 1, lo, hi),
+        }
+
+class OutageHistory(Sequence):
+    """Уся історія як послідовність Outage, без окремого списку об'єктів"""
+    def __init__(self, index):
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.index[k] for k in range(*i.indices(len(self.index)))]
+        if i < 0:
+            i += len(self.index)
+        if not 0 <= i < len(self.index):
+            raise IndexError(i)
+        return self.index[i]
+
+# ========== АНАЛІТИКА ==========
+
+PERIODS = ('day', 'week', 'month')
+
+def period_range(kind, seconds):
+    """Межі [lo, hi) доби, тижня (з понеділка) чи місяця, що містить seconds"""
+    day = seconds // 86400
+    if kind == 'day':
+        return day * 86400, (day + 1) * 86400
+    if kind == 'week':
+        monday = day - (day + 3) % 7  # 1970-01-01 — четвер
+        return monday * 86400, (monday + 7) * 86400
+    dt = from_seconds(seconds)
+    first = datetime(dt.year, dt.month, 1)
+    following = datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1)
+    return to_seconds(first), to_seconds(following)
+
+def hourly_activity(index, lo, hi):
+    """Почасово в [lo, hi) (межі кратні годині): кількість початків відключень
+    і секунди без світла.
+
+    Сумарний простій до моменту t рахується через префіксні суми:
+    D(t) = prefix[k] + обрізана частина k-го, де k — останнє відключення,
+    що почалось до t. Різниця D на межах годин дає простій кожної години.
+    """
+    hours = (hi - lo) // 3600
+    starts, ends = index.columns(*index.span(lo, hi))
+    if not len(starts):
+        return np.zeros(hours, dtype=np.int64), np.zeros(hours, dtype=np.int64)
+    counted = starts[starts >= lo]
+    start_counts = np.bincount((counted - lo) // 3600, minlength=hours)[:hours]
+
+    starts, ends = np.maximum(starts, lo), np.minimum(ends, hi)
+    durations = ends - starts
+    prefix = np.concatenate([[0], np.cumsum(durations)])
+    bounds = np.arange(lo, hi + 1, 3600, dtype=np.int64)
+    k = np.searchsorted(starts, bounds, side='right') - 1
+    safe = np.maximum(k, 0)
+    downtime = np.where(k >= 0, prefix[safe] + np.clip(bounds - starts[safe], 0, durations[safe]), 0)
+    return start_counts, np.diff(downtime)
+
+def hour_slots(lo, hours):
+    """Слот години тижня (0 = понеділок 0:00) для hours годин від lo"""
+    absolute = lo // 3600 + np.arange(hours, dtype=np.int64)
+    return (absolute // 24 + 3) % 7 * 24 + absolute % 24  # 1970-01-01 — четвер
+
+class Rollup:
+    """Агрегати відключень за один період, що оновлюються по одному"""
+    __slots__ = ('count', 'total', 'hours', 'gap_sum', 'gap_count', 'last_end', 'first', 'last')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.hours = [0] * 24    # відключень за годиною початку
+        self.gap_sum = 0         # проміжки між сусідніми відключеннями
+        self.gap_count = 0
+        self.last_end = None
+        self.first = []          # тривалості перших трьох
+        self.last = deque(maxlen=3)
+
+    def add(self, start, end):
+        """Додати відключення, що почалось не раніше за попередні"""
+        duration = end - start
+        self.count += 1
+        self.total += duration
+        self.hours[start % 86400 // 3600] += 1
+        if self.last_end is not None and start > self.last_end:
+            self.gap_sum += start - self.last_end
+            self.gap_count += 1
+        self.last_end = end
+        if len(self.first) < 3:
+            self.first.append(duration)
+        self.last.append(duration)
+
+    @classmethod
+    def from_columns(cls, starts, ends):
+        """Побудувати з масивів NumPy за один векторний прохід"""
+        rollup = cls()
+        if not len(starts):
+            return rollup
+        durations = ends - starts
+        gaps = starts[1:] - ends[:-1]
+        gaps = gaps[gaps > 0]
+        rollup.count = len(starts)
+        rollup.total = int(durations.sum())
+        rollup.hours = np.bincount(starts % 86400 // 3600, minlength=24).tolist()
+        rollup.gap_sum = int(gaps.sum())
+        rollup.gap_count = len(gaps)
+        rollup.last_end = int(ends[-1])
+        rollup.first = durations[:3].tolist()
+        rollup.last.extend(durations[-3:].tolist())
+        return rollup
+
+    def copy(self):
+        other = Rollup()
+        other.count, other.total, other.hours = self.count, self.total, list(self.hours)
+        other.gap_sum, other.gap_count, other.last_end = self.gap_sum, self.gap_count, self.last_end
+        other.first, other.last = list(self.first), deque(self.last, maxlen=3)
+        return other
+
+class OutageAnalytics:
+    """Інкрементальна аналітика: ролапи по добах, тижнях і місяцях.
+
+    Ролап періоду рахується з індексу при першому запиті (векторно), а
+    далі оновлюється кожним новим відключенням — читання стає O(1).
+    Вставка в минуле скидає лише зачеплені періоди.
+    """
+    def __init__(self, index):
+        self.index = index
+        self.rollups = {}  # (вид, початок періоду) -> Rollup
+        self.generation = 0  # росте при кожній зміні історії
+        self.rewrites = 0    # росте, коли змінюється вже відома історія
+        self._long_term = None
+
+    def _pieces(self, kind, start, end):
+        """Відключення, розрізане по межах періодів виду kind"""
+        while True:
+            lo, hi = period_range(kind, start)
+            yield lo, max(start, lo), min(end, hi)
+            if end <= hi:
+                return
+            start = hi
+
+    def add(self, start, end):
+        """Нове відключення в кінці історії"""
+        self.generation += 1
+        for kind in PERIODS:
+            for lo, piece_start, piece_end in self._pieces(kind, start, end):
+                rollup = self.rollups.get((kind, lo))
+                if rollup is not None:
+                    rollup.add(piece_start, piece_end)
+
+    def invalidate(self, start, end):
+        """Відключення вставлено в минуле — перерахувати зачеплені періоди"""
+        self.generation += 1
+        self.rewrites += 1
+        for kind in PERIODS:
+            for lo, _, _ in self._pieces(kind, start, end):
+                self.rollups.pop((kind, lo), None)
+
+    def clear(self):
+        self.generation += 1
+        self.rewrites += 1
+        self.rollups.clear()
+
+    def rollup(self, kind, lo):
+        """Ролап періоду, що починається в lo"""
+        key = (kind, lo)
+        rollup = self.rollups.get(key)
+        if rollup is None:
+            _, hi = period_range(kind, lo)
+            rollup = self.rollups[key] = Rollup.from_columns(*self.index.clipped_columns(lo, hi))
+        return rollup
+
+    def long_term(self, now):
+        """Теплова карта і перцентилі за всю історію; кеш до наступної зміни історії"""
+        if self._long_term is None or self._long_term[0] != self.generation:
+            self._long_term = (self.generation, self._compute_long_term(now))
+        return self._long_term[1]
+
+    def _compute_long_term(self, now):
+        """Усе векторно по колонках індексу.
+
+        heatmap[день тижня, година] — частка спостережуваного часу цього
+        слота, коли світла не було.
+        """
+        starts, ends = self.index.columns()
+        result = {'count': len(starts), 'heatmap': np.zeros((7, 24)), 'percentiles': {}}
+        if not len(starts):
+            return result
+        durations = ends - starts
+
+        lo = int(starts[0]) // 3600 * 3600
+        hi = (max(now, int(ends[-1])) // 3600 + 1) * 3600
+        _, per_hour = hourly_activity(self.index, lo, hi)
+        slots = hour_slots(lo, len(per_hour))
+        down = np.bincount(slots, weights=per_hour, minlength=168)
+        exposure = np.bincount(slots, minlength=168) * 3600
+        result['heatmap'] = np.divide(down, exposure, out=np.zeros(168), where=exposure > 0).reshape(7, 24)
+
+        weekdays = (starts // 86400 + 3) % 7
+        for weekday in range(7):
+            day_durations = durations[weekdays == weekday]
+            if len(day_durations):
+                result['percentiles'][weekday] = (len(day_durations), np.percentile(day_durations, [50, 90, 99]))
+        return result
+
+    def summary(self, kind, now, current_start=None):
+        """Ролап поточного періоду разом із відключенням, що ще триває"""
+        lo, hi = period_range(kind, now)
+        rollup = self.rollup(kind, lo)
+        if current_start is not None:
+            rollup = rollup.copy()
+            rollup.add(max(current_start, lo), now)
+        return lo, rollup
+
+WEEK = 7 * 86400
+
+class ForecastEngine:
+    """Модель ризику відключення за годиною тижня.
+
+    Для кожного з 168 слотів зберігаються експоненційно згладжені по тижнях
+    кількість початків відключень і години зі світлом; їх відношення —
+    інтенсивність λ (відключень на годину зі світлом). Завершені тижні
+    згортаються один раз, тому повторне навчання після power_restored
+    обробляє лише поточний тиждень. Результат — накопичений ризик на тиждень
+    уперед від години навчання, тож прогноз у хендлері — це лише пошук.
+
+    fit() можна викликати в потоці з копією індексу (OutageIndex.frozen()):
+    готова модель публікується одним присвоєнням self.model.
+    """
+    def __init__(self, index, analytics, alpha=FORECAST_ALPHA):
+        self.index = index
+        self.analytics = analytics
+        self.alpha = alpha
+        self.counts = np.zeros(168)    # згладжені початки відключень по слотах
+        self.exposure = np.zeros(168)  # згладжені години зі світлом
+        self.folded_until = None       # початок першого ще не згорнутого тижня
+        self.rewrites = None
+        self.weeks = 0
+        # (година навчання, накопичений ризик на 169 межах годин від неї, тижнів) або None
+        self.model = None
+        self.fit_ms = 0.0
+        self.refit_scheduled = False
+        self.fitting = None            # навчання, що йде в потоці (asyncio.Future)
+
+    def _observed(self, index, lo, hi):
+        """Почасові (початки, години зі світлом) у [lo, hi); до першого
+        відключення даних немає, тож ці години не враховуються"""
+        starts, downtime = hourly_activity(index, lo, hi)
+        on_hours = (3600 - downtime) / 3600
+        unobserved = (lo + np.arange(len(on_hours)) * 3600) < index.starts[0] // 3600 * 3600
+        on_hours[unobserved] = 0
+        return starts, on_hours
+
+    def _fold(self, index, lo, hi):
+        """Згорнути повні тижні [lo, hi) у згладжені лічильники"""
+        weeks = (hi - lo) // WEEK
+        starts, on_hours = self._observed(index, lo, hi)
+        starts, on_hours = starts.reshape(weeks, 168), on_hours.reshape(weeks, 168)
+        for week in range(weeks):
+            if not self.weeks:
+                self.counts, self.exposure = starts[week].astype(float), on_hours[week].copy()
+            else:
+                self.counts = (1 - self.alpha) * self.counts + self.alpha * starts[week]
+                self.exposure = (1 - self.alpha) * self.exposure + self.alpha * on_hours[week]
+            self.weeks += 1
+
+    def fit(self, now, index=None, rewrites=None):
+        """Навчити модель на історії до now (секунди) і оновити кеш прогнозу.
+
+        index і rewrites — копія індексу і лічильник переписувань на момент
+        копії, якщо навчання йде не в event loop.
+        """
+        started = time.perf_counter()
+        if index is None:
+            index, rewrites = self.index, self.analytics.rewrites
+        if not len(index):
+            self.model = None
+            return
+        if self.folded_until is None or self.rewrites != rewrites:
+            # Історію змінено заднім числом — згортаємо все заново
+            self.counts, self.exposure, self.weeks = np.zeros(168), np.zeros(168), 0
+            self.folded_until = period_range('week', index.starts[0])[0]
+            self.rewrites = rewrites
+        week_start = period_range('week', now)[0]
+        if week_start > self.folded_until:
+            self._fold(index, self.folded_until, week_start)
+            self.folded_until = week_start
+
+        # Поточний тиждень додаємо як часткове спостереження: у слотах, що
+        # ще не настали, лічильники масштабуються однаково і λ не змінюється
+        counts, exposure = self.counts, self.exposure
+        hour = now // 3600 * 3600
+        if hour > week_start:
+            partial_starts, partial_on = self._observed(index, week_start, hour)
+            elapsed = len(partial_starts)
+            blend = (1 - self.alpha) if self.weeks else 0.0
+            counts, exposure = blend * counts, blend * exposure
+            counts[:elapsed] += (1 - blend) * partial_starts
+            exposure[:elapsed] += (1 - blend) * partial_on
+            counts[elapsed:] = self.counts[elapsed:]
+            exposure[elapsed:] = self.exposure[elapsed:]
+
+        # Апріорно — загальна інтенсивність з вагою в одну годину
+        overall = counts.sum() / exposure.sum() if exposure.sum() else 0.0
+        rates = (counts + overall) / (exposure + 1)
+        self.model = (hour, np.concatenate([[0.0], np.cumsum(rates[hour_slots(hour, 168)])]), self.weeks)
+        self.fit_ms = (time.perf_counter() - started) * 1000
+
+    def predict(self, now):
+        """Прогноз з кешу: медіанний час наступного відключення і ймовірності.
+
+        None — модель не навчена, застаріла чи відключень не було.
+        """
+        model = self.model
+        if model is None or not model[1][-1]:
+            return None
+        anchor, cumulative, weeks = model
+        offset = (now - anchor) / 3600
+        if not 0 <= offset <= 144:
+            return None
+        grid = np.arange(len(cumulative))
+        base = np.interp(offset, grid, cumulative)
+        risk = lambda hours: 1 - np.exp(-(np.interp(offset + hours, grid, cumulative) - base))
+        target = base + np.log(2)
+        median = None
+        if target <= cumulative[-1]:
+            median = int(anchor + np.interp(target, cumulative, grid) * 3600)
+        return {'next': median, 'p1': risk(1), 'p3': risk(3), 'p24': risk(24), 'weeks': weeks}
+
+# ========== ЗБЕРЕЖЕННЯ ==========
+
+WAL_MAGIC = b'PWRWAL01'
+SNAPSHOT_MAGIC = b'PWRSNAP2'
+SNAPSHOT_MAGIC_V1 = b'PWRSNAP1'             # без covered: читається, але більше не пишеться
+WAL_HEADER = struct.Struct('<8sq')          # магія, покоління
+WAL_RECORD = struct.Struct('<B7xqq')        # тип, a, b — 24 байти
+SNAPSHOT_HEADER = struct.Struct('<8sqqqq')  # магія, покоління, кількість, поточне відключення (-1 = немає), covered
+SNAPSHOT_HEADER_V1 = struct.Struct('<8sqqq')
+WAL_DTYPE = np.dtype([('kind', 'u1'), ('pad', 'V7'), ('a', '<i8'), ('b', '<i8')])
+
+KIND_LOST = 1      # a = початок відключення
+KIND_RESTORED = 2  # a, b = початок і кінець завершеного відключення
+KIND_OUTAGE = 3    # a, b = відключення з минулого, поточне не змінюється
+
+class JournalWriter(threading.Thread):
+    """Фоновий потік запису на диск.
+
+    Вебхуки лише кладуть байти в чергу. Потік збирає записи, що
+    накопичились за flush_interval, і робить один fsync на пакет.
+    Помилка одного запису (диск повний, EIO) логується і рахується в
+    errors, а потік працює далі — стан видно в /health і метриках.
+    """
+    def __init__(self, flush_interval=JOURNAL_FLUSH_INTERVAL):
+        super().__init__(name='journal-writer', daemon=True)
+        self.queue = queue.SimpleQueue()
+        self.flush_interval = flush_interval
+        self.on_batch = []  # викликаються після кожного пакета (коміт SQLite)
+        self.errors = 0
+        self.last_error_at = None  # time.monotonic() останньої помилки
+
+    def submit(self, journal, op, payload=None):
+        self.queue.put((journal, op, payload))
+
+    def call(self, func):
+        """Виконати func у потоці запису; concurrent.futures.Future з результатом"""
+        future = Future()
+        if not self.is_alive():
+            future.set_exception(RuntimeError("Потік запису не працює"))
+        else:
+            self.submit(None, 'future', (func, future))
+        return future
+
+    def healthy(self, window=60):
+        """Потік живий і не мав помилок останні window секунд"""
+        recent = self.last_error_at is not None and time.monotonic() - self.last_error_at < window
+        return self.is_alive() and not recent
+
+    def stop(self, timeout=10):
+        """Дописати все з черги і зупинитись"""
+        if self.is_alive():
+            self.submit(None, 'stop')
+            self.join(timeout)
+
+    def run(self):
+        try:
+            while True:
+                batch = [self.queue.get()]
+                deadline = time.monotonic() + self.flush_interval
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self.queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                if not self._process(batch):
+                    return
+        finally:
+            # Те, що прийшло вже після зупинки, не виконається — не лишаємо вічних очікувань
+            while True:
+                try:
+                    _, op, payload = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if op == 'future':
+                    payload[1].set_exception(RuntimeError("Потік запису зупинено"))
+
+    def _guard(self, what, func, *args):
+        try:
+            func(*args)
+        except Exception as e:
+            self.errors += 1
+            self.last_error_at = time.monotonic()
+            JOURNAL_ERRORS.inc()
+            log.exception("❌ Помилка запису (%s): %s", what, e)
+
+    def _flush(self, pending):
+        for journal, data in pending.items():
+            self._guard('журнал', journal.write_records, data)
+        pending.clear()
+
+    def _process(self, batch):
+        pending = {}
+        running = True
+        for journal, op, payload in batch:
+            if op == 'append':
+                pending.setdefault(journal, bytearray()).extend(payload)
+            elif op == 'snapshot':
+                # Спершу записи, що вже є в знімку, потім сам знімок
+                if journal in pending:
+                    self._guard('журнал', journal.write_records, pending.pop(journal))
+                self._guard('знімок', journal.write_snapshot, *payload)
+            elif op == 'call':
+                self._flush(pending)
+                self._guard('виклик', payload)
+            elif op == 'future':
+                # Виклик бачить усі записи, поставлені в чергу до нього
+                self._flush(pending)
+                func, future = payload
+                try:
+                    future.set_result(func())
+                except Exception as e:
+                    future.set_exception(e)
+            elif op == 'stop':
+                running = False
+        self._flush(pending)
+        for callback in self.on_batch:
+            self._guard('пакет', callback)
+        return running
+
+_journal_writer = None
+
+def get_journal_writer_state():
+    """Поточний потік запису (None — ще не запускався), без перезапуску"""
+    return _journal_writer
+
+def get_journal_writer():
+    """Спільний потік запису для всіх журналів"""
+    global _journal_writer
+    if _journal_writer is None or not _journal_writer.is_alive():
+        previous = _journal_writer
+        _journal_writer = JournalWriter()
+        if previous is not None:
+            # Коміти SQLite та інші підписки переходять до нового потоку
+            _journal_writer.on_batch = previous.on_batch
+        _journal_writer.start()
+    return _journal_writer
+
+class OutageJournal:
+    """Журнал подій (WAL) + періодичний знімок стану.
+
+    Файли в директорії path:
+      snapshot.bin — заголовок і колонки starts/ends знімку;
+      journal.wal  — записи фіксованого розміру після знімку.
+    Обидва мають номер покоління. Знімок покоління N пишеться першим і
+    пам'ятає, скільки байтів журналу покоління N-1 (covered) він уже
+    містить; потім журнал атомарно замінюється порожнім покоління N.
+    Якщо між цими кроками процес упав (чи заміна не вдалась і дозапис
+    тривав у старий журнал), при запуску береться хвіст журналу N-1
+    після covered. Журнал ще старішого покоління ігнорується.
+    """
+    def __init__(self, path, writer=None):
+        self.path = path
+        self.wal_path = os.path.join(path, 'journal.wal')
+        self.snapshot_path = os.path.join(path, 'snapshot.bin')
+        self._writer = writer  # None — спільний потік, навіть якщо його перезапустили
+        self.generation = 0
+        self.covered = None    # байтів журналу покоління generation - 1 у знімку
+
+    @property
+    def writer(self):
+        return self._writer if self._writer is not None else get_journal_writer()
+
+    # --- Запис (викликається з event loop, не блокує) ---
+
+    def record_lost(self, start):
+        self.writer.submit(self, 'append', WAL_RECORD.pack(KIND_LOST, start, 0))
+
+    def record_restored(self, start, end):
+        self.writer.submit(self, 'append', WAL_RECORD.pack(KIND_RESTORED, start, end))
+
+    def record_outages(self, starts, ends):
+        data = b''.join(WAL_RECORD.pack(KIND_OUTAGE, start, end) for start, end in zip(starts, ends))
+        self.writer.submit(self, 'append', data)
+
+    def snapshot(self, monitor):
+        """Поставити в чергу знімок поточного стану монітора"""
+        pending = to_seconds(monitor.last_outage_start) if monitor.last_outage_start else -1
+        payload = (monitor.index.starts.tobytes(), monitor.index.ends.tobytes(), pending)
+        self.writer.submit(self, 'snapshot', payload)
+
+    def save_meta(self, name, value):
+        """Записати службовий текстовий файл поруч із журналом"""
+        self.writer.submit(self, 'call', lambda: self._atomic_write(os.path.join(self.path, name), value.encode()))
+
+    def close(self):
+        self.writer.stop()
+
+    # --- Робота з файлами (потік запису) ---
+
+    def write_records(self, data):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.wal_path, 'ab') as f:
+            size = f.tell()
+            try:
+                if not size:
+                    # Новий сенсор — журнал ще не створено
+                    f.write(WAL_HEADER.pack(WAL_MAGIC, self.generation))
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            except OSError:
+                # Недописаний пакет посеред журналу зсунув би всі наступні записи
+                f.truncate(size)
+                raise
+
+    def write_snapshot(self, starts, ends, pending):
+        generation = self.generation + 1
+        # Усе, що вже є в журналі поточного покоління, увійшло в знімок
+        covered = os.path.getsize(self.wal_path) if os.path.exists(self.wal_path) else 0
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, generation, len(starts) // 8, pending, covered)
+        self._atomic_write(self.snapshot_path, header, starts, ends)
+        # Журнал нового покоління починається порожнім; якщо тут упадемо,
+        # дозапис піде в старий журнал, а replay візьме його хвіст після covered
+        self._atomic_write(self.wal_path, WAL_HEADER.pack(WAL_MAGIC, generation))
+        self.generation = generation
+        log.info("💾 Знімок збережено: %d відключень", len(starts) // 8)
+
+    def _atomic_write(self, path, *chunks):
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    # --- Відновлення при запуску ---
+
+    def _load_snapshot(self):
+        """Знімок як (starts, ends, pending); порожній, якщо файлу немає"""
+        empty = np.empty(0, dtype=np.int64)
+        if not os.path.exists(self.snapshot_path):
+            return empty, empty, -1
+        with open(self.snapshot_path, 'rb') as f:
+            magic = f.read(len(SNAPSHOT_MAGIC))
+            if magic == SNAPSHOT_MAGIC:
+                _, generation, count, pending, covered = SNAPSHOT_HEADER.unpack(magic + f.read(SNAPSHOT_HEADER.size - len(magic)))
+            elif magic == SNAPSHOT_MAGIC_V1:
+                _, generation, count, pending = SNAPSHOT_HEADER_V1.unpack(magic + f.read(SNAPSHOT_HEADER_V1.size - len(magic)))
+                covered = None
+            else:
+                raise ValueError(f"Пошкоджений знімок: {self.snapshot_path}")
+            starts = np.fromfile(f, dtype='<i8', count=count)
+            ends = np.fromfile(f, dtype='<i8', count=count)
+        self.generation = generation
+        self.covered = covered
+        return starts, ends, pending
+
+    def _load_wal(self):
+        """Записи журналу, яких ще немає в знімку (масив WAL_DTYPE), і звідки вони.
+
+        'current' — журнал поточного покоління; 'previous' — хвіст журналу
+        попереднього покоління після covered (заміна журналу після знімка
+        не відбулась); None — журналу немає або в ньому нічого нового.
+        """
+        records = np.empty(0, dtype=WAL_DTYPE)
+        size = os.path.getsize(self.wal_path) if os.path.exists(self.wal_path) else 0
+        if size < WAL_HEADER.size:
+            return records, None
+        source = None
+        with open(self.wal_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, generation = WAL_HEADER.unpack_from(mm)
+                if magic != WAL_MAGIC:
+                    return records, None
+                if generation == self.generation:
+                    source, offset = 'current', WAL_HEADER.size
+                elif self.covered is not None and generation == self.generation - 1:
+                    source, offset = 'previous', max(self.covered, WAL_HEADER.size)
+                if source:
+                    count = max(size - offset, 0) // WAL_RECORD.size
+                    view = np.frombuffer(mm, dtype=WAL_DTYPE, count=count, offset=offset)
+                    records = view.copy()
+                    del view  # відпустити буфер до закриття mmap
+        return records, source
+
+    def replay(self, monitor):
+        """Відновити стан монітора: знімок + хвіст журналу, потім полагодити журнал.
+
+        Повертає кількість подій журналу після знімка.
+        """
+        started = time.perf_counter()
+        count, plan = self.load(monitor)
+        self.repair(plan)
+        log.info("💾 Відновлено %d відключень (%d подій журналу) за %.0f мс",
+                 len(monitor.index), count, (time.perf_counter() - started) * 1000)
+        return count
+
+    def load(self, monitor):
+        """Стан монітора зі знімка і хвоста журналу; файли не змінюються.
+
+        Повертає (кількість подій журналу, що зробити з журналом у repair()).
+        """
+        starts, ends, pending = self._load_snapshot()
+        records, source = self._load_wal()
+        kinds = records['kind']
+
+        # Кожен RESTORED/OUTAGE — готове відключення; поточне — останній LOST без RESTORED після нього
+        restored = records[(kinds == KIND_RESTORED) | (kinds == KIND_OUTAGE)]
+        lost_at = np.flatnonzero(kinds == KIND_LOST)
+        restored_at = np.flatnonzero(kinds == KIND_RESTORED)
+        if len(lost_at) and (not len(restored_at) or lost_at[-1] > restored_at[-1]):
+            pending = int(records['a'][lost_at[-1]])
+        elif len(restored_at):
+            pending = -1
+
+        starts = np.concatenate([starts, restored['a']])
+        ends = np.concatenate([ends, restored['b']])
+        monitor.load_state(starts, ends, from_seconds(pending) if pending >= 0 else None)
+        if source == 'current':
+            plan = WAL_HEADER.size + len(records) * WAL_RECORD.size
+        elif source == 'previous':
+            plan = records.tobytes()
+        else:
+            plan = None
+        return len(records), plan
+
+    def repair(self, plan):
+        """Підготувати журнал до дозапису після load().
+
+        plan: розмір журналу з цілих записів — обрізати до нього; байти
+        записів — переписати ними журнал поточного покоління; None — почати
+        порожній журнал.
+        """
+        if isinstance(plan, bytes):
+            # Хвіст старого журналу після знімка — одним атомарним записом у новий
+            self._atomic_write(self.wal_path, WAL_HEADER.pack(WAL_MAGIC, self.generation), plan)
+        elif plan is None:
+            # Журналу немає або він старого покоління — починаємо новий
+            self._atomic_write(self.wal_path, WAL_HEADER.pack(WAL_MAGIC, self.generation))
+        elif os.path.getsize(self.wal_path) != plan:
+            # Обірваний останній запис після аварійної зупинки
+            os.truncate(self.wal_path, plan)
+
+class RenderCache:
+    """Невеликий LRU відрендерених відповідей"""
+    def __init__(self, maxsize=RENDER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render):
+        """Значення з кешу або render() з запам'ятовуванням"""
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            value = self.entries[key] = render()
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+            return value
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
 
 class PowerMonitor:
     """Клас для відстеження відключень"""
-    def __init__(self):
+    def __init__(self, journal=None, sensor_id=DEFAULT_SENSOR, group=DTEK_GROUP, history_limit=0):
+        self.sensor_id = sensor_id
+        self.group = group
+        self.history_limit = history_limit
         self.power_status = True
         self.last_outage_start = None
-        self.outages_history = []  # ВСЯ історія
+        self.journal = journal
+        self.on_change = None  # викликається з монітором, коли power_status змінюється
+        self.version = 0       # росте при кожній зміні стану чи історії
+        self.snapshot_version = None  # версія в останньому знімку (None — знімка ще не було)
+        self.render_cache = RenderCache()
+        self.index = OutageIndex()
+        self.analytics = OutageAnalytics(self.index)
+        self.forecast = ForecastEngine(self.index, self.analytics)
+        self.outages_history = OutageHistory(self.index)  # ВСЯ історія, відсортована за початком
         
-    def power_lost(self):
+    def power_lost(self, at=None):
         """Світло зникло"""
-        self.power_status = False
-        self.last_outage_start = datetime.now()
-        print(f"⚠️ Світло зникло о {self.last_outage_start.strftime('%H:%M:%S')}")
-        print(f"📊 Статус збережено: power_status={self.power_status}")
+        self._set_status(False)
+        self.version += 1
+        self.last_outage_start = at or datetime.now()
+        log.info("⚠️ Світло зникло о %s", self.last_outage_start.strftime('%H:%M:%S'), extra={'sensor': self.sensor_id})
+        if self.journal:
+            self.journal.record_lost(to_seconds(self.last_outage_start))
+        request_log.debug("📊 Статус збережено: power_status=%s", self.power_status)
         
-    def power_restored(self):
-        """Світло з'явилось"""
+    def power_restored(self, at=None):
+        """Світло з'явилось; повертає збережене відключення"""
+        outage = None
         if self.last_outage_start:
-            duration = datetime.now() - self.last_outage_start
-            outage_data = {
-                'start': self.last_outage_start,
-                'end': datetime.now(),
-                'duration': duration
-            }
-            self.outages_history.append(outage_data)
-            print(f"✅ Світло з'явилось. Тривалість: {duration}")
-            print(f"📊 Збережено в історію. Всього відключень: {len(self.outages_history)}")
+            end = max(at or datetime.now(), self.last_outage_start)
+            self.add_outage(self.last_outage_start, end)
+            outage = Outage(to_seconds(self.last_outage_start), to_seconds(end))
+            if self.journal:
+                self.journal.record_restored(to_seconds(self.last_outage_start), to_seconds(end))
+            log.info("✅ Світло з'явилось. Тривалість: %s", end - self.last_outage_start, extra={'sensor': self.sensor_id})
+            request_log.debug("📊 Збережено в історію. Всього відключень: %d", len(self.index))
         else:
-            print("⚠️ Немає початку відключення для збереження")
+            log.warning("⚠️ Немає початку відключення для збереження", extra={'sensor': self.sensor_id})
             
-        self.power_status = True
+        self._set_status(True)
+        self.version += 1
         self.last_outage_start = None
+        return outage
+
+    def add_outages(self, starts, ends):
+        """Масово додати завершені відключення з минулого (секунди).
+
+        Відключення, що перетинаються з уже відомими або з поточним,
+        пропускаються. Повертає кількість доданих.
+        """
+        current = to_seconds(self.last_outage_start) if self.last_outage_start else None
+        new_starts, new_ends = [], []
+        for start, end in zip(starts, ends):
+            i, j = self.index.span(start, end)
+            if end <= start or i < j or (current is not None and end > current):
+                continue
+            new_starts.append(start)
+            new_ends.append(end)
+        if not new_starts:
+            return 0
+        OUTAGES_TOTAL.labels('batch').inc(len(new_starts))
+        if not len(self.index) or new_starts[0] >= self.index.starts[-1]:
+            for start, end in zip(new_starts, new_ends):
+                self.index.add(start, end)
+                self.analytics.add(start, end)
+        else:
+            # Вставка в середину — одна перебудова замість перебудови на кожне
+            old_starts, old_ends = self.index.columns()
+            self.index.load(np.concatenate([old_starts, new_starts]), np.concatenate([old_ends, new_ends]))
+            for start, end in zip(new_starts, new_ends):
+                self.analytics.invalidate(start, end)
+        if self.history_limit and self.index.trim(self.history_limit):
+            self.analytics.clear()
+        if self.journal:
+            self.journal.record_outages(new_starts, new_ends)
+        self.version += 1
+        return len(new_starts)
+
+    def render(self, view, render):
+        """Текст виду view з кешу.
+
+        Ключ — (вид, версія стану, хвилина): поки нічого не змінилось,
+        повторні натискання не перераховують і не форматують нічого.
+        Хвилина потрібна для «живих» тривалостей і меж доби.
+        """
+        key = (view, self.version, to_seconds(datetime.now()) // 60)
+        return self.render_cache.get(key, lambda: render(self))
+
+    def _set_status(self, power_status):
+        changed = power_status != self.power_status
+        self.power_status = power_status
+        if changed and self.on_change:
+            self.on_change(self)
+
+    def attach_journal(self, journal):
+        """Відновити стан із журналу і далі записувати в нього всі зміни"""
+        if not journal.replay(self):
+            # Після знімка подій не було — наступний знімок нічого б не змінив
+            self.snapshot_version = self.version
+        self.journal = journal
+
+    def load_state(self, starts, ends, last_outage_start):
+        """Замінити стан масивами starts/ends (секунди) і поточним відключенням"""
+        self.index.load(starts, ends)
+        if self.history_limit:
+            self.index.trim(self.history_limit)
+        self.analytics.clear()
+        self.last_outage_start = last_outage_start
+        self._set_status(last_outage_start is None)
+        self.version += 1
+
+    def add_outage(self, start, end):
+        """Додати завершене відключення в історію"""
+        start, end = to_seconds(start), to_seconds(end)
+        i = self.index.add(start, end)
+        OUTAGES_TOTAL.labels('live').inc()
+        if i == len(self.index) - 1:
+            self.analytics.add(start, end)
+        else:
+            self.analytics.invalidate(start, end)
+        if self.history_limit and self.index.trim(self.history_limit):
+            self.analytics.clear()
+        self.version += 1
+        return i
         
     def get_current_duration(self):
         """Поточна тривалість відключення"""
         if not self.power_status and self.last_outage_start:
             return datetime.now() - self.last_outage_start
         return timedelta(0)
+
+    def get_current_outage(self, since=None):
+        """Поточне відключення (обрізане до since), якщо воно є"""
+        if self.power_status or not self.last_outage_start:
+            return None
+        start = to_seconds(self.last_outage_start)
+        if since:
+            start = max(start, to_seconds(since))
+        return Outage(start, to_seconds(datetime.now()))
+
+    def get_outages(self, since, until):
+        """Відключення в [since, until), обрізані до меж діапазону"""
+        lo, hi = to_seconds(since), to_seconds(until)
+        i, j = self.index.span(lo, hi)
+        return [Outage(*self.index.clipped(k, lo, hi)) for k in range(i, j)]
+
+    def get_columns(self, since, until, include_current=True):
+        """Початки і кінці відключень в [since, until) як масиви NumPy"""
+        starts, ends = self.index.clipped_columns(to_seconds(since), to_seconds(until))
+        current = self.get_current_outage(since) if include_current else None
+        if current:
+            starts = np.append(starts, current.start_ts)
+            ends = np.append(ends, current.end_ts)
+        return starts, ends
+
+    def get_range_stats(self, since, until):
+        """Статистика завершених відключень в [since, until) за O(log n)"""
+        stats = self.index.range_stats(to_seconds(since), to_seconds(until))
+        if not stats:
+            return None
+        return {
+            'count': stats['count'],
+            'total': timedelta(seconds=stats['total']),
+            'longest': Outage(*stats['longest']),
+            'shortest': Outage(*stats['shortest']),
+            'last': Outage(*stats['last'])
+        }
     
     def get_today_outages(self):
         """Отримати відключення за сьогодні"""
-        today = datetime.now().date()
-        today_outages = [o for o in self.outages_history if o['start'].date() == today]
-        print(f"📅 Відключень сьогодні: {len(today_outages)}")
+        since, until = today_range()
+        today_outages = self.get_outages(since, until)
+        request_log.debug("📅 Відключень сьогодні: %d", len(today_outages))
         return today_outages
+
+    def get_today_stats(self):
+        """Статистика завершених відключень за сьогодні"""
+        return self.get_range_stats(*today_range())
     
     def get_stats(self):
         """Детальна статистика за сьогодні"""
-        outages = self.get_today_outages()
+        since, until = today_range()
+        stats = self.get_range_stats(since, until)
         
         # Якщо є поточне відключення - додаємо його
-        if not self.power_status and self.last_outage_start:
-            current_outage = {
-                'start': self.last_outage_start,
-                'end': datetime.now(),
-                'duration': self.get_current_duration()
-            }
-            outages = outages + [current_outage]
-            print(f"➕ Додано поточне відключення: {current_outage['duration']}")
+        current_outage = self.get_current_outage(since)
+        if current_outage:
+            request_log.debug("➕ Додано поточне відключення: %s", current_outage['duration'])
+            if stats:
+                stats['count'] += 1
+                stats['total'] += current_outage['duration']
+                stats['longest'] = max(stats['longest'], current_outage, key=lambda x: x['duration'])
+                stats['shortest'] = min(stats['shortest'], current_outage, key=lambda x: x['duration'])
+            else:
+                stats = {
+                    'count': 1,
+                    'total': current_outage['duration'],
+                    'longest': current_outage,
+                    'shortest': current_outage
+                }
         
-        if not outages:
-            print("⚠️ Немає відключень для статистики")
+        if not stats:
+            request_log.debug("⚠️ Немає відключень для статистики")
             return None
         
-        total_duration = sum([o['duration'] for o in outages], timedelta(0))
-        avg_duration = total_duration / len(outages)
-        longest = max(outages, key=lambda x: x['duration'])
-        shortest = min(outages, key=lambda x: x['duration'])
-        
-        stats = {
-            'count': len(outages),
-            'total': total_duration,
-            'avg': avg_duration,
-            'longest': longest,
-            'shortest': shortest
-        }
+        stats['avg'] = stats['total'] / stats['count']
         
-        print(f"📊 Статистика: {stats['count']} відключень, загалом {stats['total']}")
+        request_log.debug("📊 Статистика: %d відключень, загалом %s", stats['count'], stats['total'])
         return stats
 
-monitor = PowerMonitor()
+def today_range():
+    """Початок сьогоднішньої доби і початок наступної"""
+    day_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return day_start, day_start + timedelta(days=1)
+
+class PowerEventMachine:
+    """Автомат подій живлення перед PowerMonitor.
+
+    Згладжує «мерехтіння» мережі і робить вебхуки ідемпотентними:
+    - подія з уже баченим ключем або про стан, що вже діє, ігнорується
+      (повторний power_lost більше не перезаписує початок відключення);
+    - відновлення стає остаточним лише після window секунд без нових
+      відключень; якщо світло зникло раніше — це те саме відключення;
+    - подія, старша за останній відомий перехід стану (horizon()),
+      відкидається: вона дала б відключення, що перекривається з уже
+      записаними.
+
+    feed() повертає список дій: ('lost', час), ('restored', Outage),
+    ('pending', час), ('merged', час), ('duplicate', час), ('stale', час).
+    """
+    def __init__(self, monitor, window=FLAP_WINDOW, max_keys=256):
+        self.monitor = monitor
+        self.window = timedelta(seconds=window)
+        self.max_keys = max_keys
+        self.pending_restore = None  # час відновлення, що чекає підтвердження
+        self.timer = None            # таймер підтвердження в event loop
+        self.quiet = False           # відновлення з пакета: про нього вже сказав підсумок
+        self.seen_keys = OrderedDict()
+
+    def is_duplicate(self, key):
+        """Чи вже була подія з таким ключем (і запам'ятати його)"""
+        if key is None:
+            return False
+        if key in self.seen_keys:
+            return True
+        self.seen_keys[key] = None
+        if len(self.seen_keys) > self.max_keys:
+            self.seen_keys.popitem(last=False)
+        return False
+
+    def feed(self, kind, at, key=None):
+        """Подія 'lost' або 'restored' у момент at"""
+        if self.is_duplicate(key):
+            return [('duplicate', at)]
+        horizon = self.horizon()
+        if horizon is not None and at < horizon:
+            return [('stale', at)]
+        actions = self.flush(at)
+        if kind == 'lost':
+            if self.pending_restore is not None:
+                # Світло зникло знову до підтвердження — продовжуємо те саме відключення
+                self.pending_restore = None
+                actions.append(('merged', at))
+            elif self.monitor.power_status:
+                self.monitor.power_lost(at)
+                actions.append(('lost', at))
+            else:
+                actions.append(('duplicate', at))
+        else:
+            if self.monitor.power_status or self.pending_restore is not None:
+                actions.append(('duplicate', at))
+            elif not self.window:
+                actions.append(('restored', self.monitor.power_restored(at)))
+            else:
+                self.pending_restore = at
+                actions.append(('pending', at))
+        return actions
+
+    def horizon(self):
+        """Час останнього відомого переходу стану (None — історії ще немає)"""
+        known = [self.monitor.last_outage_start, self.pending_restore]
+        if len(self.monitor.index):
+            known.append(from_seconds(self.monitor.index.ends[-1]))
+        known = [at for at in known if at is not None]
+        return max(known) if known else None
+
+    def flush(self, now):
+        """Підтвердити відновлення, якщо з нього минуло window"""
+        if self.pending_restore is not None and now - self.pending_restore >= self.window:
+            return [('restored', self.confirm())]
+        return []
+
+    def confirm(self):
+        """Підтвердити відновлення, що очікує, незалежно від часу"""
+        at, self.pending_restore = self.pending_restore, None
+        if at is None:
+            return None
+        return self.monitor.power_restored(at)
+
+SENSOR_ID_RE = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+class MonitorRegistry:
+    """Реєстр моніторів за ID сенсора.
+
+    Монітор сенсора знаходиться одним зверненням до dict. Зведення по
+    групах ДТЕК оновлюються при кожній зміні статусу, тож відповідь для
+    групи не обходить усі сенсори.
+    """
+    def __init__(self, history_limit=HISTORY_LIMIT, max_sensors=MAX_SENSORS):
+        self.history_limit = history_limit
+        self.max_sensors = max_sensors
+        self.monitors = {}       # ID сенсора -> PowerMonitor
+        self.groups = {}         # група -> множина ID сенсорів
+        self.without_power = {}  # група -> скільки сенсорів зараз без світла
+        self.data_dir = None
+        self.store = None        # SqliteStore, якщо STATE_BACKEND=sqlite
+
+    def __len__(self):
+        return len(self.monitors)
+
+    def get(self, sensor_id):
+        return self.monitors.get(sensor_id)
+
+    def add(self, sensor_id, group):
+        """Зареєструвати сенсор (без читання з диска)"""
+        sensor = PowerMonitor(sensor_id=sensor_id, group=group, history_limit=self.history_limit)
+        sensor.on_change = self._status_changed
+        sensor.events = PowerEventMachine(sensor)
+        self.monitors[sensor_id] = sensor
+        self.groups.setdefault(group, set()).add(sensor_id)
+        self.without_power.setdefault(group, 0)
+        return sensor
+
+    def resolve(self, sensor_id, group=None):
+        """Монітор сенсора; невідомий сенсор реєструється автоматично"""
+        sensor = self.monitors.get(sensor_id)
+        if sensor is not None:
+            return sensor
+        if not SENSOR_ID_RE.match(sensor_id) or len(self.monitors) >= self.max_sensors:
+            return None
+        sensor = self.add(sensor_id, group or DTEK_GROUP)
+        if self.data_dir:
+            sensor.journal = self.journal_for(sensor)
+            sensor.journal.save_meta('group', sensor.group)
+        log.info("📟 Новий сенсор: %s (група %s)", sensor_id, sensor.group)
+        return sensor
+
+    def _status_changed(self, sensor):
+        self.without_power[sensor.group] += -1 if sensor.power_status else 1
+
+    def group_summary(self, group):
+        """Зведення по групі за O(1)"""
+        sensors = self.groups.get(group, ())
+        return {
+            'group': group,
+            'sensors': len(sensors),
+            'without_power': self.without_power.get(group, 0),
+        }
+
+    def journal_path(self, sensor_id):
+        # Основний сенсор лежить у корені, як і до появи реєстру
+        if sensor_id == DEFAULT_SENSOR:
+            return self.data_dir
+        return os.path.join(self.data_dir, 'sensors', sensor_id)
+
+    def journal_for(self, sensor):
+        if self.store:
+            return SqliteJournal(self.store, sensor.sensor_id, sensor.group)
+        return OutageJournal(self.journal_path(sensor.sensor_id))
+
+    def saved_sensors(self):
+        """(ID сенсора, група) з директорій файлових журналів"""
+        sensors_dir = os.path.join(self.data_dir, 'sensors')
+        if not os.path.isdir(sensors_dir):
+            return
+        for sensor_id in sorted(os.listdir(sensors_dir)):
+            group_path = os.path.join(sensors_dir, sensor_id, 'group')
+            group = DTEK_GROUP
+            if os.path.exists(group_path):
+                with open(group_path) as f:
+                    group = f.read().strip() or DTEK_GROUP
+            yield sensor_id, group
+
+    def open(self, data_dir, store=None):
+        """Підключити журнали і відновити всі збережені сенсори"""
+        self.data_dir = data_dir
+        self.store = store
+        for sensor_id, group in (store.sensors() if store else self.saved_sensors()):
+            if sensor_id in self.monitors or not SENSOR_ID_RE.match(sensor_id):
+                continue
+            self.add(sensor_id, group)
+        for sensor in self.monitors.values():
+            sensor.attach_journal(self.journal_for(sensor))
+        log.info("📟 Сенсорів: %d, груп: %d", len(self.monitors), len(self.groups))
+
+    def snapshot_all(self):
+        """Знімки сенсорів, що змінились після свого останнього знімка"""
+        for sensor in self.monitors.values():
+            if sensor.journal and sensor.version != sensor.snapshot_version:
+                sensor.journal.snapshot(sensor)
+                sensor.snapshot_version = sensor.version
+
+    def close(self):
+        get_journal_writer().stop()
+
+registry = MonitorRegistry()
+monitor = registry.add(DEFAULT_SENSOR, DTEK_GROUP)
 
 def format_duration(td):
     """Форматує timedelta"""
@@ -103,6 +1690,563 @@ def format_duration(td):
         return f"{hours}г {minutes}хв"
     return f"{minutes}хв"
 
+# ========== SQLITE ==========
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sensors (
+    sensor_id TEXT PRIMARY KEY,
+    grp TEXT NOT NULL,
+    pending INTEGER               -- початок поточного відключення, NULL — світло є
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS outages (
+    sensor_id TEXT NOT NULL,
+    start_ts INTEGER NOT NULL,
+    end_ts INTEGER NOT NULL,
+    PRIMARY KEY (sensor_id, start_ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS subscriptions (
+    chat_id INTEGER NOT NULL,
+    grp TEXT NOT NULL,
+    PRIMARY KEY (chat_id, grp)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS changes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin TEXT NOT NULL,         -- екземпляр, що зробив зміну
+    topic TEXT NOT NULL,          -- ID сенсора або група для підписок
+    kind INTEGER NOT NULL,
+    a INTEGER NOT NULL,
+    b INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_created ON changes (created);
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    grp TEXT,                     -- NULL — лише адмін-чат
+    sensor_id TEXT,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS heartbeats (
+    sensor_id TEXT PRIMARY KEY,
+    seen REAL NOT NULL            -- time.time() останнього heartbeat на будь-якому екземплярі
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS heartbeats_seen ON heartbeats (seen);
+"""
+
+KIND_SUBSCRIBE = 4    # лише в changes: a = chat_id, topic = група
+KIND_UNSUBSCRIBE = 5
+
+class SqliteStore:
+    """Спільний стан кількох екземплярів бота в одній базі SQLite (WAL).
+
+    Пише лише потік запису журналів: одне з'єднання, одна транзакція
+    на пакет. Event loop читає через окреме з'єднання — у режимі WAL
+    читачі не чекають на записувача. Кожна зміна потрапляє ще й у
+    таблицю changes: інші екземпляри забирають звідти чужі зміни і
+    застосовують до своїх моніторів у пам'яті.
+
+    Сповіщення відправляє лише лідер — власник оренди в leases; решта
+    кладе їх в outbox.
+    """
+    def __init__(self, path, instance=INSTANCE_ID, writer=None, lease=LEADER_LEASE):
+        self.path = path
+        self.instance = instance
+        self._writer = writer
+        self.lease = lease
+        self.is_leader = False
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = self._connect()      # лише потік запису
+        self.db.executescript(SQLITE_SCHEMA)
+        self.reader = self._connect()  # event loop
+        # Зміни до цього id уже є в таблицях, які зараз прочитає реєстр
+        self.cursor = self.reader.execute('SELECT coalesce(max(id), 0) FROM changes').fetchone()[0]
+        self.writer.on_batch.append(self.commit)
+
+    @property
+    def writer(self):
+        return self._writer if self._writer is not None else get_journal_writer()
+
+    def _connect(self):
+        # isolation_level=None: транзакціями керуємо самі (BEGIN IMMEDIATE ... COMMIT)
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                             check_same_thread=False, cached_statements=64)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=FULL')
+        return db
+
+    def run(self, func):
+        """Виконати func у потоці запису; asyncio-future з результатом"""
+        return asyncio.wrap_future(self.writer.call(func))
+
+    def close(self):
+        """Віддати оренду і закрити з'єднання (після всіх записів у черзі)"""
+        def close_writer():
+            self._begin()
+            self.db.execute('DELETE FROM leases WHERE name = ? AND holder = ?', ('leader', self.instance))
+            self.commit()
+            self.writer.on_batch.remove(self.commit)
+            self.db.close()
+        self.writer.submit(None, 'call', close_writer)
+        self.reader.close()
+
+    # --- Запис (потік запису) ---
+
+    def _begin(self):
+        if not self.db.in_transaction:
+            self.db.execute('BEGIN IMMEDIATE')
+
+    def commit(self):
+        if self.db.in_transaction:
+            self.db.execute('COMMIT')
+
+    def write_records(self, sensor_id, group, records):
+        """Записи журналу сенсора (масив WAL_DTYPE) — у таблиці і в changes"""
+        self._begin()
+        rows = list(zip(records['kind'].tolist(), records['a'].tolist(), records['b'].tolist()))
+        self.db.executemany('INSERT OR IGNORE INTO outages VALUES (?, ?, ?)',
+                            [(sensor_id, a, b) for kind, a, b in rows if kind != KIND_LOST])
+        transitions = [(kind, a) for kind, a, _ in rows if kind in (KIND_LOST, KIND_RESTORED)]
+        if transitions:
+            kind, a = transitions[-1]
+            self.db.execute('INSERT INTO sensors VALUES (?, ?, ?) '
+                            'ON CONFLICT (sensor_id) DO UPDATE SET pending = excluded.pending',
+                            (sensor_id, group, a if kind == KIND_LOST else None))
+        else:
+            self.db.execute('INSERT OR IGNORE INTO sensors VALUES (?, ?, NULL)', (sensor_id, group))
+        now = time.time()
+        self.db.executemany('INSERT INTO changes (origin, topic, kind, a, b, created) VALUES (?, ?, ?, ?, ?, ?)',
+                            [(self.instance, sensor_id, kind, a, b, now) for kind, a, b in rows])
+
+    def write_group(self, sensor_id, group):
+        self._begin()
+        self.db.execute('INSERT INTO sensors VALUES (?, ?, NULL) ON CONFLICT (sensor_id) DO UPDATE SET grp = excluded.grp',
+                        (sensor_id, group))
+
+    def write_subscription(self, chat_id, group, subscribed):
+        self._begin()
+        if subscribed:
+            self.db.execute('INSERT OR IGNORE INTO subscriptions VALUES (?, ?)', (chat_id, group))
+        else:
+            self.db.execute('DELETE FROM subscriptions WHERE chat_id = ? AND grp = ?', (chat_id, group))
+        self.db.execute('INSERT INTO changes (origin, topic, kind, a, b, created) VALUES (?, ?, ?, ?, 0, ?)',
+                        (self.instance, group, KIND_SUBSCRIBE if subscribed else KIND_UNSUBSCRIBE, chat_id, time.time()))
+
+    def renew_lease(self):
+        """Взяти або продовжити оренду лідера; True — цей екземпляр лідер"""
+        now = time.time()
+        self._begin()
+        self.db.execute('INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT (name) DO UPDATE '
+                        'SET holder = excluded.holder, expires = excluded.expires '
+                        'WHERE leases.holder = excluded.holder OR leases.expires < ?',
+                        ('leader', self.instance, now + self.lease, now))
+        holder, = self.db.execute('SELECT holder FROM leases WHERE name = ?', ('leader',)).fetchone()
+        if holder == self.instance:
+            # Журнал змін потрібен лише екземплярам, що відстали не більше ніж на добу
+            self.db.execute('DELETE FROM changes WHERE created < ?', (now - CHANGES_RETENTION,))
+        self.commit()
+        return holder == self.instance
+
+    def take_outbox(self, limit=1000):
+        """Забрати сповіщення від інших екземплярів (лише лідер)"""
+        self._begin()
+        rows = self.db.execute('DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?) '
+                               'RETURNING id, grp, sensor_id, text', (limit,)).fetchall()
+        self.commit()
+        return sorted(rows)
+
+    # --- Виклики з event loop ---
+
+    def enqueue(self, group, sensor_id, text):
+        """Передати сповіщення лідеру; не блокує"""
+        def write():
+            self._begin()
+            self.db.execute('INSERT INTO outbox (grp, sensor_id, text) VALUES (?, ?, ?)', (group, sensor_id, text))
+        self.writer.submit(None, 'call', write)
+
+    def record_heartbeat(self, sensor_id, seen):
+        """Heartbeat для детектора лідера; не блокує"""
+        def write():
+            self._begin()
+            self.db.execute('INSERT INTO heartbeats VALUES (?, ?) ON CONFLICT (sensor_id) DO UPDATE '
+                            'SET seen = max(seen, excluded.seen)', (sensor_id, seen))
+        self.writer.submit(None, 'call', write)
+
+    def record_subscription(self, chat_id, group, subscribed):
+        self.writer.submit(None, 'call', lambda: self.write_subscription(chat_id, group, subscribed))
+
+    def sensors(self):
+        return self.reader.execute('SELECT sensor_id, grp FROM sensors ORDER BY sensor_id').fetchall()
+
+    def group_of(self, sensor_id):
+        row = self.reader.execute('SELECT grp FROM sensors WHERE sensor_id = ?', (sensor_id,)).fetchone()
+        return row[0] if row else None
+
+    def subscriptions(self):
+        return self.reader.execute('SELECT chat_id, grp FROM subscriptions').fetchall()
+
+    def read_sensor(self, sensor_id):
+        """Історія сенсора як (starts, ends, початок поточного відключення або None)"""
+        rows = self.reader.execute('SELECT start_ts, end_ts FROM outages WHERE sensor_id = ? ORDER BY start_ts',
+                                   (sensor_id,)).fetchall()
+        columns = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        row = self.reader.execute('SELECT pending FROM sensors WHERE sensor_id = ?', (sensor_id,)).fetchone()
+        return columns[:, 0].copy(), columns[:, 1].copy(), row[0] if row else None
+
+    def heartbeats_since(self, since):
+        """Heartbeat-и всіх екземплярів, новіші за since: [(ID сенсора, час)]"""
+        return self.reader.execute('SELECT sensor_id, seen FROM heartbeats WHERE seen > ? ORDER BY seen',
+                                   (since,)).fetchall()
+
+    def changes_since(self, limit=10000):
+        """Чужі зміни після курсора: [(topic, kind, a, b)]"""
+        rows = self.reader.execute('SELECT id, origin, topic, kind, a, b FROM changes WHERE id > ? ORDER BY id LIMIT ?',
+                                   (self.cursor, limit)).fetchall()
+        if rows:
+            self.cursor = rows[-1][0]
+        return [row[2:] for row in rows if row[1] != self.instance]
+
+class SqliteJournal(OutageJournal):
+    """Журнал сенсора в спільній базі SQLite.
+
+    Записи кодуються так само, як у файловому журналі, і тим самим
+    потоком запису пакетами потрапляють у таблиці; знімки не потрібні.
+    """
+    def __init__(self, store, sensor_id, group):
+        self.store = store
+        self.sensor_id = sensor_id
+        self.group = group
+        self._writer = store._writer
+        self.generation = 0
+
+    def snapshot(self, monitor):
+        pass  # історія вже в таблиці outages
+
+    def save_meta(self, name, value):
+        if name == 'group':
+            self.group = value
+            self.writer.submit(self, 'call', lambda: self.store.write_group(self.sensor_id, value))
+
+    def write_records(self, data):
+        self.store.write_records(self.sensor_id, self.group, np.frombuffer(data, dtype=WAL_DTYPE))
+
+    def replay(self, monitor):
+        started = time.perf_counter()
+        starts, ends, pending = self.store.read_sensor(self.sensor_id)
+        monitor.load_state(starts, ends, from_seconds(pending) if pending is not None else None)
+        request_log.debug("💾 %s: %d відключень з SQLite за %.0f мс", self.sensor_id, len(monitor.index),
+                          (time.perf_counter() - started) * 1000)
+        return 0  # знімків немає — історія вже в таблиці
+
+state_store = None  # SqliteStore при STATE_BACKEND=sqlite, створюється в main()
+
+# ========== ПІДПИСКИ ==========
+
+class SubscriberRegistry:
+    """Підписки чатів на групи ДТЕК.
+
+    Зберігається в subscribers.json у DATA_DIR. Індекс група -> чати
+    підтримується при кожній зміні, тож розсилка по групі не обходить
+    усіх підписників. Запис на диск відкладається на SUBSCRIBERS_SAVE_DELAY,
+    щоб серія змін (наприклад, видалення заблокованих чатів під час
+    розсилки) записувалась одним файлом.
+    """
+    def __init__(self, admin_chat=CHAT_ID):
+        self.chats = {}     # chat_id -> множина груп
+        self.by_group = {}  # група -> множина chat_id
+        self.admin_chat = admin_chat
+        self.path = None
+        self.store = None   # SqliteStore: кожна зміна — рядком у subscriptions
+        self.save_handle = None
+
+    def __len__(self):
+        return len(self.chats)
+
+    def open(self, data_dir, store=None):
+        if store:
+            self.store = store
+            for chat_id, group in store.subscriptions():
+                self._add(chat_id, group)
+        else:
+            self.path = os.path.join(data_dir, 'subscribers.json')
+            if os.path.exists(self.path):
+                with open(self.path) as f:
+                    for chat_id, groups in json.load(f).items():
+                        for group in groups:
+                            self._add(int(chat_id), group)
+        log.info("🔔 Підписників: %d", len(self.chats))
+
+    def _add(self, chat_id, group):
+        groups = self.chats.setdefault(chat_id, set())
+        if group in groups:
+            return False
+        groups.add(group)
+        self.by_group.setdefault(group, set()).add(chat_id)
+        return True
+
+    def _remove(self, chat_id, group):
+        groups = self.chats.get(chat_id)
+        if not groups or group not in groups:
+            return False
+        groups.discard(group)
+        if not groups:
+            del self.chats[chat_id]
+        chats = self.by_group[group]
+        chats.discard(chat_id)
+        if not chats:
+            del self.by_group[group]
+        return True
+
+    def subscribe(self, chat_id, group):
+        added = self._add(chat_id, group)
+        if added:
+            self._changed(chat_id, group, True)
+        return added
+
+    def unsubscribe(self, chat_id, group=None):
+        """Відписати чат від групи (None — від усіх); повертає, чи щось змінилось"""
+        groups = self.chats.get(chat_id, set())
+        removed = groups if group is None else groups & {group}
+        if not removed:
+            return False
+        for name in list(removed):
+            self._remove(chat_id, name)
+            self._changed(chat_id, name, False)
+        return True
+
+    def remove(self, chat_id):
+        """Чат заблокував бота або зник — прибрати всі підписки"""
+        if self.unsubscribe(chat_id):
+            log.info("🔕 Чат %s недоступний — підписки видалено", chat_id)
+
+    def groups_of(self, chat_id):
+        return self.chats.get(chat_id, set())
+
+    def recipients(self, group):
+        """Чати для сповіщення про групу: підписники і адмін-чат із CHAT_ID"""
+        chats = set(self.by_group.get(group, ()))
+        if self.admin_chat:
+            admin = self.admin_chat
+            chats.add(int(admin) if admin.lstrip('-').isdigit() else admin)
+        return chats
+
+    def apply_remote(self, chat_id, group, subscribed):
+        """Зміна підписки з іншого екземпляра — лише в пам'яті"""
+        if subscribed:
+            self._add(chat_id, group)
+        else:
+            self._remove(chat_id, group)
+
+    def _changed(self, chat_id, group, subscribed):
+        if self.store:
+            self.store.record_subscription(chat_id, group, subscribed)
+        if not self.path:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+        if self.save_handle is None:
+            self.save_handle = loop.call_later(SUBSCRIBERS_SAVE_DELAY, self.save)
+
+    def save(self):
+        """Записати підписки у фоновому потоці запису"""
+        self.save_handle = None
+        data = json.dumps({str(chat_id): sorted(groups) for chat_id, groups in self.chats.items()}).encode()
+        get_journal_writer().submit(None, 'call', lambda: self._write(data))
+
+    def _write(self, data):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def flush(self):
+        """Записати відкладені зміни одразу (при зупинці)"""
+        if self.save_handle is not None:
+            self.save_handle.cancel()
+            self.save()
+
+subscribers = SubscriberRegistry()
+
+# ========== ГРАФІК ДТЕК ==========
+
+SLOT_ON, SLOT_MAYBE, SLOT_OFF = 0, 1, 2
+
+# Значення години в DisconSchedule.fact -> (перша, друга) половина години
+DTEK_HOUR_SLOTS = {
+    'yes': (SLOT_ON, SLOT_ON),
+    'no': (SLOT_OFF, SLOT_OFF),
+    'maybe': (SLOT_MAYBE, SLOT_MAYBE),
+    'first': (SLOT_OFF, SLOT_ON),
+    'second': (SLOT_ON, SLOT_OFF),
+    'mfirst': (SLOT_MAYBE, SLOT_ON),
+    'msecond': (SLOT_ON, SLOT_MAYBE),
+}
+
+class DtekSchedule:
+    """Графік однієї групи: по 48 півгодинних слотів на добу.
+
+    Вікна відключень (з'єднані через північ) рахуються один раз при
+    розборі, тож відповіді користувачам — лише пошук у списку.
+    """
+    __slots__ = ('days', 'updated', 'windows', 'fetched_at')
+
+    def __init__(self, days, updated=None):
+        self.days = days        # початок доби (секунди) -> bytes(48)
+        self.updated = updated  # час оновлення за даними ДТЕК, як на сайті
+        self.fetched_at = None
+        self.windows = []       # (початок, кінець, SLOT_MAYBE | SLOT_OFF)
+        for day in sorted(days):
+            for slot, level in enumerate(days[day]):
+                start = day + slot * 1800
+                if level == SLOT_ON:
+                    continue
+                if self.windows and self.windows[-1][1] == start and self.windows[-1][2] == level:
+                    self.windows[-1] = (self.windows[-1][0], start + 1800, level)
+                else:
+                    self.windows.append((start, start + 1800, level))
+
+    def day_windows(self, day):
+        """Вікна, що перетинають добу з початком day"""
+        return [window for window in self.windows if window[1] > day and window[0] < day + 86400]
+
+    def next_window(self, now, level=SLOT_OFF):
+        """Поточне або найближче вікно з рівнем не нижче level"""
+        for window in self.windows:
+            if window[1] > now and window[2] >= level:
+                return window
+        return None
+
+def parse_dtek_schedule(html, group):
+    """Розібрати сторінку відключень ДТЕК: об'єкт DisconSchedule.fact у скрипті.
+
+    Повертає DtekSchedule або None, якщо графіка для групи на сторінці немає.
+    Сторінка з несподіваною структурою — ValueError.
+    """
+    marker = re.search(r'DisconSchedule\.fact\s*=\s*', html)
+    if not marker:
+        return None
+    fact, _ = json.JSONDecoder().raw_decode(html, marker.end())
+    data = fact.get('data', {}) if isinstance(fact, dict) else None
+    if not isinstance(data, dict):
+        raise ValueError(f"DisconSchedule.fact.data — {type(data).__name__}, а не об'єкт")
+    days = {}
+    for day_ts, groups in data.items():
+        if not isinstance(groups, dict):
+            raise ValueError(f"групи доби {day_ts} — {type(groups).__name__}, а не об'єкт")
+        hours = groups.get(f'GPV{group}') or groups.get(group)
+        if not hours:
+            continue
+        if not isinstance(hours, dict):
+            raise ValueError(f"години групи {group} — {type(hours).__name__}, а не об'єкт")
+        # Ключ — Unix-час київської півночі; +12 год дають ту саму дату
+        # в будь-якому поясі від UTC-12 до UTC+12
+        day = (int(day_ts) + 12 * 3600) // 86400 * 86400
+        slots = bytearray(48)
+        for hour in range(24):
+            value = hours.get(str(hour + 1))
+            slots[2 * hour], slots[2 * hour + 1] = DTEK_HOUR_SLOTS.get(value if isinstance(value, str) else None,
+                                                                       (SLOT_ON, SLOT_ON))
+        days[day] = bytes(slots)
+    if not days:
+        return None
+    return DtekSchedule(days, fact.get('update'))
+
+_http_session = None
+
+def get_http_session():
+    """Спільна сесія aiohttp з пулом з'єднань (створюється в event loop)"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+        )
+    return _http_session
+
+async def close_http_session():
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+
+class ScheduleFetcher:
+    """Фонове завантаження графіка ДТЕК з умовними GET.
+
+    ETag / Last-Modified зберігаються між запитами: поки сторінка не
+    змінилась, сервер відповідає 304 без тіла, і розбір не повторюється.
+    Хендлери читають лише готовий self.schedule.
+    """
+    def __init__(self, url=DTEK_SCHEDULE_URL, group=DTEK_GROUP, session=None):
+        self.url = url
+        self.group = group
+        self.session = session
+        self.schedule = None
+        self.etag = None
+        self.last_modified = None
+        self.checked_at = None
+        self.fetches = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    async def refresh(self):
+        """Завантажити графік; True — графік змінився"""
+        headers = {'User-Agent': 'Mozilla/5.0 (power-monitor-bot)'}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        session = self.session or get_http_session()
+        self.fetches += 1
+        try:
+            async with session.get(self.url, headers=headers) as response:
+                self.checked_at = datetime.now()
+                if response.status == 304:
+                    self.not_modified += 1
+                    return False
+                response.raise_for_status()
+                html = await response.text()
+                etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.errors += 1
+            log.warning("⚠️ Графік ДТЕК: %s: %s", type(e).__name__, e)
+            return False
+
+        try:
+            schedule = parse_dtek_schedule(html, self.group)
+        except ValueError as e:
+            schedule = None
+            log.warning("⚠️ Графік ДТЕК: не вдалося розібрати сторінку (%s)", e)
+        if schedule is None:
+            # Валідатори не зберігаємо, щоб наступного разу сторінку завантажити повністю
+            self.errors += 1
+            log.warning("⚠️ Графік ДТЕК: на сторінці немає графіка групи %s", self.group)
+            return False
+        self.etag, self.last_modified = etag, last_modified
+        schedule.fetched_at = self.checked_at
+        self.schedule = schedule
+        log.info("📅 Графік ДТЕК оновлено: %d вікон, %d діб", len(schedule.windows), len(schedule.days))
+        return True
+
+    def stats(self):
+        return {
+            'url': self.url,
+            'group': self.group,
+            'updated': self.schedule.updated if self.schedule else None,
+            'checked_at': self.checked_at.isoformat(timespec='seconds') if self.checked_at else None,
+            'fetches': self.fetches,
+            'not_modified': self.not_modified,
+            'errors': self.errors,
+        }
+
+schedule_fetcher = ScheduleFetcher()
+
 # ========== КЛАВІАТУРИ ==========
 
 def get_main_keyboard():
@@ -110,10 +2254,23 @@ def get_main_keyboard():
     keyboard = [
         [KeyboardButton("⚡ Статус"), KeyboardButton("📊 Статистика")],
         [KeyboardButton("🕐 Історія"), KeyboardButton("📈 Аналітика")],
-        [KeyboardButton("📅 График ДТЕК"), KeyboardButton("🔔 Прогноз")]
+        [KeyboardButton("📅 График ДТЕК"), KeyboardButton("🔔 Прогноз")],
+        [KeyboardButton("🗓 Карта відключень"), KeyboardButton("📉 Графік дня")],
+        [KeyboardButton("🔔 Підписка")]
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
+def get_subscription_menu(chat_id):
+    """Inline кнопки підписки на групи, де є сенсори"""
+    subscribed = subscribers.groups_of(chat_id)
+    keyboard = []
+    for group in sorted(registry.groups):
+        if group in subscribed:
+            keyboard.append([InlineKeyboardButton(f"✅ Група {group} — відписатися", callback_data=f'unsub:{group}')])
+        else:
+            keyboard.append([InlineKeyboardButton(f"🔔 Група {group} — підписатися", callback_data=f'sub:{group}')])
+    return InlineKeyboardMarkup(keyboard)
+
 def get_inline_menu():
     """Inline меню для повідомлень"""
     keyboard = [
@@ -142,6 +2299,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"📊 Веду детальну статистику\n"
         f"📈 Аналізую тренди\n"
         f"🔔 Прогнозую відключення\n\n"
+        f"Щоб отримувати сповіщення — /subscribe або кнопка «🔔 Підписка».\n\n"
         f"Використовуйте кнопки меню знизу ⬇️",
         parse_mode='HTML',
         reply_markup=get_main_keyboard()
@@ -163,407 +2321,1774 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await show_schedule(update, context)
     elif text == "🔔 Прогноз":
         await show_forecast(update, context)
+    elif text == "🔔 Підписка":
+        await show_subscriptions(update, context)
+    elif text == "📉 Графік дня":
+        await show_chart(update, context)
+    elif text == "🗓 Карта відключень":
+        await show_heatmap(update, context)
 
-async def show_status(update, context):
-    """Показати поточний статус"""
-    print(f"🔍 Перевірка статусу: power_status={monitor.power_status}")
-    
-    if monitor.power_status:
+# Годинник у статусі оновлюється щосекунди, тому в кеші лежить мітка,
+# яку підставляємо вже при відповіді
+CLOCK_MARK = '\x00clock\x00'
+
+def render_status(sensor):
+    """Текст поточного статусу"""
+    if sensor.power_status:
         msg = "🟢 <b>СВІТЛО Є</b>\n\n"
-        msg += f"⏰ Зараз: {datetime.now().strftime('%H:%M:%S')}\n\n"
+        msg += f"⏰ Зараз: {CLOCK_MARK}\n\n"
         
-        today_outages = monitor.get_today_outages()
-        if today_outages:
-            last = today_outages[-1]
+        today_stats = sensor.get_today_stats()
+        if today_stats:
+            last = today_stats['last']
             msg += f"Останнє відключення:\n"
             msg += f"   {last['start'].strftime('%H:%M')} • {format_duration(last['duration'])}\n\n"
         
-        total = len(today_outages)
+        total = today_stats['count'] if today_stats else 0
         if total > 0:
             msg += f"📊 Відключень сьогодні: {total}"
         else:
             msg += f"🎉 Сьогодні без відключень!"
     else:
-        duration = monitor.get_current_duration()
+        duration = sensor.get_current_duration()
         msg = "🔴 <b>СВІТЛА НЕМАЄ</b>\n\n"
-        msg += f"⏰ Зараз: {datetime.now().strftime('%H:%M:%S')}\n"
+        msg += f"⏰ Зараз: {CLOCK_MARK}\n"
         msg += f"⏱ Без світла: <b>{format_duration(duration)}</b>\n"
-        msg += f"🔌 Зникло о: {monitor.last_outage_start.strftime('%H:%M:%S')}\n"
-    
-    await update.message.reply_text(msg, parse_mode='HTML')
+        msg += f"🔌 Зникло о: {sensor.last_outage_start.strftime('%H:%M:%S')}\n"
+    return msg
 
-async def show_stats(update, context):
-    """Показати статистику"""
-    print("📊 Запит статистики...")
-    stats = monitor.get_stats()
+def render_stats(sensor):
+    """Текст статистики за сьогодні"""
+    stats = sensor.get_stats()
     
     if not stats:
         msg = "📊 <b>СТАТИСТИКА</b>\n\n"
         
-        if not monitor.power_status:
+        if not sensor.power_status:
             # Якщо зараз немає світла, але статистика порожня
-            duration = monitor.get_current_duration()
+            duration = sensor.get_current_duration()
             msg += f"🔴 Зараз йде відключення\n"
             msg += f"⏱ Тривалість: {format_duration(duration)}\n"
-            msg += f"🔌 Почалось о {monitor.last_outage_start.strftime('%H:%M')}\n\n"
+            msg += f"🔌 Почалось о {sensor.last_outage_start.strftime('%H:%M')}\n\n"
             msg += f"💡 Це перше відключення сьогодні"
         else:
-            msg += "Сьогодні ще не було відключень 🎉"
+            msg += "Сьогодні ще не було відключень 🎉"
+        return msg
+    
+    msg = "📊 <b>СТАТИСТИКА ЗА СЬОГОДНІ</b>\n\n"
+    msg += f"📈 Кількість відключень: <b>{stats['count']}</b>\n"
+    msg += f"⏱ Загальний час без світла: <b>{format_duration(stats['total'])}</b>\n"
+    msg += f"⌀ Середня тривалість: <b>{format_duration(stats['avg'])}</b>\n\n"
+    msg += f"⏰ Найдовше відключення:\n"
+    msg += f"   {stats['longest']['start'].strftime('%H:%M')} • {format_duration(stats['longest']['duration'])}\n\n"
+    msg += f"⚡ Найкоротше відключення:\n"
+    msg += f"   {stats['shortest']['start'].strftime('%H:%M')} • {format_duration(stats['shortest']['duration'])}"
+    return msg
+
+HISTORY_PAGE_SIZE = 20  # відключень на сторінці історії
+HISTORY_PICKER_DAYS = 7
+
+def render_history(sensor, day=None, page=0):
+    """Сторінка історії за добу: (текст, inline-клавіатура).
+
+    day — початок доби в секундах (None — сьогодні). Межі доби дає
+    index.span, тож рендеряться лише рядки сторінки, а не весь список;
+    підсумок доби — range_stats за O(log n).
+    """
+    now = to_seconds(datetime.now())
+    today = now // 86400 * 86400
+    day = today if day is None else min(day // 86400 * 86400, today)
+    lo, hi = day, day + 86400
+    i, j = sensor.index.span(lo, hi)
+
+    # Поточне відключення — останнім рядком доби, якщо воно її зачіпає
+    current = sensor.get_current_outage(from_seconds(lo))
+    if current and current.start_ts >= hi:
+        current = None
+    elif current:
+        current.end_ts = min(current.end_ts, hi)
+    count = j - i + (1 if current else 0)
+    pages = max(1, -(-count // HISTORY_PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+
+    title = "ІСТОРІЯ СЬОГОДНІ" if day == today else f"ІСТОРІЯ ЗА {from_seconds(day):%d.%m.%Y}"
+    if not count:
+        text = f"🕐 <b>{title}</b>\n\n" + ("Відключень ще не було 🎉" if day == today else "Відключень не було 🎉")
+        return text, history_keyboard(day, today, page, pages)
+
+    lines = [f"🕐 <b>{title}</b>\n"]
+    first = page * HISTORY_PAGE_SIZE
+    for n in range(first, min(first + HISTORY_PAGE_SIZE, count)):
+        if i + n < j:
+            outage, status = Outage(*sensor.index.clipped(i + n, lo, hi)), ""
+        else:
+            outage, status = current, " 🔴"
+        if status and current.end_ts < hi:
+            end = "зараз"
+        else:
+            end = "24:00" if outage.end_ts == hi else outage.end.strftime('%H:%M')
+        lines.append(f"{n + 1}. {outage.start:%H:%M} - {end} ({format_duration(outage.duration)}){status}")
+
+    stats = sensor.index.range_stats(lo, hi)
+    total = (stats['total'] if stats else 0) + (current.end_ts - current.start_ts if current else 0)
+    lines.append(f"\n⏱ <b>Всього без світла:</b> {format_duration(timedelta(seconds=total))}")
+    if pages > 1:
+        lines.append(f"📄 Сторінка {page + 1} з {pages}")
+    return "\n".join(lines), history_keyboard(day, today, page, pages)
+
+def history_keyboard(day, today, page, pages):
+    """Гортання сторінок, сусідні доби і вибір дня за останній тиждень.
+
+    callback_data: hist:<початок доби>:<сторінка>
+    """
+    rows = []
+    if pages > 1:
+        rows.append([
+            InlineKeyboardButton("◀️", callback_data=f'hist:{day}:{max(page - 1, 0)}'),
+            InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=f'hist:{day}:{page}'),
+            InlineKeyboardButton("▶️", callback_data=f'hist:{day}:{min(page + 1, pages - 1)}'),
+        ])
+    days = [InlineKeyboardButton(f"« {from_seconds(day - 86400):%d.%m}", callback_data=f'hist:{day - 86400}:0')]
+    if day < today:
+        days.append(InlineKeyboardButton(f"{from_seconds(day + 86400):%d.%m} »", callback_data=f'hist:{day + 86400}:0'))
+    rows.append(days)
+    picker = []
+    for n in range(HISTORY_PICKER_DAYS - 1, -1, -1):
+        other = today - n * 86400
+        label = WEEKDAYS[from_seconds(other).weekday()]
+        picker.append(InlineKeyboardButton(f"·{label}·" if other == day else label, callback_data=f'hist:{other}:0'))
+    rows.append(picker)
+    return InlineKeyboardMarkup(rows)
+
+PERIOD_TITLES = {
+    'day': ("ЗА СЬОГОДНІ", "сьогодні"),
+    'week': ("ЗА ТИЖДЕНЬ", "цього тижня"),
+    'month': ("ЗА МІСЯЦЬ", "цього місяця"),
+}
+
+def render_analytics(sensor, kind='day'):
+    """Текст аналітики за поточну добу, тиждень чи місяць (з ролапів)"""
+    title, period_name = PERIOD_TITLES[kind]
+    now = to_seconds(datetime.now())
+    current = to_seconds(sensor.last_outage_start) if not sensor.power_status and sensor.last_outage_start else None
+    lo, rollup = sensor.analytics.summary(kind, now, current)
+    
+    if not rollup.count:
+        msg = f"📈 <b>АНАЛІТИКА {title}</b>\n\n"
+        msg += "Недостатньо даних для аналізу.\n"
+        msg += "Потрібно хоча б одне відключення."
+        return msg
+    
+    msg = f"📈 <b>АНАЛІТИКА {title}</b>\n\n"
+    
+    # 1. Найгірша година дня
+    worst_hour = max(range(24), key=lambda hour: rollup.hours[hour])
+    
+    msg += f"🔴 <b>Найгірша година:</b>\n"
+    msg += f"   {worst_hour}:00 - {worst_hour+1}:00\n"
+    msg += f"   ({rollup.hours[worst_hour]} відключень)\n\n"
+    
+    # 2. Середній інтервал між відключеннями
+    if rollup.gap_count:
+        avg_interval = timedelta(seconds=rollup.gap_sum / rollup.gap_count)
+        msg += f"⏱ <b>Середній інтервал між відключеннями:</b>\n"
+        msg += f"   {format_duration(avg_interval)}\n\n"
+    
+    # 3. Процент часу без світла
+    total_time = timedelta(seconds=now - lo)
+    total_outage = timedelta(seconds=rollup.total)
+    
+    if total_time.total_seconds() > 0:
+        percent = (total_outage.total_seconds() / total_time.total_seconds()) * 100
+        msg += f"⚡ <b>Без світла {period_name}:</b>\n"
+        msg += f"   {percent:.1f}% часу\n"
+        msg += f"   ({format_duration(total_outage)} з {format_duration(total_time)})\n\n"
+    
+    # 4. Тренд
+    if rollup.count >= 6:
+        avg_recent = sum(rollup.last) / 3
+        avg_first = sum(rollup.first) / 3
+        
+        if avg_recent > avg_first:
+            trend = "📈 Відключення стають довшими"
+        elif avg_recent < avg_first:
+            trend = "📉 Відключення стають коротшими"
+        else:
+            trend = "➡️ Стабільна ситуація"
         
-        await update.message.reply_text(msg, parse_mode='HTML')
-        return
+        msg += f"<b>Тренд:</b> {trend}"
+    return msg
+
+WEEKDAYS = ('Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Нд')
+HEAT_LEVELS = ' ░▒▓█'
+
+def render_heatmap(sensor):
+    """Теплова карта відключень за годиною тижня і перцентилі тривалості"""
+    result = sensor.analytics.long_term(to_seconds(datetime.now()))
+    if not result['count']:
+        return "🗓 <b>КАРТА ВІДКЛЮЧЕНЬ</b>\n\nНедостатньо даних — ще не було жодного відключення."
     
-    msg = "📊 <b>СТАТИСТИКА ЗА СЬОГОДНІ</b>\n\n"
-    msg += f"📈 Кількість відключень: <b>{stats['count']}</b>\n"
-    msg += f"⏱ Загальний час без світла: <b>{format_duration(stats['total'])}</b>\n"
-    msg += f"⌀ Середня тривалість: <b>{format_duration(stats['avg'])}</b>\n\n"
-    msg += f"⏰ Найдовше відключення:\n"
-    msg += f"   {stats['longest']['start'].strftime('%H:%M')} • {format_duration(stats['longest']['duration'])}\n\n"
-    msg += f"⚡ Найкоротше відключення:\n"
-    msg += f"   {stats['shortest']['start'].strftime('%H:%M')} • {format_duration(stats['shortest']['duration'])}"
+    heatmap = result['heatmap']
+    levels = np.minimum((heatmap * len(HEAT_LEVELS)).astype(int), len(HEAT_LEVELS) - 1)
+    rows = ["    0     6     12    18    "]
+    for weekday in range(7):
+        rows.append(f"{WEEKDAYS[weekday]}  " + ''.join(HEAT_LEVELS[level] for level in levels[weekday]))
+    
+    msg = "🗓 <b>КАРТА ВІДКЛЮЧЕНЬ</b>\n"
+    msg += f"Ймовірність бути без світла за годиною тижня ({result['count']} відключень)\n\n"
+    msg += "<pre>" + "\n".join(rows) + "</pre>\n"
+    msg += f"<code>{HEAT_LEVELS.replace(' ', '·')}</code> — 0% … 100%\n\n"
     
+    worst = np.unravel_index(heatmap.argmax(), heatmap.shape)
+    msg += f"🔴 <b>Найгірший слот:</b> {WEEKDAYS[worst[0]]} {worst[1]}:00 ({heatmap[worst] * 100:.0f}%)\n\n"
+    
+    msg += "⏱ <b>Тривалість (p50 / p90 / p99):</b>\n"
+    for weekday in range(7):
+        if weekday in result['percentiles']:
+            count, (p50, p90, p99) = result['percentiles'][weekday]
+            msg += (f"{WEEKDAYS[weekday]}: {format_duration(timedelta(seconds=p50))} / "
+                    f"{format_duration(timedelta(seconds=p90))} / {format_duration(timedelta(seconds=p99))} ({count})\n")
+    return msg
+
+async def reply_view(update, view, render):
+    """Відповісти текстом виду з кешу монітора (рендер лише при зміні)"""
+    msg = monitor.render(view, render)
+    if CLOCK_MARK in msg:
+        msg = msg.replace(CLOCK_MARK, datetime.now().strftime('%H:%M:%S'))
     await update.message.reply_text(msg, parse_mode='HTML')
 
+@timed(HANDLER_SECONDS.labels('status'))
+async def show_status(update, context):
+    """Показати поточний статус"""
+    request_log.info("🔍 Перевірка статусу: power_status=%s", monitor.power_status)
+    await reply_view(update, 'status', render_status)
+
+@timed(HANDLER_SECONDS.labels('stats'))
+async def show_stats(update, context):
+    """Показати статистику"""
+    request_log.info("📊 Запит статистики...")
+    await reply_view(update, 'stats', render_stats)
+
+@timed(HANDLER_SECONDS.labels('history'))
 async def show_history(update, context):
     """Показати історію"""
-    print("🕐 Запит історії...")
-    outages = monitor.get_today_outages()
-    
-    # Додаємо поточне відключення якщо є
-    if not monitor.power_status and monitor.last_outage_start:
-        current = {
-            'start': monitor.last_outage_start,
-            'end': datetime.now(),
-            'duration': monitor.get_current_duration()
-        }
-        outages = outages + [current]
-        print(f"➕ Додано поточне відключення до історії")
-    
-    if not outages:
-        msg = "🕐 <b>ІСТОРІЯ СЬОГОДНІ</b>\n\n"
-        msg += "Відключень ще не було 🎉"
-    else:
-        msg = "🕐 <b>ІСТОРІЯ СЬОГОДНІ</b>\n\n"
-        for i, outage in enumerate(outages, 1):
-            start = outage['start'].strftime('%H:%M')
-            
-            if 'end' in outage and outage['end'] > outage['start']:
-                end = outage['end'].strftime('%H:%M')
-                status = ""
-            else:
-                end = "зараз"
-                status = " 🔴"
-            
-            duration = format_duration(outage['duration'])
-            msg += f"{i}. {start} - {end} ({duration}){status}\n"
-        
-        total = sum([o['duration'] for o in outages], timedelta(0))
-        msg += f"\n⏱ <b>Всього без світла:</b> {format_duration(total)}"
-    
-    await update.message.reply_text(msg, parse_mode='HTML')
+    request_log.info("🕐 Запит історії...")
+    text, markup = monitor.render(('history', None, 0), render_history)
+    await update.message.reply_text(text, parse_mode='HTML', reply_markup=markup)
+
+@timed(HANDLER_SECONDS.labels('history_page'))
+async def edit_history(query, day, page):
+    """Перегорнути історію в тому самому повідомленні"""
+    text, markup = monitor.render(('history', day, page), lambda sensor: render_history(sensor, day, page))
+    try:
+        await query.edit_message_text(text, parse_mode='HTML', reply_markup=markup)
+    except BadRequest as e:
+        # Натиснули поточну сторінку — нічого не змінилось
+        if 'not modified' not in str(e).lower():
+            raise
 
+@timed(HANDLER_SECONDS.labels('analytics'))
 async def show_analytics(update, context):
-    """Показати аналітику"""
-    print("📈 Запит аналітики...")
-    outages = monitor.get_today_outages()
-    
-    # Додаємо поточне якщо є
-    if not monitor.power_status and monitor.last_outage_start:
-        current = {
-            'start': monitor.last_outage_start,
-            'end': datetime.now(),
-            'duration': monitor.get_current_duration()
-        }
-        outages = outages + [current]
-    
-    if not outages:
-        msg = "📈 <b>АНАЛІТИКА</b>\n\n"
-        msg += "Недостатньо даних для аналізу.\n"
-        msg += "Потрібно хоча б одне відключення."
-    else:
-        msg = "📈 <b>АНАЛІТИКА</b>\n\n"
-        
-        # 1. Найгірша година дня
-        hours = [o['start'].hour for o in outages]
-        hour_counts = Counter(hours)
-        worst_hour = hour_counts.most_common(1)[0]
-        
-        msg += f"🔴 <b>Найгірша година:</b>\n"
-        msg += f"   {worst_hour[0]}:00 - {worst_hour[0]+1}:00\n"
-        msg += f"   ({worst_hour[1]} відключень)\n\n"
-        
-        # 2. Середній інтервал між відключеннями
-        if len(outages) > 1:
-            intervals = []
-            for i in range(1, len(outages)):
-                prev_end = outages[i-1]['start'] + outages[i-1]['duration']
-                curr_start = outages[i]['start']
-                interval = curr_start - prev_end
-                if interval.total_seconds() > 0:
-                    intervals.append(interval)
-            
-            if intervals:
-                avg_interval = sum(intervals, timedelta(0)) / len(intervals)
-                msg += f"⏱ <b>Середній інтервал між відключеннями:</b>\n"
-                msg += f"   {format_duration(avg_interval)}\n\n"
-        
-        # 3. Процент часу без світла
-        now = datetime.now()
-        day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        total_time = now - day_start
-        total_outage = sum([o['duration'] for o in outages], timedelta(0))
-        
-        if total_time.total_seconds() > 0:
-            percent = (total_outage.total_seconds() / total_time.total_seconds()) * 100
-            msg += f"⚡ <b>Без світла сьогодні:</b>\n"
-            msg += f"   {percent:.1f}% часу\n"
-            msg += f"   ({format_duration(total_outage)} з {format_duration(total_time)})\n\n"
-        
-        # 4. Тренд
-        if len(outages) >= 3:
-            recent_3 = outages[-3:]
-            avg_recent = sum([o['duration'] for o in recent_3], timedelta(0)) / 3
-            
-            if len(outages) >= 6:
-                first_3 = outages[:3]
-                avg_first = sum([o['duration'] for o in first_3], timedelta(0)) / 3
-                
-                if avg_recent > avg_first:
-                    trend = "📈 Відключення стають довшими"
-                elif avg_recent < avg_first:
-                    trend = "📉 Відключення стають коротшими"
-                else:
-                    trend = "➡️ Стабільна ситуація"
-                
-                msg += f"<b>Тренд:</b> {trend}"
-    
-    await update.message.reply_text(msg, parse_mode='HTML')
+    """Показати аналітику; /analytics week або /analytics month — за період"""
+    kind = 'day'
+    if context and context.args and context.args[0] in PERIODS:
+        kind = context.args[0]
+    request_log.info("📈 Запит аналітики (%s)...", kind)
+    await reply_view(update, f'analytics:{kind}', lambda sensor: render_analytics(sensor, kind))
+
+@timed(HANDLER_SECONDS.labels('heatmap'))
+async def show_heatmap(update, context):
+    """Показати теплову карту відключень"""
+    request_log.info("🗓 Запит карти відключень...")
+    await reply_view(update, 'heatmap', render_heatmap)
 
+def format_window(window, day=None):
+    """08:00–12:30; кінець опівночі — 24:00"""
+    start, end, level = window
+    mark = "🔴" if level == SLOT_OFF else "🟡"
+    start_text = from_seconds(start).strftime('%H:%M') if day is None or start >= day else "00:00"
+    end_text = "24:00" if day is not None and end >= day + 86400 else from_seconds(end).strftime('%H:%M')
+    return f"{mark} {start_text}–{end_text}"
+
+@timed(HANDLER_SECONDS.labels('schedule'))
 async def show_schedule(update, context):
-    """Показати графік ДТЕК"""
+    """Показати графік ДТЕК (з кешу фонового завантаження)"""
     msg = f"📅 <b>ГРАФИК ВІДКЛЮЧЕНЬ ДТЕК</b>\n\n"
     msg += f"🏠 Ваша група: <b>{DTEK_GROUP}</b>\n"
     msg += f"📍 Місто: <b>Київ</b>\n\n"
+    
+    schedule = schedule_fetcher.schedule
+    if schedule:
+        today = to_seconds(datetime.now()) // 86400 * 86400
+        for day, title in ((today, "Сьогодні"), (today + 86400, "Завтра")):
+            if day not in schedule.days:
+                continue
+            windows = schedule.day_windows(day)
+            msg += f"<b>{title}, {from_seconds(day).strftime('%d.%m')}:</b>\n"
+            if windows:
+                msg += "\n".join(format_window(window, day) for window in windows) + "\n\n"
+            else:
+                msg += "🟢 Відключень не заплановано\n\n"
+        msg += "🔴 — відключення, 🟡 — можливе відключення\n"
+        if schedule.updated:
+            msg += f"🕐 Оновлено ДТЕК: {schedule.updated}\n"
+        msg += "\n"
+    
     msg += f"🔗 Актуальний графік:\n"
     msg += f"https://www.dtek-krem.com.ua/ua/shutdowns\n\n"
     msg += f"💡 <b>Порада:</b> Збережіть посилання в закладки!"
     
     await update.message.reply_text(msg, parse_mode='HTML')
 
-async def show_forecast(update, context):
-    """Показати прогноз"""
-    print("🔔 Запит прогнозу...")
-    outages = monitor.get_today_outages()
-    
+def render_forecast(sensor):
+    """Прогноз наступного відключення з кешу моделі ризику"""
     msg = "🔔 <b>ПРОГНОЗ НАСТУПНОГО ВІДКЛЮЧЕННЯ</b>\n\n"
-    
-    if len(outages) >= 2:
-        # Розраховуємо середній інтервал
-        intervals = []
-        for i in range(1, len(outages)):
-            prev_end = outages[i-1]['start'] + outages[i-1]['duration']
-            curr_start = outages[i]['start']
-            interval = curr_start - prev_end
-            if interval.total_seconds() > 0:
-                intervals.append(interval)
-        
-        if intervals and monitor.power_status:
-            avg_interval = sum(intervals, timedelta(0)) / len(intervals)
-            last_end = outages[-1]['start'] + outages[-1]['duration']
-            predicted_next = last_end + avg_interval
-            
-            if predicted_next > datetime.now():
-                time_until = predicted_next - datetime.now()
-                msg += f"⏰ <b>Прогноз:</b>\n"
-                msg += f"Можливе відключення через:\n"
-                msg += f"<b>{format_duration(time_until)}</b>\n\n"
-                msg += f"📍 Приблизно о <b>{predicted_next.strftime('%H:%M')}</b>\n\n"
-                msg += f"📊 На основі {len(outages)} відключень\n"
-                msg += f"⌀ Інтервал: {format_duration(avg_interval)}\n\n"
-            else:
-                msg += f"⏰ За прогнозом вже мало б відключити.\n\n"
-            
-            msg += f"⚠️ <b>Увага:</b> Це лише прогноз!\n"
-            msg += f"Точний графік на сайті ДТЕК."
-        elif not monitor.power_status:
-            msg += f"🔴 Зараз немає світла.\n"
-            msg += f"Прогноз буде доступний після відновлення."
-        else:
-            msg += f"Недостатньо даних для точного прогнозу."
-    else:
+    if not sensor.power_status:
+        msg += f"🔴 Зараз немає світла.\n"
+        msg += f"Прогноз буде доступний після відновлення."
+        return msg
+    if len(sensor.index) < 2:
         msg += f"Недостатньо даних для прогнозу.\n"
         msg += f"Потрібно мінімум 2 відключення.\n\n"
         msg += f"📅 Дивіться графік ДТЕК у відповідному розділі."
+        return msg
     
-    await update.message.reply_text(msg, parse_mode='HTML')
+    now = to_seconds(datetime.now())
+    forecast = sensor.forecast.predict(now)
+    if forecast is None:
+        return msg + "Недостатньо даних для точного прогнозу."
+    
+    if forecast['next'] is not None:
+        predicted_next = from_seconds(forecast['next'])
+        msg += f"⏰ <b>Прогноз:</b>\n"
+        msg += f"Можливе відключення через:\n"
+        msg += f"<b>{format_duration(predicted_next - from_seconds(now))}</b>\n\n"
+        msg += f"📍 Приблизно о <b>{predicted_next.strftime('%H:%M')}</b>"
+        if predicted_next.date() != from_seconds(now).date():
+            msg += f" ({predicted_next.strftime('%d.%m')})"
+        msg += "\n\n"
+    else:
+        msg += f"⏰ Найближчим тижнем відключення малоймовірне.\n\n"
+    
+    msg += f"📊 <b>Ймовірність відключення:</b>\n"
+    msg += f"• протягом години: {forecast['p1'] * 100:.0f}%\n"
+    msg += f"• протягом 3 годин: {forecast['p3'] * 100:.0f}%\n"
+    msg += f"• протягом доби: {forecast['p24'] * 100:.0f}%\n\n"
+    msg += f"📚 На основі {len(sensor.index)} відключень ({forecast['weeks']} повних тижнів)\n\n"
+    
+    schedule = schedule_fetcher.schedule if sensor.group == schedule_fetcher.group else None
+    window = schedule.next_window(now) if schedule else None
+    if window:
+        msg += f"📅 <b>За графіком ДТЕК:</b> {format_window(window)}"
+        if from_seconds(window[0]).date() != from_seconds(now).date():
+            msg += f" ({from_seconds(window[0]).strftime('%d.%m')})"
+        msg += "\n\n"
+    msg += f"⚠️ <b>Увага:</b> Це лише прогноз!\n"
+    msg += f"Точний графік на сайті ДТЕК."
+    return msg
+
+@timed(HANDLER_SECONDS.labels('forecast'))
+async def show_forecast(update, context):
+    """Показати прогноз"""
+    request_log.info("🔔 Запит прогнозу...")
+    if monitor.power_status and len(monitor.index) >= 2 and monitor.forecast.predict(to_seconds(datetime.now())) is None:
+        # Модель ще не навчена або застаріла — навчаємо, не блокуючи інші апдейти
+        await fit_forecast(monitor)
+    await reply_view(update, 'forecast', render_forecast)
+
+def subscriptions_message(chat_id):
+    groups = subscribers.groups_of(chat_id)
+    msg = "🔔 <b>ПІДПИСКА НА СПОВІЩЕННЯ</b>\n\n"
+    if groups:
+        msg += f"Ви отримуєте сповіщення для груп: <b>{', '.join(sorted(groups))}</b>\n\n"
+    else:
+        msg += "Ви ще не підписані на жодну групу.\n\n"
+    msg += "Оберіть групу нижче або /subscribe &lt;група&gt;"
+    return msg
+
+@timed(HANDLER_SECONDS.labels('subscriptions'))
+async def show_subscriptions(update, context):
+    """Показати підписки чату з кнопками"""
+    chat_id = update.effective_chat.id
+    await update.message.reply_text(subscriptions_message(chat_id), parse_mode='HTML',
+                                    reply_markup=get_subscription_menu(chat_id))
+
+async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /subscribe [група]"""
+    group = context.args[0] if context.args else DTEK_GROUP
+    if group not in registry.groups:
+        known = ', '.join(sorted(registry.groups))
+        await update.message.reply_text(f"❓ Невідома група <b>{group}</b>.\nДоступні: {known}", parse_mode='HTML')
+        return
+    if subscribers.subscribe(update.effective_chat.id, group):
+        log.info("🔔 Чат %s підписався на групу %s", update.effective_chat.id, group)
+        await update.message.reply_text(f"✅ Ви підписані на сповіщення для групи <b>{group}</b>", parse_mode='HTML')
+    else:
+        await update.message.reply_text(f"Ви вже підписані на групу <b>{group}</b>", parse_mode='HTML')
+
+async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /unsubscribe [група] — без групи відписує від усіх"""
+    group = context.args[0] if context.args else None
+    if subscribers.unsubscribe(update.effective_chat.id, group):
+        log.info("🔕 Чат %s відписався від %s", update.effective_chat.id, group or 'всіх груп')
+        await update.message.reply_text(f"🔕 Підписку {'на групу <b>' + group + '</b> ' if group else ''}скасовано", parse_mode='HTML')
+    else:
+        await update.message.reply_text("Підписки не знайдено")
 
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обробник inline кнопок"""
     query = update.callback_query
     await query.answer()
     
+    if query.data.startswith(('sub:', 'unsub:')):
+        action, group = query.data.split(':', 1)
+        chat_id = query.message.chat.id
+        if action == 'sub' and group in registry.groups:
+            subscribers.subscribe(chat_id, group)
+        elif action == 'unsub':
+            subscribers.unsubscribe(chat_id, group)
+        await query.edit_message_text(subscriptions_message(chat_id), parse_mode='HTML',
+                                      reply_markup=get_subscription_menu(chat_id))
+        return
+    
+    if query.data.startswith('chart:'):
+        await show_chart(update, context, query.data.split(':', 1)[1])
+        return
+    
+    if query.data.startswith('hist:'):
+        try:
+            day, page = map(int, query.data.split(':')[1:])
+        except ValueError:
+            return
+        await edit_history(query, day, page)
+        return
+    
     # Просто відповідаємо текстом, бо в нас є постійне меню
     if query.data == 'status':
         await query.message.reply_text("Використовуйте кнопку '⚡ Статус' знизу")
     elif query.data == 'stats':
         await query.message.reply_text("Використовуйте кнопку '📊 Статистика' знизу")
     elif query.data == 'history':
-        await query.message.reply_text("Використовуйте кнопку '🕐 Історія' знизу")
+        text, markup = monitor.render(('history', None, 0), render_history)
+        await query.message.reply_text(text, parse_mode='HTML', reply_markup=markup)
     elif query.data == 'analytics':
         await query.message.reply_text("Використовуйте кнопку '📈 Аналітика' знизу")
 
+# ========== ГРАФІКИ ==========
+
+def draw_timeline(title, rows):
+    """PNG зі смугами світла і відключень, по рядку на добу.
+
+    rows — [(підпис, скільки секунд доби вже минуло, [(початок, кінець)])],
+    зміщення від початку доби. Виконується в процесі пулу, тому приймає
+    і повертає лише прості дані.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+    width, left, right, top, row_height, gap = 960, 64, 64, 44, 28, 10
+    height = top + len(rows) * (row_height + gap) + 4
+    scale = (width - left - right) / 86400
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=14)
+    draw.text((left, 4), title, fill='#222222', font=font)
+    for hour in range(0, 25, 3):
+        x = left + hour * 3600 * scale
+        draw.line([(x, top - 4), (x, height - 4)], fill='#dddddd')
+        draw.text((x, top - 6), str(hour), fill='#888888', font=font, anchor='mb')
+    for row, (label, elapsed, outages) in enumerate(rows):
+        y = top + row * (row_height + gap)
+        draw.text((4, y + row_height / 2), label, fill='#222222', font=font, anchor='lm')
+        # Світло — до «зараз», далі сіре майбутнє; відключення поверх
+        draw.rectangle([left, y, width - right, y + row_height], fill='#eeeeee')
+        if elapsed:
+            draw.rectangle([left, y, left + elapsed * scale, y + row_height], fill='#43a047')
+        downtime = 0
+        for start, end in outages:
+            draw.rectangle([left + start * scale, y, left + max(end * scale, start * scale + 1), y + row_height], fill='#e53935')
+            downtime += end - start
+        draw.text((width - right + 6, y + row_height / 2), f"{downtime // 3600}:{downtime % 3600 // 60:02d}",
+                  fill='#e53935' if downtime else '#888888', font=font, anchor='lm')
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+def chart_data(sensor, kind, now):
+    """Межі, рядки для draw_timeline і підпис графіка за день або тиждень"""
+    today = now // 86400 * 86400
+    days = [today] if kind == 'day' else [today - 86400 * n for n in range(6, -1, -1)]
+    lo, hi = days[0], days[-1] + 86400
+    starts, ends = sensor.get_columns(from_seconds(lo), from_seconds(hi))
+    ends = np.minimum(ends, now)
+    rows = []
+    for day in days:
+        mask = (ends > day) & (starts < day + 86400)
+        day_starts = np.maximum(starts[mask], day) - day
+        day_ends = np.minimum(ends[mask], day + 86400) - day
+        rows.append((from_seconds(day).strftime('%d.%m'), int(min(86400, max(0, now - day))),
+                     list(zip(day_starts.tolist(), day_ends.tolist()))))
+    if kind == 'day':
+        title = from_seconds(lo).strftime('%d.%m.%Y')
+        caption = f"📉 <b>Графік дня</b> {from_seconds(lo).strftime('%d.%m')}"
+    else:
+        title = f"{from_seconds(lo).strftime('%d.%m')} - {from_seconds(hi - 1).strftime('%d.%m.%Y')}"
+        caption = f"📉 <b>Графік тижня</b> {from_seconds(lo).strftime('%d.%m')}–{from_seconds(hi - 1).strftime('%d.%m')}"
+    total = int((ends - starts).clip(min=0).sum())
+    caption += f"\n🔴 Відключень: {len(starts)}, без світла {format_duration(timedelta(seconds=total))}"
+    return (lo, hi), title, rows, caption
+
+class ChartCache:
+    """LRU готових графіків з обмеженням за розміром у байтах.
+
+    Після першої відправки зберігаємо file_id від Telegram і відпускаємо
+    байти PNG: повторний запит того самого графіка відправляє вже
+    завантажене фото. Поки графік малюється, інші запити на нього
+    чекають той самий future.
+    """
+    def __init__(self, max_bytes=CHART_CACHE_BYTES, max_entries=1024):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # ключ -> [png або None, file_id або None, підпис]
+        self.size = 0
+        self.rendering = {}           # ключ -> future малювання
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, png, caption):
+        self.entries[key] = [png, None, caption]
+        self.size += len(png)
+        while self.entries and (self.size > self.max_bytes or len(self.entries) > self.max_entries):
+            _, (old_png, _, _) = self.entries.popitem(last=False)
+            self.size -= len(old_png or b'')
+
+    def set_file_id(self, key, file_id):
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] is not None:
+            self.size -= len(entry[0])
+            entry[0], entry[1] = None, file_id
+
+chart_cache = ChartCache()
+_chart_pool = None
+
+def get_chart_pool():
+    """Пул процесів для малювання (spawn — без копії потоків і стану бота)"""
+    global _chart_pool
+    if _chart_pool is None:
+        _chart_pool = ProcessPoolExecutor(CHART_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _chart_pool
+
+def shutdown_chart_pool():
+    global _chart_pool
+    if _chart_pool is not None:
+        _chart_pool.shutdown(wait=False, cancel_futures=True)
+        _chart_pool = None
+
+async def get_chart(sensor, kind):
+    """Ключ і запис кешу графіка; малює в пулі процесів, якщо в кеші немає"""
+    now = to_seconds(datetime.now())
+    (lo, hi), title, rows, caption = chart_data(sensor, kind, now)
+    # Графік із «зараз» застаріває з часом, минулі — лише зі зміною історії
+    key = (sensor.sensor_id, kind, lo, sensor.version, now // CHART_REFRESH if now < hi else None)
+    entry = chart_cache.get(key)
+    if entry is not None:
+        chart_cache.hits += 1
+        return key, entry
+    future = chart_cache.rendering.get(key)
+    if future is None:
+        chart_cache.misses += 1
+        future = asyncio.get_running_loop().run_in_executor(get_chart_pool(), draw_timeline, title, rows)
+        chart_cache.rendering[key] = future
+        try:
+            png = await future
+        finally:
+            chart_cache.rendering.pop(key, None)
+        chart_cache.put(key, png, caption)
+        return key, chart_cache.get(key) or [png, None, caption]
+    png = await future
+    return key, chart_cache.get(key) or [png, None, caption]
+
+def get_chart_menu(kind):
+    other = 'week' if kind == 'day' else 'day'
+    title = "📅 Тиждень" if other == 'week' else "📉 Сьогодні"
+    return InlineKeyboardMarkup([[InlineKeyboardButton(title, callback_data=f'chart:{other}')]])
+
+@timed(HANDLER_SECONDS.labels('chart'))
+async def show_chart(update, context, kind=None):
+    """Графік світла за день (/chart) або тиждень (/chart week)"""
+    if kind is None:
+        kind = 'week' if context and context.args and context.args[0] == 'week' else 'day'
+    request_log.info("📉 Запит графіка (%s)...", kind)
+    message = update.effective_message
+    try:
+        key, (png, file_id, caption) = await get_chart(monitor, kind)
+    except Exception as e:
+        log.warning("⚠️ Графік не намальовано: %s: %s", type(e).__name__, e)
+        await message.reply_text("⚠️ Не вдалося намалювати графік. Спробуйте «🕐 Історія».")
+        return
+    sent = await message.reply_photo(photo=file_id or png, caption=caption, parse_mode='HTML',
+                                     reply_markup=get_chart_menu(kind))
+    if file_id is None and sent.photo:
+        chart_cache.set_file_id(key, sent.photo[-1].file_id)
+
+# ========== СПОВІЩЕННЯ ==========
+
+class TokenBucket:
+    """Token bucket: rate токенів за секунду, не більше burst у запасі"""
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        # updated може бути в майбутньому, поки діє retry_after
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now):
+        """Скільки секунд чекати до наступного токена (0 — можна зараз)"""
+        self._refill(now)
+        if self.tokens >= 1 and now >= self.updated:
+            return 0
+        return max(0, self.updated - now) + max(0, 1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.burst
+
+    def pause(self, seconds):
+        """Не видавати токенів найближчі seconds секунд (RetryAfter)"""
+        self.tokens = 0
+        self.updated = max(self.updated, time.monotonic() + seconds)
+
+def retry_after_seconds(error):
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+class Notifier:
+    """Черга вихідних повідомлень у Telegram.
+
+    Вебхук лише ставить повідомлення в чергу і одразу відповідає.
+    Воркери відправляють з урахуванням загального і поканального лімітів
+    Telegram, чекають retry_after при 429 і повторюють при мережевих
+    помилках. Повідомлення з тим самим ключем, ще не відправлене,
+    замінюється новішим. Один чат обслуговує лише один воркер, тож
+    порядок повідомлень у чаті зберігається.
+
+    Кількість воркерів — межа одночасних запитів до Telegram при
+    розсилці; чат, що чекає свого ліміту, воркера не займає. Помилка
+    одного чату не зачіпає інших, а чати, що заблокували бота,
+    передаються в on_forbidden.
+    """
+    def __init__(self, bot, workers=NOTIFY_WORKERS, global_rate=TG_GLOBAL_RATE, chat_rate=TG_CHAT_RATE):
+        self.bot = bot
+        self.workers = workers
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_buckets = {}
+        self.pending = {}      # chat_id -> OrderedDict(ключ -> (kwargs, спроба))
+        self.scheduled = set() # чати в ready або в роботі у воркера
+        self.ready = asyncio.Queue()
+        self.tasks = []
+        self.depth = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.on_forbidden = None
+
+    def notify(self, chat_id, text, key=None, **kwargs):
+        """Поставити повідомлення в чергу; не блокує"""
+        messages = self.pending.setdefault(chat_id, OrderedDict())
+        if key is None:
+            key = object()
+        if key in messages:
+            self.coalesced += 1
+        else:
+            self.depth += 1
+        messages[key] = (dict(kwargs, chat_id=chat_id, text=text), 0)
+        self._schedule(chat_id)
+
+    def broadcast(self, chat_ids, text, key=None, **kwargs):
+        """Поставити одне повідомлення в чергу кожному чату"""
+        for chat_id in chat_ids:
+            self.notify(chat_id, text, key=key, **kwargs)
+        return len(chat_ids)
+
+    def _schedule(self, chat_id):
+        if chat_id not in self.scheduled:
+            self.scheduled.add(chat_id)
+            self.ready.put_nowait(chat_id)
+
+    def stats(self):
+        return {
+            'depth': self.depth,
+            'chats': len(self.scheduled),
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'failed': self.failed,
+        }
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout=10):
+        """Дочекатися відправки черги (не довше timeout) і зупинити воркерів"""
+        deadline = time.monotonic() + timeout
+        while self.depth and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def _acquire(self, bucket):
+        while True:
+            delay = bucket.delay(time.monotonic())
+            if not delay:
+                bucket.take()
+                return
+            await asyncio.sleep(delay)
+
+    async def _worker(self):
+        while True:
+            chat_id = await self.ready.get()
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+            delay = bucket.delay(time.monotonic())
+            if delay:
+                # Чат ще не може отримувати (ліміт чату, retry_after) — повернемо
+                # його в чергу пізніше, а воркер тим часом обслуговує інші чати
+                asyncio.get_running_loop().call_later(delay, self.ready.put_nowait, chat_id)
+                continue
+            bucket.take()
+            try:
+                await self._send_next(chat_id)
+            except Exception as e:
+                log.exception("⚠️ Черга сповіщень: %s", e)
+            finally:
+                if self.pending.get(chat_id):
+                    # У чаті ще є повідомлення — в кінець черги, щоб не блокувати інші чати
+                    self.ready.put_nowait(chat_id)
+                else:
+                    self.scheduled.discard(chat_id)
+                    self.pending.pop(chat_id, None)
+                    bucket = self.chat_buckets.get(chat_id)
+                    if bucket and bucket.is_full(time.monotonic()):
+                        del self.chat_buckets[chat_id]
+
+    async def _send_next(self, chat_id):
+        """Відправити перше повідомлення чату; токен чату воркер уже взяв"""
+        bucket = self.chat_buckets[chat_id]
+        await self._acquire(self.global_bucket)
+
+        # Беремо повідомлення лише зараз — поки чекали, його могли замінити новішим
+        messages = self.pending[chat_id]
+        key, (kwargs, attempt) = messages.popitem(last=False)
+        started = time.perf_counter()
+        try:
+            await self.bot.send_message(**kwargs)
+            SEND_SECONDS.observe(time.perf_counter() - started)
+            self.sent += 1
+            self.depth -= 1
+        except RetryAfter as e:
+            TELEGRAM_ERRORS.labels('RetryAfter').inc()
+            seconds = retry_after_seconds(e)
+            log.warning("⏳ Telegram просить зачекати %.0f с", seconds)
+            bucket.pause(seconds)
+            self.global_bucket.pause(seconds)
+            self._retry(messages, key, kwargs, attempt)
+        except (Forbidden, BadRequest) as e:
+            log.warning("⚠️ Повідомлення в %s відхилено: %s", chat_id, e)
+            TELEGRAM_ERRORS.labels(type(e).__name__).inc()
+            self.failed += 1
+            self.depth -= 1
+            if self.on_forbidden and (isinstance(e, Forbidden) or 'chat not found' in str(e).lower()):
+                self.on_forbidden(chat_id)
+        except NetworkError as e:
+            log.warning("⚠️ Мережева помилка Telegram: %s", e)
+            TELEGRAM_ERRORS.labels(type(e).__name__).inc()
+            bucket.pause(min(2 ** attempt, 60))
+            self._retry(messages, key, kwargs, attempt)
+        except TelegramError as e:
+            # Conflict, InvalidToken тощо — повтор не допоможе
+            log.warning("⚠️ Помилка Telegram для %s: %s", chat_id, e)
+            TELEGRAM_ERRORS.labels(type(e).__name__).inc()
+            self.failed += 1
+            self.depth -= 1
+        except Exception as e:
+            log.exception("⚠️ Повідомлення в %s не відправлено: %s", chat_id, e)
+            TELEGRAM_ERRORS.labels(type(e).__name__).inc()
+            self.failed += 1
+            self.depth -= 1
+
+    def _retry(self, messages, key, kwargs, attempt):
+        if key in messages:
+            # Поки відправляли, прийшло новіше — старе вже не потрібне
+            self.depth -= 1
+        elif attempt + 1 >= NOTIFY_MAX_ATTEMPTS:
+            log.warning("⚠️ Повідомлення в %s не відправлено після %d спроб", kwargs['chat_id'], attempt + 1)
+            self.failed += 1
+            self.depth -= 1
+        else:
+            messages[key] = (kwargs, attempt + 1)
+            messages.move_to_end(key, last=False)
+
 # ========== ВЕБХУКИ ==========
 
-async def webhook_power_lost(request):
-    """Світло зникло"""
-    print("🔴 ВЕБХУК: Світло зникло")
-    monitor.power_lost()
-    
-    app_bot = request.app['bot_app']
-    now = datetime.now()
-    
+def resolve_sensor(request):
+    """Монітор сенсора з маршруту; старі маршрути без ID — основний сенсор"""
+    sensor_id = request.match_info.get('sensor_id', DEFAULT_SENSOR)
+    sensor = registry.resolve(sensor_id, request.query.get('group'))
+    if sensor is None:
+        raise web.HTTPNotFound(text=f"Unknown sensor: {sensor_id}")
+    return sensor
+
+def sensor_header(sensor):
+    """Рядки про групу і сенсор для повідомлень вебхуків"""
+    msg = f"🏠 Група: <b>{sensor.group}</b>\n"
+    if sensor.sensor_id != DEFAULT_SENSOR:
+        msg += f"📟 Сенсор: <b>{sensor.sensor_id}</b>\n"
+    return msg
+
+def power_lost_message(sensor, at):
+    """Повідомлення «світло зникло»"""
     msg = "🔴 <b>СВІТЛО ЗНИКЛО!</b>\n\n"
-    msg += f"⏰ Час: {now.strftime('%H:%M:%S')}\n"
-    msg += f"📅 Дата: {now.strftime('%d.%m.%Y')}\n"
-    msg += f"🏠 Група: <b>{DTEK_GROUP}</b>\n\n"
+    msg += f"⏰ Час: {at.strftime('%H:%M:%S')}\n"
+    msg += f"📅 Дата: {at.strftime('%d.%m.%Y')}\n"
+    msg += sensor_header(sensor) + "\n"
     
-    today_count = len(monitor.get_today_outages())
+    today_stats = sensor.get_today_stats()
+    today_count = today_stats['count'] if today_stats else 0
     if today_count > 0:
         msg += f"📊 Це {today_count + 1}-е відключення сьогодні"
     else:
         msg += f"📊 Перше відключення сьогодні"
-    
-    await app_bot.bot.send_message(
-        chat_id=CHAT_ID,
-        text=msg,
-        parse_mode='HTML'
-    )
-    
-    return web.Response(text="OK")
+    return msg
 
-async def webhook_power_restored(request):
-    """Світло з'явилось"""
-    print("🟢 ВЕБХУК: Світло з'явилось")
-    duration = monitor.get_current_duration()
-    monitor.power_restored()
-    
-    app_bot = request.app['bot_app']
-    now = datetime.now()
-    
+def power_restored_message(sensor, outage):
+    """Повідомлення «світло з'явилось» про завершене відключення"""
     msg = "🟢 <b>СВІТЛО З'ЯВИЛОСЬ!</b>\n\n"
-    msg += f"⏰ Час: {now.strftime('%H:%M:%S')}\n"
-    msg += f"📅 Дата: {now.strftime('%d.%m.%Y')}\n\n"
+    msg += f"⏰ Час: {outage.end.strftime('%H:%M:%S')}\n"
+    msg += f"📅 Дата: {outage.end.strftime('%d.%m.%Y')}\n"
+    if sensor.sensor_id != DEFAULT_SENSOR:
+        msg += sensor_header(sensor)
+    msg += "\n"
     
-    if duration.total_seconds() > 0:
+    if outage.duration.total_seconds() > 0:
         msg += f"⏱ <b>Тривалість відключення:</b>\n"
-        msg += f"   {format_duration(duration)}\n\n"
+        msg += f"   {format_duration(outage.duration)}\n\n"
     
-    today_outages = monitor.get_today_outages()
-    if today_outages:
-        total_duration = sum([o['duration'] for o in today_outages], timedelta(0))
+    today_stats = sensor.get_today_stats()
+    if today_stats:
         msg += f"📊 <b>Сьогодні:</b>\n"
-        msg += f"   Відключень: {len(today_outages)}\n"
-        msg += f"   Без світла: {format_duration(total_duration)}"
-    
-    await app_bot.bot.send_message(
-        chat_id=CHAT_ID,
-        text=msg,
-        parse_mode='HTML'
-    )
-    
-    return web.Response(text="OK")
+        msg += f"   Відключень: {today_stats['count']}\n"
+        msg += f"   Без світла: {format_duration(today_stats['total'])}"
+    return msg
+
+def event_key(request):
+    """Ключ ідемпотентності події від сенсора, якщо він є"""
+    return request.headers.get('Idempotency-Key') or request.query.get('id')
+
+def apply_power_event(app, sensor, kind, at, key=None, source='webhook'):
+    """Провести подію через автомат сенсора і поставити сповіщення в чергу"""
+    actions = sensor.events.feed(kind, at, key)
+    EVENTS_TOTAL.labels(source, actions[-1][0]).inc()
+    dispatch_actions(app, sensor, actions)
+    return actions
+
+def dispatch_actions(app, sensor, actions, notify=True):
+    """Сповіщення і таймери для дій автомата; notify=False — лише таймери"""
+    machine = sensor.events
+    for action, payload in actions:
+        if action == 'lost' and notify:
+            broadcast_power(app, sensor, power_lost_message(sensor, payload))
+        elif action == 'restored' and payload and notify and not machine.quiet:
+            broadcast_power(app, sensor, power_restored_message(sensor, payload))
+        if action == 'restored' and payload:
+            machine.quiet = False
+            schedule_forecast_refit(app, sensor)
+        elif action == 'pending':
+            machine.quiet = not notify
+            schedule_restore(app, sensor)
+        elif action == 'merged':
+            machine.quiet = False
+            if machine.timer:
+                machine.timer.cancel()
+                machine.timer = None
+
+def broadcast_power(app, sensor, text):
+    """Сповістити підписників групи сенсора; новіше повідомлення про той
+    самий сенсор замінює ще не відправлене"""
+    deliver(app, sensor.group, sensor.sensor_id, text)
+
+def deliver(app, group, sensor_id, text):
+    """Сповіщення групі (None — лише адмін-чату).
+
+    Повідомлення про сенсор замінює ще не відправлене про той самий
+    сенсор; без sensor_id (підсумки пакетів) нічого не замінюється.
+    З кількома екземплярами відправляє лише лідер: решта передає
+    повідомлення йому через outbox.
+    """
+    if state_store and not state_store.is_leader:
+        state_store.enqueue(group, sensor_id, text)
+    elif group is None:
+        app['notifier'].notify(CHAT_ID, text, parse_mode='HTML')
+    else:
+        app['notifier'].broadcast(subscribers.recipients(group), text,
+                                  key=('power', sensor_id) if sensor_id else None, parse_mode='HTML')
+
+def schedule_restore(app, sensor):
+    """Підтвердити відновлення через FLAP_WINDOW, якщо світло не зникне знову"""
+    machine = sensor.events
+    if machine.timer:
+        machine.timer.cancel()
+    machine.timer = asyncio.get_running_loop().call_later(
+        machine.window.total_seconds(), confirm_restore, app, sensor)
+
+def confirm_restore(app, sensor):
+    machine = sensor.events
+    machine.timer = None
+    quiet, machine.quiet = machine.quiet, False
+    outage = machine.confirm()
+    if outage:
+        if not quiet:
+            broadcast_power(app, sensor, power_restored_message(sensor, outage))
+        schedule_forecast_refit(app, sensor)
+
+def schedule_forecast_refit(app, sensor):
+    """Перенавчити прогноз у фоні після відключення (серія подій — одне навчання).
+
+    Лише для сенсорів, чий прогноз уже запитували: решта навчиться при
+    першому запиті.
+    """
+    bot_app = app.get('bot_app')
+    if not bot_app or not bot_app.job_queue:
+        return
+    if sensor.forecast.model is None or sensor.forecast.refit_scheduled:
+        return
+    sensor.forecast.refit_scheduled = True
+    bot_app.job_queue.run_once(forecast_refit_task, FORECAST_REFIT_DELAY, data=sensor)
+
+async def webhook_power_lost(request):
+    """Світло зникло"""
+    sensor = resolve_sensor(request)
+    request_log.info("🔴 ВЕБХУК: Світло зникло (%s)", sensor.sensor_id, extra={'sensor': sensor.sensor_id})
+    actions = apply_power_event(request.app, sensor, 'lost', datetime.now(), event_key(request))
+    return web.Response(text="OK" if actions[-1][0] not in ('duplicate', 'stale') else f"OK ({actions[-1][0]})")
+
+async def webhook_power_restored(request):
+    """Світло з'явилось"""
+    sensor = resolve_sensor(request)
+    request_log.info("🟢 ВЕБХУК: Світло з'явилось (%s)", sensor.sensor_id, extra={'sensor': sensor.sensor_id})
+    actions = apply_power_event(request.app, sensor, 'restored', datetime.now(), event_key(request))
+    return web.Response(text="OK" if actions[-1][0] not in ('duplicate', 'stale') else f"OK ({actions[-1][0]})")
+
+# ========== ПАКЕТИ ПОДІЙ ==========
+
+EVENT_KINDS = {
+    'power_lost': 'lost', 'lost': 'lost',
+    'power_restored': 'restored', 'restored': 'restored',
+}
+
+def parse_event_time(value):
+    """Час події: unix-секунди або ISO 8601 -> наївний локальний datetime"""
+    if isinstance(value, bool):
+        raise TypeError(value)
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    at = datetime.fromisoformat(value)
+    if at.tzinfo:
+        at = at.astimezone().replace(tzinfo=None)
+    return at
+
+async def read_ndjson_events(request, default_sensor):
+    """Потоково розібрати NDJSON з тіла запиту.
+
+    Повертає ({sensor_id: [(час, номер, подія, ключ)]}, кількість битих рядків).
+    Події з майбутнього (далі за EVENT_CLOCK_SKEW) теж биті: інакше вони
+    зсунули б горизонт автомата і всі справжні події після них здавались би
+    застарілими.
+    """
+    events = {}
+    invalid = 0
+    count = 0
+    latest = datetime.now() + timedelta(seconds=EVENT_CLOCK_SKEW)
+    async for line in request.content:
+        line = line.strip()
+        if not line:
+            continue
+        count += 1
+        if count > MAX_BATCH_EVENTS:
+            raise web.HTTPBadRequest(text=f"Too many events, max {MAX_BATCH_EVENTS}")
+        try:
+            item = json.loads(line)
+            kind = EVENT_KINDS[item['event']]
+            at = parse_event_time(item['ts'])
+            sensor_id = str(item.get('sensor') or default_sensor)
+            key = item.get('id')
+            if at > latest:
+                raise ValueError(f"подія з майбутнього: {at}")
+        except (ValueError, KeyError, TypeError, AttributeError, OverflowError, OSError):
+            # OverflowError/OSError — час поза межами datetime ("ts": 1e20, Infinity)
+            invalid += 1
+            continue
+        events.setdefault(sensor_id, []).append((at, count, kind, None if key is None else str(key)))
+    return events, invalid
+
+def ingest_events(sensor, events, now):
+    """Застосувати пакет подій сенсора за один прохід.
+
+    Події сортуються за часом сенсора. Ті, що старші за останній відомий
+    перехід стану, стають завершеними відключеннями в історії (масова
+    вставка); новіші проходять через автомат як звичайні вебхуки.
+    """
+    machine = sensor.events
+    horizon = machine.horizon()
+    summary = {'events': len(events), 'duplicates': 0, 'outages': 0, 'actions': []}
+    starts, ends = [], []
+    open_start = None
+    live = []
+    for at, _, kind, key in sorted(events):
+        if machine.is_duplicate(key):
+            summary['duplicates'] += 1
+        elif horizon is not None and at < horizon:
+            if kind == 'lost' and open_start is None:
+                open_start = at
+            elif kind == 'restored' and open_start is not None:
+                starts.append(to_seconds(open_start))
+                ends.append(to_seconds(at))
+                open_start = None
+        else:
+            if open_start is not None:
+                # Відключення почалось до горизонту і триває після нього
+                live.append(('lost', horizon))
+                open_start = None
+            live.append((kind, at))
+    if open_start is not None:
+        live.append(('lost', horizon))
+
+    EVENTS_TOTAL.labels('batch', 'duplicate').inc(summary['duplicates'])
+    EVENTS_TOTAL.labels('batch', 'accepted').inc(len(events) - summary['duplicates'])
+    summary['outages'] = sensor.add_outages(starts, ends)
+    for kind, at in live:
+        summary['actions'] += machine.feed(kind, at)
+    summary['actions'] += machine.flush(now)
+    summary['outages'] += sum(1 for action, payload in summary['actions'] if action == 'restored' and payload)
+    return summary
+
+def batch_summary_message(results):
+    """Підсумкове повідомлення пакета для однієї групи"""
+    msg = "📦 <b>ПАКЕТ ПОДІЙ ВІД СЕНСОРІВ</b>\n\n"
+    for sensor, summary in results[:BATCH_SUMMARY_LINES]:
+        # Відновлення, що чекає підтвердження, окремо вже не оголошується
+        status = "🟢" if sensor.power_status or sensor.events.pending_restore is not None else "🔴"
+        msg += f"{status} <b>{sensor.sensor_id}</b> ({sensor.group}): "
+        msg += f"подій {summary['events']}, нових відключень {summary['outages']}\n"
+    if len(results) > BATCH_SUMMARY_LINES:
+        msg += f"… і ще {len(results) - BATCH_SUMMARY_LINES} сенсорів\n"
+    return msg
+
+async def webhook_events(request):
+    """Пакет подій у форматі NDJSON: {"event", "ts", "id"?, "sensor"?} на рядок"""
+    default_sensor = request.match_info.get('sensor_id', DEFAULT_SENSOR)
+    events, invalid = await read_ndjson_events(request, default_sensor)
+    now = datetime.now()
+    results = []
+    unknown = 0
+    for sensor_id, sensor_events in events.items():
+        sensor = registry.resolve(sensor_id, request.query.get('group'))
+        if sensor is None:
+            unknown += len(sensor_events)
+            continue
+        summary = ingest_events(sensor, sensor_events, now)
+        dispatch_actions(request.app, sensor, summary['actions'], notify=False)
+        results.append((sensor, summary))
+    log.info("📦 Пакет: %d подій, %d сенсорів", sum(len(e) for e in events.values()), len(results))
+
+    changed = [(sensor, summary) for sensor, summary in results
+               if summary['outages'] or any(action in ('lost', 'restored') for action, _ in summary['actions'])]
+    by_group = {}
+    for sensor, summary in changed:
+        by_group.setdefault(sensor.group, []).append((sensor, summary))
+    for group, group_results in by_group.items():
+        deliver(request.app, group, None, batch_summary_message(group_results))
+
+    return web.json_response({
+        'accepted': sum(s['events'] - s['duplicates'] for _, s in results),
+        'duplicates': sum(s['duplicates'] for _, s in results),
+        'invalid': invalid,
+        'unknown_sensor': unknown,
+        'outages_added': sum(s['outages'] for _, s in results),
+    })
+
+async def queue_status(request):
+    """Стан черги сповіщень"""
+    return web.json_response(request.app['notifier'].stats())
+
+async def schedule_status(request):
+    """Стан завантаження графіка ДТЕК"""
+    return web.json_response(schedule_fetcher.stats())
+
+async def group_status(request):
+    """Зведення по групі ДТЕК"""
+    group = request.match_info['group']
+    summary = registry.group_summary(group)
+    summary['subscribers'] = len(subscribers.by_group.get(group, ()))
+    return web.json_response(summary)
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    """Час обробки кожного HTTP-запиту за шаблоном маршруту"""
+    started = time.perf_counter()
+    try:
+        return await handler(request)
+    finally:
+        resource = request.match_info.route.resource
+        HTTP_SECONDS.labels(resource.canonical if resource else 'unmatched').observe(time.perf_counter() - started)
+
+async def metrics_endpoint(request):
+    """Метрики для Prometheus"""
+    return web.Response(body=metrics.render().encode(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
 
 async def health_check(request):
-    """Health check"""
+    """Health check; 503, якщо потік запису на диск зупинився чи щойно мав помилки"""
+    writer = get_journal_writer_state()
+    if writer is not None and not writer.healthy():
+        status = "stopped" if not writer.is_alive() else f"{writer.errors} errors"
+        return web.Response(status=503, text=f"Journal writer unhealthy: {status}")
     return web.Response(text="Bot is running!")
 
+# ========== HEARTBEAT ==========
+
+class TimerWheel:
+    """Ієрархічне колесо таймерів.
+
+    levels кілець по slots комірок; комірка кільця L охоплює slots**L
+    тиків. Таймер кладеться в найнижче кільце, куди вміщається його
+    дедлайн, а коли стрілка доходить до комірки вищого кільця, її
+    таймери опускаються нижче. Додати чи скасувати таймер — O(1);
+    advance() обходить лише комірки пройдених тиків.
+    """
+    def __init__(self, tick=1.0, slots=64, levels=4, now=None):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.wheels = [[set() for _ in range(slots)] for _ in range(levels)]
+        self.timers = {}  # ключ -> (тик дедлайну, кільце, комірка)
+        self.current = int((time.time() if now is None else now) // tick)
+
+    def __len__(self):
+        return len(self.timers)
+
+    def __contains__(self, key):
+        return key in self.timers
+
+    def schedule(self, key, deadline):
+        """Таймер key на момент deadline (секунди); замінює попередній"""
+        self.cancel(key)
+        self._place(key, max(int(-(-deadline // self.tick)), self.current + 1))
+
+    def cancel(self, key):
+        entry = self.timers.pop(key, None)
+        if entry:
+            self.wheels[entry[1]][entry[2]].discard(key)
+
+    def _place(self, key, due):
+        delta = due - self.current
+        level, span = 0, 1
+        while level < self.levels - 1 and delta >= span * self.slots:
+            level += 1
+            span *= self.slots
+        # Далі за верхнє кільце — чекає в ньому і опускається при кожному оберті
+        slot = (min(due, self.current + span * self.slots - 1) // span) % self.slots
+        self.wheels[level][slot].add(key)
+        self.timers[key] = (due, level, slot)
+
+    def advance(self, now):
+        """Пройти тики до now; ключі таймерів, що спрацювали"""
+        target = int(now // self.tick)
+        expired = []
+        while self.current < target:
+            self.current += 1
+            tick, span = self.current, 1
+            for level in range(1, self.levels):
+                span *= self.slots
+                if tick % span:
+                    break
+                # Початок оберту нижчого кільця — опускаємо таймери комірки
+                bucket = self.wheels[level][(tick // span) % self.slots]
+                self.wheels[level][(tick // span) % self.slots] = set()
+                for key in bucket:
+                    self._place(key, self.timers[key][0])
+            bucket = self.wheels[0][tick % self.slots]
+            if bucket:
+                self.wheels[0][tick % self.slots] = set()
+                for key in bucket:
+                    if self.timers[key][0] <= tick:
+                        del self.timers[key]
+                        expired.append(key)
+                    else:
+                        self._place(key, self.timers[key][0])
+        return expired
+
+class HeartbeatDetector:
+    """Відключення за зникненням heartbeat-ів сенсора.
+
+    Heartbeat лише записує час у last_seen — колесо не чіпається.
+    Таймер сенсора спрацьовує не раніше ніж через timeout після
+    heartbeat-у, з яким його поставили; тоді детектор дивиться на
+    last_seen: були новіші — таймер переставляється на last_seen +
+    timeout, ні — сенсор замовк. Наступний heartbeat замовклого
+    сенсора означає, що світло повернулось.
+
+    З кількома екземплярами (STATE_BACKEND=sqlite) детектор працює лише
+    в лідера: кожен екземпляр пише heartbeat-и в спільну таблицю, а
+    лідер забирає їх звідти раз на тик.
+    """
+    def __init__(self, timeout=HEARTBEAT_TIMEOUT, tick=HEARTBEAT_TICK):
+        self.timeout = timeout
+        self.wheel = TimerWheel(tick)
+        self.last_seen = {}  # ID сенсора -> time.time() останнього heartbeat
+        self.silent = set()  # замовклі сенсори, яким детектор оголосив відключення
+        self.synced = 0.0    # heartbeat-и зі спільної бази забрано до цього часу
+
+    def beat(self, sensor_id, now):
+        """Heartbeat сенсора; True — сенсор був замовклим і ожив"""
+        if now <= self.last_seen.get(sensor_id, float('-inf')):
+            # Уже бачений heartbeat (повторно прочитаний зі спільної бази)
+            return False
+        self.last_seen[sensor_id] = now
+        if sensor_id in self.wheel:
+            return False
+        self.wheel.schedule(sensor_id, now + self.timeout)
+        if sensor_id in self.silent:
+            self.silent.discard(sensor_id)
+            return True
+        return False
+
+    def expire(self, now):
+        """Сенсори, що замовкли до now: [(ID, час останнього heartbeat)]"""
+        silent = []
+        for sensor_id in self.wheel.advance(now):
+            last = self.last_seen[sensor_id]
+            if now - last < self.timeout:
+                self.wheel.schedule(sensor_id, last + self.timeout)
+            else:
+                self.silent.add(sensor_id)
+                silent.append((sensor_id, last))
+        return silent
+
+heartbeats = HeartbeatDetector()
+
+async def webhook_heartbeat(request):
+    """Сенсор живий; перший heartbeat після тиші — світло з'явилось"""
+    sensor = resolve_sensor(request)
+    request_log.debug("💓 Heartbeat (%s)", sensor.sensor_id)
+    now = time.time()
+    if state_store:
+        # Детектор — у лідера; він забере heartbeat зі спільної бази
+        state_store.record_heartbeat(sensor.sensor_id, now)
+        if not state_store.is_leader:
+            return web.Response(text="OK")
+    if heartbeats.beat(sensor.sensor_id, now):
+        heartbeat_resumed(request.app, sensor, now)
+    return web.Response(text="OK")
+
+def heartbeat_resumed(app, sensor, at):
+    log.info("💓 Сенсор %s знову на зв'язку", sensor.sensor_id, extra={'sensor': sensor.sensor_id})
+    apply_power_event(app, sensor, 'restored', datetime.fromtimestamp(at), source='heartbeat')
+
+def heartbeat_tick(app, now):
+    """Один тик детектора: heartbeat-и інших екземплярів, потім замовклі сенсори"""
+    if state_store:
+        if not state_store.is_leader:
+            return
+        # Запас на heartbeat-и, що потрапили в базу пізніше за новіші
+        for sensor_id, seen in state_store.heartbeats_since(heartbeats.synced - HEARTBEAT_TICK * 5):
+            heartbeats.synced = max(heartbeats.synced, seen)
+            sensor = registry.get(sensor_id)
+            if heartbeats.beat(sensor_id, seen) and sensor is not None:
+                heartbeat_resumed(app, sensor, seen)
+    for sensor_id, last in heartbeats.expire(now):
+        sensor = registry.get(sensor_id)
+        if sensor is None:
+            continue
+        log.info("💔 Сенсор %s мовчить %.0f с — вважаємо, що світла немає", sensor_id,
+                 now - last, extra={'sensor': sensor_id})
+        # Відключення почалось не пізніше останнього heartbeat-у, але не раніше
+        # за останній відомий перехід: інакше воно перекрило б уже записані
+        at = datetime.fromtimestamp(last)
+        horizon = sensor.events.horizon()
+        if horizon is not None and at < horizon:
+            at = horizon
+        actions = apply_power_event(app, sensor, 'lost', at, source='heartbeat')
+        if actions[-1][0] == 'duplicate':
+            # Світла вже немає за явним power_lost — відновлення теж чекаємо явного
+            heartbeats.silent.discard(sensor_id)
+
+async def heartbeat_loop(app):
+    """Один цикл на всі сенсори: раз на тик колеса шукаємо замовклих"""
+    while True:
+        await asyncio.sleep(heartbeats.wheel.tick)
+        try:
+            heartbeat_tick(app, time.time())
+        except Exception as e:
+            log.exception("❌ Heartbeat: %s", e)
+
+# ========== ЕКСПОРТ ==========
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', b'start,end,duration_seconds\n'),
+    'ndjson': ('application/x-ndjson', b''),
+}
+
+def export_bound(value, default):
+    """Межа експорту: unix-секунди, ISO-дата або ISO-час -> секунди"""
+    if not value:
+        return default
+    if value.replace('.', '', 1).isdigit():
+        return to_seconds(parse_event_time(float(value)))
+    return to_seconds(parse_event_time(value))
+
+def format_export_rows(starts, ends, fmt):
+    """Шматок історії як байти CSV/NDJSON; дати форматує NumPy одним викликом"""
+    start_text = starts.astype('datetime64[s]').astype(str).tolist()
+    end_text = ends.astype('datetime64[s]').astype(str).tolist()
+    durations = (ends - starts).tolist()
+    if fmt == 'csv':
+        rows = [f'{start},{end},{duration}\n' for start, end, duration in zip(start_text, end_text, durations)]
+    else:
+        rows = [f'{{"start":"{start}","end":"{end}","duration":{duration}}}\n'
+                for start, end, duration in zip(start_text, end_text, durations)]
+    return ''.join(rows).encode()
+
+async def iter_export(sensor, lo, hi, fmt, chunk=EXPORT_CHUNK):
+    """Шматки експорту відключень, що перетинають [lo, hi).
+
+    Кожен шматок — не більше chunk відключень, між шматками керування
+    повертається в event loop. Позиція — кінець останнього відданого
+    відключення і скільки відданих закінчились саме тоді, а не номер у
+    масиві, тож нові відключення під час експорту нічого не зсувають,
+    а нульові відключення на межі шматків не губляться.
+    """
+    header = EXPORT_FORMATS[fmt][1]
+    if header:
+        yield header
+    index = sensor.index
+    cursor, same = None, 0
+    while True:
+        if cursor is None:
+            i, j = index.span(lo, hi)
+        else:
+            i = bisect_left(index.ends, cursor) + same
+            j = bisect_left(index.starts, hi)
+        if i >= j:
+            return
+        starts, ends = index.columns(i, min(j, i + chunk))
+        yield format_export_rows(starts, ends, fmt)
+        last = int(ends[-1])
+        tail = len(ends) - int(np.searchsorted(ends, last))
+        same = same + tail if last == cursor else tail
+        cursor = last
+        await asyncio.sleep(0)
+
+async def export_history(request):
+    """GET /export?from=&to=&format=csv|ndjson — потокова вивантажка історії"""
+    sensor_id = request.match_info.get('sensor_id', request.query.get('sensor', DEFAULT_SENSOR))
+    sensor = registry.get(sensor_id)
+    if sensor is None:
+        raise web.HTTPNotFound(text=f"Unknown sensor: {sensor_id}")
+    fmt = request.query.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        raise web.HTTPBadRequest(text=f"Unknown format: {fmt} (csv, ndjson)")
+    try:
+        lo = export_bound(request.query.get('from'), -2 ** 62)
+        hi = export_bound(request.query.get('to'), 2 ** 62)
+    except (ValueError, OverflowError, OSError) as e:
+        raise web.HTTPBadRequest(text=f"Invalid from/to: {e}")
+    
+    response = web.StreamResponse(headers={
+        'Content-Type': EXPORT_FORMATS[fmt][0],
+        'Content-Disposition': f'attachment; filename="outages_{sensor_id}.{fmt}"',
+    })
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    async for chunk in iter_export(sensor, lo, hi, fmt):
+        await response.write(chunk)
+    await response.write_eof()
+    return response
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /export [від] [до] [csv|ndjson] — історія файлом"""
+    args = list(context.args or [])
+    fmt = args.pop() if args and args[-1] in EXPORT_FORMATS else 'csv'
+    try:
+        lo = export_bound(args[0] if args else None, -2 ** 62)
+        hi = export_bound(args[1] if len(args) > 1 else None, 2 ** 62)
+    except (ValueError, OverflowError, OSError):
+        await update.message.reply_text(
+            "Формат: /export [від] [до] [csv|ndjson]\nНаприклад: /export 2026-10-01 2026-11-01 csv")
+        return
+    
+    i, j = monitor.index.span(lo, hi)
+    if i == j:
+        await update.message.reply_text("За цей період відключень немає")
+        return
+    request_log.info("📤 Експорт історії: %d відключень (%s)", j - i, fmt)
+    # Великий файл ляже на диск, а не в пам'ять
+    with tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024) as f:
+        async for chunk in iter_export(monitor, lo, hi, fmt):
+            f.write(chunk)
+        f.seek(0)
+        await update.message.reply_document(
+            document=f, filename=f"outages_{monitor.sensor_id}.{fmt}",
+            caption=f"📤 Історія відключень: {j - i} записів")
+
+# ========== КІЛЬКА ЕКЗЕМПЛЯРІВ ==========
+
+def apply_remote_changes(app, changes):
+    """Застосувати зміни інших екземплярів до моніторів і підписок у пам'яті.
+
+    Журнал сенсора на цей час відключено: зміни вже в базі. Повторно
+    застосована зміна нічого не ламає — так курсор може відставати.
+    """
+    outages = {}
+    for topic, kind, a, b in changes:
+        if kind in (KIND_SUBSCRIBE, KIND_UNSUBSCRIBE):
+            subscribers.apply_remote(a, topic, kind == KIND_SUBSCRIBE)
+            continue
+        sensor = registry.get(topic)
+        if sensor is None:
+            sensor = registry.add(topic, state_store.group_of(topic) or DTEK_GROUP)
+            sensor.journal = registry.journal_for(sensor)
+        journal, sensor.journal = sensor.journal, None
+        try:
+            if kind == KIND_OUTAGE:
+                starts, ends = outages.setdefault(sensor, ([], []))
+                starts.append(a)
+                ends.append(b)
+            elif kind == KIND_LOST:
+                if sensor.power_status:
+                    sensor.power_lost(from_seconds(a))
+            elif kind == KIND_RESTORED:
+                if sensor.power_status:
+                    # Початок пропустили (або вже маємо це відключення) — лише історія
+                    sensor.add_outages([a], [b])
+                else:
+                    sensor.last_outage_start = from_seconds(a)
+                    sensor.power_restored(from_seconds(b))
+                    schedule_forecast_refit(app, sensor)
+        finally:
+            sensor.journal = journal
+    for sensor, (starts, ends) in outages.items():
+        journal, sensor.journal = sensor.journal, None
+        try:
+            sensor.add_outages(starts, ends)
+        finally:
+            sensor.journal = journal
+
+async def set_polling(application, enabled):
+    """Long-polling лише в лідера: Telegram не дає двом клієнтам getUpdates"""
+    updater = application.updater
+    if updater is None or updater.running == enabled:
+        return
+    if enabled:
+        await updater.start_polling()
+    else:
+        await updater.stop()
+
+async def state_sync_task(context: ContextTypes.DEFAULT_TYPE):
+    """Забрати чужі зміни зі спільної бази; лідер ще й розсилає outbox"""
+    app = context.job.data
+    while True:
+        cursor = state_store.cursor
+        apply_remote_changes(app, state_store.changes_since())
+        if state_store.cursor == cursor:
+            break
+        await asyncio.sleep(0)
+    if state_store.is_leader:
+        for _, group, sensor_id, text in await state_store.run(state_store.take_outbox):
+            deliver(app, group, sensor_id, text)
+
+async def leader_task(context: ContextTypes.DEFAULT_TYPE):
+    """Продовжити оренду лідера; при зміні ролі — увімкнути чи вимкнути polling"""
+    app = context.job.data
+    was_leader = state_store.is_leader
+    try:
+        # Відповідь, що прийшла пізніше за половину оренди, вже не гарантує, що оренда наша
+        state_store.is_leader = await asyncio.wait_for(state_store.run(state_store.renew_lease),
+                                                       state_store.lease / 2)
+    except Exception as e:
+        # Без бази не знаємо, чи оренда ще наша — поступаємось, щоб не було двох лідерів
+        log.warning("⚠️ Оренда лідера: %s", e if str(e) else type(e).__name__)
+        state_store.is_leader = False
+    if state_store.is_leader != was_leader:
+        log.info("👑 %s %s лідером", INSTANCE_ID, "став" if state_store.is_leader else "більше не є")
+        if not TELEGRAM_WEBHOOK_URL:
+            await set_polling(app['bot_app'], state_store.is_leader)
+
 # ========== KEEP ALIVE ==========
 
 async def keep_alive_task(context: ContextTypes.DEFAULT_TYPE):
     """Пінгує сервер"""
     try:
-        async with aiohttp.ClientSession() as session:
-            url = f'http://localhost:{PORT}/health'
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=5)) as response:
-                if response.status == 200:
-                    print("✅ Keep-alive")
+        url = f'http://localhost:{PORT}/health'
+        async with get_http_session().get(url, timeout=aiohttp.ClientTimeout(total=5)) as response:
+            if response.status == 200:
+                request_log.debug("✅ Keep-alive")
     except Exception as e:
-        print(f"⚠️ Keep-alive: {e}")
+        log.warning("⚠️ Keep-alive: %s", e)
+
+async def schedule_refresh_task(context: ContextTypes.DEFAULT_TYPE):
+    """Оновлення графіка ДТЕК у фоні"""
+    await schedule_fetcher.refresh()
+
+async def snapshot_task(context: ContextTypes.DEFAULT_TYPE):
+    """Періодичний знімок стану, щоб журнали не росли безмежно"""
+    registry.snapshot_all()
+
+async def fit_forecast(sensor):
+    """Навчити прогноз сенсора в потоці: холодне навчання на великій історії
+    триває секунди. Усі навчання сенсора йдуть по одному — одночасні
+    запити чекають те, що вже йде.
+    """
+    engine = sensor.forecast
+    if engine.fitting is None:
+        # Потік читає лише копію: живі array('q') змінюються в event loop
+        engine.fitting = asyncio.ensure_future(asyncio.to_thread(
+            engine.fit, to_seconds(datetime.now()), sensor.index.frozen(), sensor.analytics.rewrites))
+        engine.fitting.add_done_callback(lambda _: setattr(engine, 'fitting', None))
+    await asyncio.shield(engine.fitting)
+
+async def forecast_refit_task(context: ContextTypes.DEFAULT_TYPE):
+    """Перенавчання прогнозу одного сенсора після відключення"""
+    sensor = context.job.data
+    sensor.forecast.refit_scheduled = False
+    await fit_forecast(sensor)
+    log.info("🔔 Прогноз %s перенавчено за %.1f мс", sensor.sensor_id, sensor.forecast.fit_ms)
+
+async def forecast_hourly_task(context: ContextTypes.DEFAULT_TYPE):
+    """Щогодини зсуваємо горизонт прогнозу для сенсорів, які його запитують"""
+    for sensor in list(registry.monitors.values()):
+        if sensor.forecast.model is not None:
+            await fit_forecast(sensor)
+
+# ========== TELEGRAM ==========
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Паралельна обробка апдейтів зі збереженням порядку в чаті.
+
+    Апдейти різних чатів обробляються одночасно (до max_concurrent_updates),
+    апдейти одного чату — по черзі, в порядку надходження: замки asyncio
+    видаються в порядку очікування. Слот ліміту береться лише після замка
+    чату — апдейт, що чекає свій чат, не займає слот, потрібний іншим.
+    """
+    def __init__(self, max_concurrent_updates=UPDATE_CONCURRENCY):
+        # Семафор базового класу береться до замка чату, тож він не обмежує,
+        # а ліміт тримає власний семафор у do_process_update
+        super().__init__(sys.maxsize)
+        self.limit = max_concurrent_updates
+        self.slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self.chat_locks = {}  # chat_id -> [замок, скільки апдейтів його чекає]
+
+    async def do_process_update(self, update, coroutine):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            async with self.slots:
+                await coroutine
+            return
+        entry = self.chat_locks.setdefault(chat.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0], self.slots:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.chat_locks[chat.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+async def telegram_webhook(request):
+    """Апдейт від Telegram — одразу в чергу застосунку"""
+    if request.headers.get('X-Telegram-Bot-Api-Secret-Token') != TELEGRAM_WEBHOOK_SECRET:
+        return web.Response(status=403, text="Forbidden")
+    try:
+        data = await request.json()
+    except (ValueError, UnicodeDecodeError):
+        return web.Response(status=400, text="Invalid JSON")
+    application = request.app['bot_app']
+    await application.update_queue.put(Update.de_json(data, application.bot))
+    return web.Response(text="OK")
 
 # ========== ГОЛОВНА ФУНКЦІЯ ==========
 
 async def main():
     """Запуск бота"""
-    print("=" * 50)
-    print("🚀 Запуск Power Monitor Bot...")
-    print("=" * 50)
+    global state_store
+    setup_logging()
+    log.info("=" * 50)
+    log.info("🚀 Запуск Power Monitor Bot...")
+    log.info("=" * 50)
     
     if not BOT_TOKEN or not CHAT_ID:
-        print("❌ BOT_TOKEN або CHAT_ID не встановлено!")
+        log.error("❌ BOT_TOKEN або CHAT_ID не встановлено!")
         return
     
-    print(f"✅ BOT_TOKEN: {BOT_TOKEN[:10]}...")
-    print(f"✅ CHAT_ID: {CHAT_ID}")
-    print(f"✅ DTEK_GROUP: {DTEK_GROUP}")
-    print(f"✅ PORT: {PORT}")
-    print()
+    log.info("✅ BOT_TOKEN: %s...", BOT_TOKEN[:10])
+    log.info("✅ CHAT_ID: %s", CHAT_ID)
+    log.info("✅ DTEK_GROUP: %s", DTEK_GROUP)
+    log.info("✅ PORT: %s", PORT)
+    log.info("✅ Режим: %s", 'вебхук ' + TELEGRAM_WEBHOOK_URL if TELEGRAM_WEBHOOK_URL else 'polling')
     
-    # Створюємо бота
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Відновлюємо історію з диска
+    if STATE_BACKEND == 'sqlite':
+        state_store = SqliteStore(STATE_DB)
+        state_store.is_leader = await state_store.run(state_store.renew_lease)
+        log.info("✅ Стан: SQLite %s, екземпляр %s%s", STATE_DB, INSTANCE_ID, " (лідер)" if state_store.is_leader else "")
+    registry.open(DATA_DIR, state_store)
+    subscribers.open(DATA_DIR, state_store)
+    
+    # Створюємо бота; пул з'єднань — під воркерів розсилки і відповіді на команди
+    builder = (Application.builder().token(BOT_TOKEN)
+               .connection_pool_size(NOTIFY_WORKERS + UPDATE_CONCURRENCY)
+               .concurrent_updates(ChatOrderedUpdateProcessor()))
+    if TELEGRAM_API_URL:
+        builder = (builder.base_url(TELEGRAM_API_URL.rstrip('/') + '/bot')
+                   .base_file_url(TELEGRAM_API_URL.rstrip('/') + '/file/bot'))
+    if TELEGRAM_WEBHOOK_URL:
+        # Апдейти приносить наш веб-сервер — Updater не потрібен
+        builder = builder.updater(None)
+    application = builder.build()
     
     # Обробники
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("analytics", show_analytics))
+    application.add_handler(CommandHandler("heatmap", show_heatmap))
+    application.add_handler(CommandHandler("subscribe", subscribe_command))
+    application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
+    application.add_handler(CommandHandler("export", export_command))
+    application.add_handler(CommandHandler("chart", show_chart))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
     application.add_handler(CallbackQueryHandler(button_callback))
     
     await application.initialize()
     await application.start()
     
-    # Keep-alive
+    # Keep-alive: у режимі вебхука сервер і так отримує запити від Telegram
     if application.job_queue:
-        application.job_queue.run_repeating(keep_alive_task, interval=600, first=60)
+        if not TELEGRAM_WEBHOOK_URL:
+            application.job_queue.run_repeating(keep_alive_task, interval=600, first=60)
+        application.job_queue.run_repeating(snapshot_task, interval=SNAPSHOT_INTERVAL, first=SNAPSHOT_INTERVAL)
+        application.job_queue.run_repeating(schedule_refresh_task, interval=SCHEDULE_REFRESH_INTERVAL, first=1)
+        application.job_queue.run_repeating(forecast_hourly_task, interval=3600, first=3600 - time.time() % 3600 + 1)
     
     # Polling
-    polling_task = asyncio.create_task(application.updater.start_polling())
+    polling_task = None
+    if not TELEGRAM_WEBHOOK_URL and (state_store is None or state_store.is_leader):
+        polling_task = asyncio.create_task(application.updater.start_polling())
     
     # Веб-сервер
-    app = web.Application()
+    app = web.Application(middlewares=[metrics_middleware])
     app['bot_app'] = application
+    app['notifier'] = Notifier(application.bot)
+    app['notifier'].on_forbidden = subscribers.remove
+    app['notifier'].start()
+    metrics.gauge('powerbot_notify_queue_depth', 'Повідомлень у черзі на відправку', lambda: [((), app['notifier'].depth)])
+    heartbeat_task = asyncio.create_task(heartbeat_loop(app))
+    metrics.gauge('powerbot_heartbeat_sensors', 'Сенсорів, що шлють heartbeat (silent — замовкли)',
+                  lambda: [(('alive',), len(heartbeats.wheel)), (('silent',), len(heartbeats.silent))], ('state',))
+    if state_store and application.job_queue:
+        application.job_queue.run_repeating(state_sync_task, interval=STATE_SYNC_INTERVAL, first=STATE_SYNC_INTERVAL, data=app)
+        application.job_queue.run_repeating(leader_task, interval=LEADER_LEASE / 3, first=LEADER_LEASE / 3, data=app)
+        metrics.gauge('powerbot_leader', 'Чи цей екземпляр лідер (розсилає сповіщення)', lambda: [((), int(state_store.is_leader))])
     
     app.router.add_post('/power_lost', webhook_power_lost)
     app.router.add_post('/power_restored', webhook_power_restored)
+    app.router.add_post('/sensors/{sensor_id}/power_lost', webhook_power_lost)
+    app.router.add_post('/sensors/{sensor_id}/power_restored', webhook_power_restored)
+    app.router.add_post('/heartbeat', webhook_heartbeat)
+    app.router.add_post('/sensors/{sensor_id}/heartbeat', webhook_heartbeat)
+    app.router.add_post('/events', webhook_events)
+    app.router.add_post('/sensors/{sensor_id}/events', webhook_events)
+    app.router.add_get('/groups/{group}', group_status)
+    app.router.add_get('/queue', queue_status)
+    app.router.add_get('/schedule', schedule_status)
+    app.router.add_get('/metrics', metrics_endpoint)
+    app.router.add_get('/export', export_history)
+    app.router.add_get('/sensors/{sensor_id}/export', export_history)
     app.router.add_get('/health', health_check)
     app.router.add_get('/', health_check)
+    if TELEGRAM_WEBHOOK_URL:
+        app.router.add_post(TELEGRAM_WEBHOOK_PATH, telegram_webhook)
     
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, '0.0.0.0', PORT)
     await site.start()
     
+    if TELEGRAM_WEBHOOK_URL:
+        # Реєструємо вебхук, коли сервер уже приймає запити
+        await application.bot.set_webhook(
+            url=TELEGRAM_WEBHOOK_URL.rstrip('/') + TELEGRAM_WEBHOOK_PATH,
+            secret_token=TELEGRAM_WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=min(100, UPDATE_CONCURRENCY),
+        )
+        log.info("✅ Вебхук Telegram: %s%s", TELEGRAM_WEBHOOK_URL.rstrip('/'), TELEGRAM_WEBHOOK_PATH)
+    
     if application.job_queue:
         await application.job_queue.start()
     
-    print(f"✅ Веб-сервер на порті {PORT}")
-    print("🤖 Бот готовий!")
-    print("📊 Збереження даних активовано")
-    print()
-    print("=" * 50)
-    print("✅ ВСЕ ГОТОВО!")
-    print("=" * 50)
+    log.info("✅ Веб-сервер на порті %s", PORT)
+    log.info("🤖 Бот готовий!")
+    log.info("📊 Збереження даних активовано")
+    log.info("=" * 50)
+    log.info("✅ ВСЕ ГОТОВО!")
+    log.info("=" * 50)
     
     try:
         await asyncio.Event().wait()
-    except (KeyboardInterrupt, SystemExit):
-        await polling_task
+    except (KeyboardInterrupt, SystemExit, asyncio.CancelledError):
+        if polling_task:
+            await polling_task
+        await set_polling(application, False)
+        # Відновлення, що чекають підтвердження, фіксуємо до зупинки черги
+        for sensor in registry.monitors.values():
+            if sensor.events.pending_restore is not None:
+                confirm_restore(app, sensor)
+        heartbeat_task.cancel()
+        await app['notifier'].stop()
         if application.job_queue:
             await application.job_queue.stop()
         await application.stop()
         await application.shutdown()
+        await close_http_session()
+        shutdown_chart_pool()
+        # Фінальний знімок і дозапис журналів
+        registry.snapshot_all()
+        subscribers.flush()
+        if state_store:
+            state_store.close()
+        registry.close()
 
 if __name__ == '__main__':
     try:
         asyncio.run(main())
     except Exception as e:
-        print(f"\n❌ Помилка: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("❌ Помилка: %s", e)
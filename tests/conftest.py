@@ -0,0 +1,7 @@
+"""Спільне для тестів: корінь репозиторію в sys.path, щоб імпортувати bot."""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
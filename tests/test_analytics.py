@@ -0,0 +1,118 @@
+"""Інкрементальні ролапи аналітики і кеш відрендерених відповідей."""
+import random
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from bot import PERIODS, PowerMonitor, from_seconds, period_range, render_analytics, render_heatmap, to_seconds
+
+BASE = to_seconds(datetime(2024, 1, 29))  # понеділок
+
+def brute_rollup(outages, kind, lo):
+    """Ролап періоду напряму зі списку відключень"""
+    _, hi = period_range(kind, lo)
+    pieces = [(max(start, lo), min(end, hi)) for start, end in sorted(outages) if end > lo and start < hi]
+    durations = [end - start for start, end in pieces]
+    gaps = [start - prev_end for (_, prev_end), (start, _) in zip(pieces, pieces[1:]) if start > prev_end]
+    hours = [0] * 24
+    for start, _ in pieces:
+        hours[start % 86400 // 3600] += 1
+    return {'count': len(pieces), 'total': sum(durations), 'hours': hours, 'gap_sum': sum(gaps),
+            'gap_count': len(gaps), 'first': durations[:3], 'last': durations[-3:]}
+
+def as_dict(rollup):
+    return {'count': rollup.count, 'total': rollup.total, 'hours': list(rollup.hours), 'gap_sum': rollup.gap_sum,
+            'gap_count': rollup.gap_count, 'first': list(rollup.first), 'last': list(rollup.last)}
+
+def random_outages(rng, count, span_days=70):
+    outages, t = [], BASE
+    for _ in range(count):
+        t += rng.randrange(600, span_days * 86400 // count)
+        end = t + rng.randrange(60, 20 * 3600)
+        outages.append((t, end))
+        t = end
+    return outages
+
+def periods_of(outages):
+    return {(kind, period_range(kind, start)[0]) for start, end in outages for kind in PERIODS for start in (start, end - 1)}
+
+def test_incremental_rollups_match_brute_force():
+    rng = random.Random(7)
+    outages = random_outages(rng, 120)
+    sensor = PowerMonitor(sensor_id='analytics-test')
+    seen = []
+    for start, end in outages:
+        sensor.add_outage(from_seconds(start), from_seconds(end))
+        seen.append((start, end))
+        # Ролапи рахуються при першому запиті, далі лише оновлюються
+        for kind, lo in periods_of(seen[-3:]):
+            assert as_dict(sensor.analytics.rollup(kind, lo)) == brute_rollup(seen, kind, lo)
+    for kind, lo in periods_of(outages):
+        assert as_dict(sensor.analytics.rollup(kind, lo)) == brute_rollup(outages, kind, lo)
+
+def test_insert_in_the_past_resets_only_touched_periods():
+    rng = random.Random(11)
+    outages = random_outages(rng, 60)
+    removed = outages.pop(30)
+    sensor = PowerMonitor(sensor_id='analytics-test')
+    sensor.load_state(np.array([s for s, _ in outages]), np.array([e for _, e in outages]), None)
+    for kind, lo in periods_of(outages):
+        sensor.analytics.rollup(kind, lo)
+    untouched = {key: rollup for key, rollup in sensor.analytics.rollups.items() if key not in periods_of([removed])}
+
+    sensor.add_outage(from_seconds(removed[0]), from_seconds(removed[1]))
+    outages.append(removed)
+    for key, rollup in untouched.items():
+        assert sensor.analytics.rollups[key] is rollup
+    for kind, lo in periods_of(outages):
+        assert as_dict(sensor.analytics.rollup(kind, lo)) == brute_rollup(outages, kind, lo)
+
+def test_summary_adds_current_outage_without_touching_rollup():
+    sensor = PowerMonitor(sensor_id='analytics-test')
+    sensor.add_outage(from_seconds(BASE + 3600), from_seconds(BASE + 7200))
+    now = BASE + 5 * 3600
+    lo, summary = sensor.analytics.summary('day', now, current_start=BASE + 4 * 3600)
+    assert lo == BASE and summary.count == 2 and summary.total == 7200
+    assert sensor.analytics.rollup('day', BASE).count == 1
+
+@pytest.fixture
+def live_sensor():
+    now = to_seconds(datetime.now())
+    sensor = PowerMonitor(sensor_id='render-test')
+    sensor.add_outage(from_seconds(now - 7200), from_seconds(now - 3600))
+    return sensor, now
+
+def test_render_cache_reuses_text_until_state_changes(live_sensor):
+    sensor, now = live_sensor
+    calls = []
+
+    def render(sensor):
+        calls.append(sensor.version)
+        return f"{len(sensor.index)}"
+    assert sensor.render('probe', render) == '1'
+    assert sensor.render('probe', render) == '1'
+    assert len(calls) == 1 and sensor.render_cache.hits == 1
+
+    sensor.add_outage(from_seconds(now - 1800), from_seconds(now - 1200))
+    assert sensor.render('probe', render) == '2'
+    sensor.power_lost(from_seconds(now - 60))
+    sensor.render('probe', render)
+    assert len(calls) == 3 and len(set(calls)) == 3
+
+def test_render_cache_invalidated_by_past_insert_and_reload(live_sensor):
+    sensor, now = live_sensor
+    first = sensor.render('heatmap', render_heatmap)
+    # Вставка в минуле теж змінює версію і скидає довгострокову аналітику
+    sensor.add_outage(from_seconds(now - 3 * 3600), from_seconds(now - 2 * 3600 - 600))
+    second = sensor.render('heatmap', render_heatmap)
+    assert "(1 відключень)" in first and "(2 відключень)" in second
+    sensor.load_state(np.array([], dtype=np.int64), np.array([], dtype=np.int64), None)
+    assert "Недостатньо даних" in sensor.render('analytics_day', render_analytics)
+
+def test_render_cache_is_bounded():
+    sensor = PowerMonitor(sensor_id='render-test')
+    sensor.render_cache.maxsize = 3
+    for view in 'abcde':
+        sensor.render(view, lambda sensor, view=view: view)
+    assert list(key[0] for key in sensor.render_cache.entries) == ['c', 'd', 'e']
@@ -0,0 +1,93 @@
+"""Графіки: малювання в пулі, спільний рендер і кеш із file_id."""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+import bot
+from bot import ChartCache, PowerMonitor, chart_data, draw_timeline, from_seconds, to_seconds
+
+@pytest.fixture
+def drawing(monkeypatch):
+    """Пул потоків замість процесів і облік викликів малювання"""
+    calls = []
+    release = threading.Event()
+    release.set()
+
+    def draw(title, rows):
+        calls.append(title)
+        release.wait(5)
+        return f"png:{title}:{len(calls)}".encode()
+    pool = ThreadPoolExecutor(2)
+    monkeypatch.setattr(bot, 'draw_timeline', draw)
+    monkeypatch.setattr(bot, 'get_chart_pool', lambda: pool)
+    monkeypatch.setattr(bot, 'chart_cache', ChartCache())
+    yield calls, release
+    pool.shutdown()
+
+@pytest.fixture
+def sensor():
+    now = to_seconds(datetime.now())
+    sensor = PowerMonitor(sensor_id='chart-test')
+    sensor.add_outage(from_seconds(now - 7200), from_seconds(now - 3600))
+    return sensor
+
+def test_concurrent_requests_share_one_render(drawing, sensor):
+    calls, release = drawing
+    release.clear()
+
+    async def run():
+        tasks = [asyncio.create_task(bot.get_chart(sensor, 'day')) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(*tasks)
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert len({key for key, _ in results}) == 1 and len({entry[0] for _, entry in results}) == 1
+    assert bot.chart_cache.misses == 1 and not bot.chart_cache.rendering
+
+def test_cache_hit_until_history_changes(drawing, sensor):
+    calls, _ = drawing
+
+    async def run():
+        first, _ = await bot.get_chart(sensor, 'week')
+        again, _ = await bot.get_chart(sensor, 'week')
+        now = to_seconds(datetime.now())
+        sensor.add_outage(from_seconds(now - 600), from_seconds(now - 300))
+        changed, _ = await bot.get_chart(sensor, 'week')
+        return first, again, changed
+    first, again, changed = asyncio.run(run())
+    assert first == again and changed != first
+    assert len(calls) == 2 and bot.chart_cache.hits == 1
+
+def test_file_id_replaces_png_bytes():
+    cache = ChartCache(max_bytes=100)
+    cache.put('a', b'x' * 40, 'A')
+    cache.put('b', b'y' * 40, 'B')
+    cache.set_file_id('a', 'file-a')
+    assert cache.get('a') == [None, 'file-a', 'A'] and cache.size == 40
+    # Місце звільнилось — новий графік не витісняє вже завантажений
+    cache.put('c', b'z' * 50, 'C')
+    assert list(cache.entries) == ['b', 'a', 'c'] and cache.size == 90
+    cache.put('d', b'w' * 30, 'D')
+    assert list(cache.entries) == ['a', 'c', 'd'] and cache.size == 80
+
+def test_cache_is_bounded_by_entries():
+    cache = ChartCache(max_entries=2)
+    for key in 'abc':
+        cache.put(key, b'.', key)
+        cache.set_file_id(key, key)
+    assert list(cache.entries) == ['b', 'c'] and cache.size == 0
+
+def test_chart_data_rows_and_caption(sensor):
+    now = to_seconds(datetime.now())
+    (lo, hi), _, rows, caption = chart_data(sensor, 'week', now)
+    assert hi - lo == 7 * 86400 and len(rows) == 7
+    assert rows[-1][1] == now - hi + 86400
+    assert "Відключень: 1" in caption and "1г 0хв" in caption
+
+def test_draw_timeline_returns_png():
+    png = draw_timeline('01.01.2024', [('01.01', 86400, [(3600, 7200), (50000, 50000)])])
+    assert png.startswith(b'\x89PNG\r\n\x1a\n')
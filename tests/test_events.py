@@ -0,0 +1,171 @@
+"""Автомат подій (згладжування мерехтіння) і пакетний прийом NDJSON."""
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import bot
+from bot import PowerEventMachine, PowerMonitor
+
+T0 = datetime(2026, 1, 5, 12, 0, 0)
+
+def machine(window=30):
+    return PowerEventMachine(PowerMonitor(), window=window)
+
+def kinds(actions):
+    return [action for action, _ in actions]
+
+def test_restore_waits_for_flap_window():
+    events = machine()
+    assert kinds(events.feed('lost', T0)) == ['lost']
+    assert kinds(events.feed('restored', T0 + timedelta(seconds=60))) == ['pending']
+    assert not events.monitor.power_status
+    assert events.flush(T0 + timedelta(seconds=80)) == []
+    actions = events.flush(T0 + timedelta(seconds=90))
+    assert kinds(actions) == ['restored']
+    assert actions[0][1].start == T0 and actions[0][1].end == T0 + timedelta(seconds=60)
+    assert events.monitor.power_status
+
+def test_flap_within_window_is_one_outage():
+    events = machine()
+    events.feed('lost', T0)
+    events.feed('restored', T0 + timedelta(seconds=60))
+    assert kinds(events.feed('lost', T0 + timedelta(seconds=70))) == ['merged']
+    events.feed('restored', T0 + timedelta(seconds=300))
+    assert kinds(events.flush(T0 + timedelta(seconds=400))) == ['restored']
+    assert len(events.monitor.index) == 1
+    assert events.monitor.index[0].start == T0
+
+def test_next_event_after_window_confirms_pending_restore():
+    events = machine()
+    events.feed('lost', T0)
+    events.feed('restored', T0 + timedelta(seconds=60))
+    assert kinds(events.feed('lost', T0 + timedelta(seconds=600))) == ['restored', 'lost']
+    assert len(events.monitor.index) == 1
+
+def test_duplicates_and_idempotency_keys():
+    events = machine(window=0)
+    assert kinds(events.feed('lost', T0, key='a')) == ['lost']
+    assert kinds(events.feed('lost', T0 + timedelta(seconds=5), key='a')) == ['duplicate']
+    assert kinds(events.feed('lost', T0 + timedelta(seconds=5))) == ['duplicate']
+    assert events.monitor.last_outage_start == T0
+    assert kinds(events.feed('restored', T0 + timedelta(seconds=60))) == ['restored']
+    assert kinds(events.feed('restored', T0 + timedelta(seconds=70))) == ['duplicate']
+
+def test_events_older_than_last_transition_are_stale():
+    events = machine(window=0)
+    events.feed('lost', T0 + timedelta(seconds=10))
+    events.feed('restored', T0 + timedelta(seconds=20))
+    assert kinds(events.feed('lost', T0)) == ['stale']
+    assert kinds(events.feed('restored', T0 + timedelta(seconds=5))) == ['stale']
+    assert kinds(events.feed('lost', T0 + timedelta(seconds=20))) == ['lost']
+    assert len(events.monitor.index) == 1
+
+class StubNotifier:
+    def __init__(self):
+        self.sent = []
+
+    def notify(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+    def broadcast(self, chat_ids, text, **kwargs):
+        for chat_id in chat_ids:
+            self.notify(chat_id, text)
+        return len(chat_ids)
+
+def post_events(lines, path='/events'):
+    """POST тіла NDJSON у webhook_events; (статус, json, надіслані повідомлення)"""
+    async def run():
+        app = web.Application()
+        app['notifier'] = StubNotifier()
+        app.router.add_post('/events', bot.webhook_events)
+        app.router.add_post('/sensors/{sensor_id}/events', bot.webhook_events)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post(path, data='\n'.join(lines).encode())
+            body = await response.json() if response.status == 200 else await response.text()
+            return response.status, body, app['notifier'].sent
+    return asyncio.run(run())
+
+def event(kind, at, **extra):
+    return json.dumps(dict(event=kind, ts=at.isoformat(), **extra))
+
+def test_ndjson_batch_reorders_and_skips_malformed_lines(monkeypatch):
+    monkeypatch.setattr(bot.subscribers, 'recipients', lambda group: {42})
+    base = datetime.now() - timedelta(days=2)
+    lines = [
+        event('power_restored', base + timedelta(minutes=30), id='r1'),
+        'not json',
+        json.dumps({'event': 'power_lost'}),
+        json.dumps({'event': 'explode', 'ts': 0}),
+        json.dumps({'event': 'power_lost', 'ts': 'yesterday'}),
+        json.dumps([1, 2]),
+        event('power_lost', base, id='l1'),
+        '',
+        event('power_lost', base + timedelta(hours=2), id='l2'),
+        event('power_restored', base + timedelta(hours=3), id='r2'),
+        event('power_restored', base + timedelta(hours=3), id='r2'),
+    ]
+    status, body, sent = post_events(lines, '/sensors/ndjson-test/events')
+    assert status == 200
+    assert body['invalid'] == 5
+    assert body['duplicates'] == 1
+    assert body['accepted'] == 4
+    sensor = bot.registry.get('ndjson-test')
+    starts, ends = sensor.index.columns()
+    assert len(starts) == 2
+    assert ends[0] - starts[0] == 30 * 60
+    assert len(sent) == 1 and sent[0][0] == 42 and 'ПАКЕТ' in sent[0][1]
+
+def test_ndjson_out_of_range_timestamps_are_invalid():
+    lines = [
+        json.dumps({'event': 'power_lost', 'ts': 1e20}),
+        '{"event": "power_lost", "ts": Infinity}',
+        '{"event": "power_lost", "ts": -Infinity}',
+        json.dumps({'event': 'power_lost', 'ts': -1e18}),
+    ]
+    status, body, sent = post_events(lines, '/sensors/overflow-test/events')
+    assert status == 200
+    assert body['invalid'] == 4 and body['accepted'] == 0
+    assert sent == []
+
+def test_ndjson_future_timestamps_are_invalid():
+    now = datetime.now()
+    lines = [
+        event('power_lost', now + timedelta(days=365), id='future'),
+        json.dumps({'event': 'power_lost', 'ts': (now + timedelta(hours=1)).timestamp()}),
+        event('power_lost', now - timedelta(minutes=10), id='real-lost'),
+        event('power_restored', now + timedelta(seconds=30), id='real-restored'),
+    ]
+    status, body, _ = post_events(lines, '/sensors/future-test/events')
+    assert status == 200
+    assert body['invalid'] == 2 and body['accepted'] == 2
+    sensor = bot.registry.get('future-test')
+    # Горизонт не зсунувся в майбутнє: відновлення прийнято і чекає підтвердження
+    assert sensor.events.horizon() <= now + timedelta(seconds=30)
+    assert sensor.events.pending_restore is not None
+
+def test_batch_pending_restore_is_confirmed_silently(monkeypatch):
+    monkeypatch.setattr(bot.subscribers, 'recipients', lambda group: {42})
+    sensor = bot.registry.resolve('quiet-restore', None)
+    now = datetime.now()
+
+    async def run():
+        app = {'notifier': StubNotifier()}
+        summary = bot.ingest_events(sensor, [(now - timedelta(minutes=5), 1, 'lost', None),
+                                             (now, 2, 'restored', None)], now)
+        bot.dispatch_actions(app, sensor, summary['actions'], notify=False)
+        assert sensor.events.pending_restore is not None and sensor.events.quiet
+        assert '🟢' in bot.batch_summary_message([(sensor, summary)])
+        bot.confirm_restore(app, sensor)
+        return app['notifier'].sent
+    assert asyncio.run(run()) == []
+    assert sensor.power_status and len(sensor.index) == 1
+    assert not sensor.events.quiet
+
+def test_ndjson_rejects_oversized_batch(monkeypatch):
+    monkeypatch.setattr(bot, 'MAX_BATCH_EVENTS', 3)
+    base = datetime.now() - timedelta(days=1)
+    status, _, _ = post_events([event('power_lost', base + timedelta(minutes=i)) for i in range(5)])
+    assert status == 400
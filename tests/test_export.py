@@ -0,0 +1,65 @@
+"""Потоковий експорт історії: сторінки, межі діапазону, HTTP."""
+import asyncio
+
+import numpy as np
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import bot
+from bot import PowerMonitor, iter_export
+
+def sensor_with(outages, sensor_id='export-test'):
+    sensor = PowerMonitor(sensor_id=sensor_id)
+    starts, ends = zip(*outages)
+    sensor.load_state(np.array(starts), np.array(ends), None)
+    return sensor
+
+def exported(sensor, lo, hi, chunk, fmt='ndjson'):
+    async def run():
+        return b''.join([part async for part in iter_export(sensor, lo, hi, fmt, chunk)])
+    return asyncio.run(run()).decode().splitlines()
+
+def brute(outages, lo, hi):
+    return [(start, end) for start, end in outages if end > lo and start < hi]
+
+OUTAGES = [(100, 200), (200, 200), (200, 200), (200, 300), (400, 400), (400, 500), (500, 500), (600, 700)]
+
+@pytest.mark.parametrize('chunk', [1, 2, 3, 5, 100])
+@pytest.mark.parametrize('lo, hi', [(0, 1000), (150, 450), (200, 500), (0, 400), (700, 800)])
+def test_pages_match_brute_force(chunk, lo, hi):
+    sensor = sensor_with(OUTAGES)
+    expected = [bot.format_export_rows(np.array([start]), np.array([end]), 'ndjson').decode().strip()
+                for start, end in brute(OUTAGES, lo, hi)]
+    assert exported(sensor, lo, hi, chunk) == expected
+
+def test_outages_added_during_export_do_not_shift_pages():
+    sensor = sensor_with([(i * 100, i * 100 + 50) for i in range(10)])
+
+    async def run():
+        rows = []
+        async for part in iter_export(sensor, 0, 10 ** 6, 'csv', chunk=3):
+            rows += part.decode().splitlines()
+            if len(rows) == 4:
+                sensor.add_outage(bot.from_seconds(5000), bot.from_seconds(5050))
+        return rows
+    rows = asyncio.run(run())
+    assert rows[0] == 'start,end,duration_seconds'
+    assert len(rows) == 1 + 11 and len(set(rows)) == len(rows)
+
+def test_export_endpoint_csv_range(monkeypatch):
+    sensor = sensor_with([(86400 * 10, 86400 * 10 + 600), (86400 * 20, 86400 * 20 + 60)], 'export-http')
+    monkeypatch.setitem(bot.registry.monitors, 'export-http', sensor)
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/sensors/{sensor_id}/export', bot.export_history)
+        async with TestClient(TestServer(app)) as client:
+            ok = await client.get('/sensors/export-http/export', params={'from': str(86400 * 15), 'format': 'csv'})
+            bad = await client.get('/sensors/export-http/export', params={'format': 'xml'})
+            missing = await client.get('/sensors/nope/export')
+            return ok.status, await ok.text(), ok.headers['Content-Type'], bad.status, missing.status
+    status, body, content_type, bad, missing = asyncio.run(run())
+    assert status == 200 and content_type.startswith('text/csv')
+    assert body.splitlines()[1:] == ['1970-01-21T00:00:00,1970-01-21T00:01:00,60']
+    assert bad == 400 and missing == 404
@@ -0,0 +1,71 @@
+"""Навчання прогнозу поза event loop."""
+import asyncio
+import threading
+from datetime import datetime
+
+import numpy as np
+
+import bot
+from bot import PowerMonitor, to_seconds
+
+def sensor_with_history(weeks=4):
+    sensor = PowerMonitor(sensor_id='forecast-test')
+    now = to_seconds(datetime.now()) // 3600 * 3600
+    starts = np.arange(now - weeks * 7 * 86400, now - 86400, 86400 // 2, dtype=np.int64)
+    sensor.load_state(starts, starts + 3600, None)
+    return sensor
+
+def test_fit_runs_in_thread_once_for_concurrent_requests():
+    sensor = sensor_with_history()
+    engine = sensor.forecast
+    threads = []
+    fit = engine.fit
+
+    def tracked_fit(now, index=None, rewrites=None):
+        threads.append(threading.current_thread())
+        fit(now, index, rewrites)
+    engine.fit = tracked_fit
+
+    async def run():
+        await asyncio.gather(*(bot.fit_forecast(sensor) for _ in range(5)))
+        return engine.fitting
+    assert asyncio.run(run()) is None
+    assert len(threads) == 1 and threads[0] is not threading.main_thread()
+    forecast = engine.predict(to_seconds(datetime.now()))
+    assert forecast is not None and forecast['weeks'] >= 3
+
+def test_thread_fit_reads_a_copy_while_loop_appends():
+    sensor = sensor_with_history()
+    engine = sensor.forecast
+    fit = engine.fit
+    started, release = threading.Event(), threading.Event()
+    seen = []
+
+    def slow_fit(now, index=None, rewrites=None):
+        seen.append(index)
+        started.set()
+        release.wait(5)
+        fit(now, index, rewrites)
+    engine.fit = slow_fit
+
+    async def run():
+        task = asyncio.ensure_future(bot.fit_forecast(sensor))
+        await asyncio.to_thread(started.wait, 5)
+        # Поки потік навчається, event loop дописує нові відключення
+        end = int(sensor.index.ends[-1])
+        for i in range(1000):
+            sensor.add_outage(bot.from_seconds(end + 600 * i + 60), bot.from_seconds(end + 600 * i + 120))
+        release.set()
+        await task
+    asyncio.run(run())
+    assert isinstance(seen[0], bot.FrozenIndex)
+    assert len(seen[0]) == len(sensor.index) - 1000
+    assert engine.predict(to_seconds(datetime.now())) is not None
+
+def test_predict_sees_whole_model_at_once():
+    sensor = sensor_with_history()
+    engine = sensor.forecast
+    now = to_seconds(datetime.now())
+    engine.fit(now)
+    anchor, cumulative, weeks = engine.model
+    assert anchor == now // 3600 * 3600 and len(cumulative) == 169 and weeks == engine.weeks
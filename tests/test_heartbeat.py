@@ -0,0 +1,99 @@
+"""Колесо таймерів проти перебору і детектор heartbeat-ів."""
+import math
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import bot
+from bot import HeartbeatDetector, TimerWheel
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('slots, levels', [(4, 3), (64, 4)])
+def test_timer_wheel_matches_brute_force(seed, slots, levels):
+    rng = random.Random(seed)
+    wheel = TimerWheel(tick=0.5, slots=slots, levels=levels, now=1000)
+    expected = {}  # ключ -> тик дедлайну
+    now = 1000.0
+    for _ in range(2000):
+        op = rng.random()
+        if op < 0.5:
+            key = rng.randrange(200)
+            # Близькі, далекі і далі за верхнє кільце дедлайни
+            deadline = now + rng.choice([rng.uniform(-1, 3), rng.uniform(0, 40), rng.uniform(0, 2000)])
+            wheel.schedule(key, deadline)
+            expected[key] = max(math.ceil(deadline / 0.5), wheel.current + 1)
+        elif op < 0.6 and expected:
+            key = rng.choice(list(expected))
+            wheel.cancel(key)
+            del expected[key]
+        else:
+            now += rng.choice([0.3, 0.5, 2, 17, 300])
+            target = int(now // 0.5)
+            fired = {key for key, due in expected.items() if due <= target}
+            assert sorted(wheel.advance(now)) == sorted(fired)
+            for key in fired:
+                del expected[key]
+        assert len(wheel) == len(expected)
+
+def test_detector_reschedules_on_newer_beats_and_ignores_replays():
+    detector = HeartbeatDetector(timeout=10, tick=1)
+    detector.wheel.current = 0
+    assert not detector.beat('s', 1)
+    detector.beat('s', 8)
+    assert detector.expire(12) == []
+    assert detector.expire(18) == [('s', 8)]
+    # Той самий heartbeat, прочитаний повторно, не оживляє сенсор
+    assert not detector.beat('s', 8)
+    assert detector.beat('s', 20)
+
+class StubStore:
+    def __init__(self, leader, beats):
+        self.is_leader = leader
+        self.beats = beats
+
+    def heartbeats_since(self, since):
+        return [(sensor_id, seen) for sensor_id, seen in self.beats if seen > since]
+
+def test_only_leader_detects_with_shared_heartbeats(monkeypatch):
+    bot.registry.resolve('hb-shared', None)
+    detector = HeartbeatDetector(timeout=10, tick=1)
+    detector.wheel.current = 0
+    events = []
+    monkeypatch.setattr(bot, 'heartbeats', detector)
+    monkeypatch.setattr(bot, 'apply_power_event',
+                        lambda app, sensor, kind, at, source: events.append((kind, at)) or [(kind, at)])
+
+    store = StubStore(leader=False, beats=[('hb-shared', 5.0)])
+    monkeypatch.setattr(bot, 'state_store', store)
+    bot.heartbeat_tick(None, 30)
+    assert len(detector.wheel) == 0 and events == []
+
+    store.is_leader = True
+    bot.heartbeat_tick(None, 6)
+    assert 'hb-shared' in detector.wheel
+    bot.heartbeat_tick(None, 16)
+    assert events == [('lost', datetime.fromtimestamp(5))]
+    # Heartbeat прийшов на інший екземпляр — лідер бачить його через базу
+    store.beats.append(('hb-shared', 20.0))
+    bot.heartbeat_tick(None, 21)
+    assert events[-1] == ('restored', datetime.fromtimestamp(20))
+
+def test_heartbeat_loss_is_not_dated_before_recorded_outages(monkeypatch):
+    sensor = bot.registry.resolve('hb-overlap', None)
+    sensor.events.window = timedelta(0)
+    detector = HeartbeatDetector(timeout=300, tick=1)
+    monkeypatch.setattr(bot, 'heartbeats', detector)
+    monkeypatch.setattr(bot, 'state_store', None)
+    monkeypatch.setattr(bot, 'dispatch_actions', lambda *args, **kwargs: None)
+    base = bot.to_seconds(datetime.now()) - 3600
+    detector.wheel.current = int(base)
+    detector.beat('hb-overlap', base)
+    # Після останнього heartbeat-у сенсор ще встиг надіслати явні події
+    bot.apply_power_event(None, sensor, 'lost', bot.from_seconds(base + 10))
+    bot.apply_power_event(None, sensor, 'restored', bot.from_seconds(base + 20))
+    bot.heartbeat_tick(None, base + 301)
+    assert sensor.last_outage_start == bot.from_seconds(base + 20)
+    sensor.power_restored(bot.from_seconds(base + 300))
+    stats = sensor.index.range_stats(base + 5, base + 30)
+    assert stats['count'] == 2 and stats['total'] == 20
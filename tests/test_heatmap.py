@@ -0,0 +1,92 @@
+"""Теплова карта за годиною тижня і перцентилі тривалості по днях."""
+import random
+from datetime import datetime
+
+import numpy as np
+
+from bot import PowerMonitor, hourly_activity, hour_slots, render_heatmap, to_seconds
+
+BASE = to_seconds(datetime(2024, 1, 29))  # понеділок
+
+def sensor_with(outages):
+    sensor = PowerMonitor(sensor_id='heatmap-test')
+    sensor.load_state(np.array([s for s, _ in outages], dtype=np.int64),
+                      np.array([e for _, e in outages], dtype=np.int64), None)
+    return sensor
+
+def brute_hours(outages, lo, hi):
+    hours = (hi - lo) // 3600
+    counts, down = [0] * hours, [0] * hours
+    for start, end in outages:
+        if lo <= start < hi:
+            counts[(start - lo) // 3600] += 1
+        for h in range(hours):
+            a, b = lo + h * 3600, lo + (h + 1) * 3600
+            down[h] += max(0, min(end, b) - max(start, a))
+    return counts, down
+
+def random_outages(seed, count=80):
+    rng = random.Random(seed)
+    outages, t = [], BASE + 1234
+    for _ in range(count):
+        t += rng.randrange(60, 30 * 3600)
+        end = t + rng.randrange(1, 9 * 3600)
+        outages.append((t, end))
+        t = end
+    return outages
+
+def test_hourly_activity_matches_brute_force():
+    outages = random_outages(3)
+    sensor = sensor_with(outages)
+    for lo, hi in [(BASE, BASE + 30 * 86400), (BASE + 5 * 3600, BASE + 5 * 3600 + 86400), (BASE - 86400, BASE + 3600)]:
+        counts, down = hourly_activity(sensor.index, lo, hi)
+        assert (counts.tolist(), down.tolist()) == brute_hours(outages, lo, hi)
+
+def test_hour_slots_start_on_monday():
+    assert hour_slots(BASE, 3).tolist() == [0, 1, 2]
+    assert hour_slots(BASE - 3600, 2).tolist() == [167, 0]
+
+def test_heatmap_and_percentiles():
+    # Щопонеділка 10:00-12:00 і щосуботи 3:00-3:30, чотири тижні
+    outages = []
+    for week in range(4):
+        monday = BASE + week * 7 * 86400
+        outages += [(monday + 10 * 3600, monday + 12 * 3600), (monday + 5 * 86400 + 3 * 3600, monday + 5 * 86400 + 3 * 3600 + 1800)]
+    sensor = sensor_with(outages)
+    now = BASE + 28 * 86400
+    result = sensor.analytics.long_term(now)
+
+    assert result['count'] == 8
+    heatmap = result['heatmap']
+    assert heatmap.shape == (7, 24)
+    assert heatmap[0, 10] == heatmap[0, 11] == 1.0
+    assert heatmap[5, 3] == 0.5
+    assert heatmap.sum() == 2.5
+    assert set(result['percentiles']) == {0, 5}
+    count, percentiles = result['percentiles'][0]
+    assert count == 4 and percentiles.tolist() == [7200, 7200, 7200]
+
+    # Кеш до наступної зміни історії
+    assert sensor.analytics.long_term(now) is result
+    sensor.add_outages([now - 3600], [now - 1800])
+    assert sensor.analytics.long_term(now)['count'] == 9
+
+def test_percentiles_match_numpy_per_weekday():
+    outages = random_outages(5, 200)
+    result = sensor_with(outages).analytics.long_term(outages[-1][1])
+    by_day = {}
+    for start, end in outages:
+        by_day.setdefault((start // 86400 + 3) % 7, []).append(end - start)
+    assert set(result['percentiles']) == set(by_day)
+    for weekday, durations in by_day.items():
+        count, percentiles = result['percentiles'][weekday]
+        assert count == len(durations)
+        assert np.allclose(percentiles, np.percentile(durations, [50, 90, 99]))
+
+def test_render_heatmap_text():
+    assert "Недостатньо даних" in render_heatmap(PowerMonitor(sensor_id='heatmap-test'))
+    now = to_seconds(datetime.now())
+    sensor = sensor_with([(now - 5 * 3600, now - 3 * 3600)])
+    text = render_heatmap(sensor)
+    assert "(1 відключень)" in text and "2г 0хв / 2г 0хв / 2г 0хв (1)" in text
+    assert text.count('\n') < 40 and len(text) < 4096
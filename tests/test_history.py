@@ -0,0 +1,67 @@
+"""Посторінкова історія: зрізи з індексу і клавіатура гортання."""
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from bot import HISTORY_PAGE_SIZE, PowerMonitor, from_seconds, render_history, to_seconds
+
+NOW = to_seconds(datetime.now())
+TODAY = NOW // 86400 * 86400
+YESTERDAY = TODAY - 86400
+
+@pytest.fixture
+def sensor():
+    """45 відключень учора, одне через північ і поточне з сьогоднішнього ранку"""
+    starts = [YESTERDAY + 600 * k for k in range(45)] + [TODAY - 200]
+    ends = [start + 300 for start in starts[:-1]] + [TODAY + 100]
+    sensor = PowerMonitor()
+    sensor.load_state(np.array(starts), np.array(ends), from_seconds(NOW - 60))
+    return sensor
+
+def outage_lines(text):
+    return [line for line in text.splitlines() if line[:1].isdigit()]
+
+def callbacks(markup):
+    return [[button.callback_data for button in row] for row in markup.inline_keyboard]
+
+def test_pages_are_contiguous_slices_of_the_day(sensor):
+    pages = 46 // HISTORY_PAGE_SIZE + 1
+    numbers = []
+    for page in range(pages):
+        text, _ = render_history(sensor, YESTERDAY, page)
+        lines = outage_lines(text)
+        assert len(lines) <= HISTORY_PAGE_SIZE
+        assert f"Сторінка {page + 1} з {pages}" in text
+        assert len(text) < 4096
+        numbers += [int(line.split('.')[0]) for line in lines]
+    assert numbers == list(range(1, 47))
+    # Відключення через північ обрізане кінцем доби
+    assert outage_lines(render_history(sensor, YESTERDAY, pages - 1)[0])[-1].startswith("46. 23:56 - 24:00")
+
+def test_page_out_of_range_is_clamped(sensor):
+    last = render_history(sensor, YESTERDAY, 2)[0]
+    assert render_history(sensor, YESTERDAY, 99)[0] == last
+    assert render_history(sensor, YESTERDAY, -5)[0] == render_history(sensor, YESTERDAY, 0)[0]
+
+def test_today_includes_current_outage(sensor):
+    text, markup = render_history(sensor)
+    lines = outage_lines(text)
+    assert lines[0].startswith("1. 00:00 - 00:01")
+    assert lines[-1].endswith("🔴") and "зараз" in lines[-1]
+    # Сьогодні одна сторінка: лише дні, без гортання і без «наступної доби»
+    rows = callbacks(markup)
+    assert rows[0] == [f'hist:{YESTERDAY}:0']
+    assert len(rows[1]) == 7 and rows[1][-1] == f'hist:{TODAY}:0'
+
+def test_keyboard_navigation(sensor):
+    _, markup = render_history(sensor, YESTERDAY, 1)
+    rows = callbacks(markup)
+    assert rows[0] == [f'hist:{YESTERDAY}:0', f'hist:{YESTERDAY}:1', f'hist:{YESTERDAY}:2']
+    assert rows[1] == [f'hist:{YESTERDAY - 86400}:0', f'hist:{TODAY}:0']
+    assert all(len(data.encode()) <= 64 for row in rows for data in row)
+
+def test_empty_day_and_future_day(sensor):
+    text, _ = render_history(sensor, YESTERDAY - 5 * 86400)
+    assert "Відключень не було" in text
+    assert render_history(sensor, TODAY + 3 * 86400)[0] == render_history(sensor)[0]
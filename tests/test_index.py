@@ -0,0 +1,89 @@
+"""OutageIndex.range_stats проти повного перебору."""
+import random
+
+import pytest
+
+from bot import OutageIndex
+
+def brute_stats(outages, lo, hi):
+    pieces = [(max(start, lo), min(end, hi)) for start, end in outages if end > lo and start < hi]
+    if not pieces:
+        return None
+    durations = [end - start for start, end in pieces]
+    return {
+        'count': len(pieces),
+        'total': sum(durations),
+        'longest': max(durations),
+        'shortest': min(durations),
+        'last': pieces[-1],
+    }
+
+def random_outages(rng, count):
+    """Відключення без перетинів, зокрема нульової тривалості і через північ"""
+    outages = []
+    t = 0
+    for _ in range(count):
+        t += rng.choice([0, 1, rng.randrange(60, 6 * 3600)])
+        length = rng.choice([0, rng.randrange(1, 600), rng.randrange(3600, 30 * 3600)])
+        outages.append((t, t + length))
+        t += length
+    return outages
+
+def check(index, outages, lo, hi):
+    stats = index.range_stats(lo, hi)
+    expected = brute_stats(outages, lo, hi)
+    if expected is None:
+        assert stats is None
+        return
+    assert stats['count'] == expected['count']
+    assert stats['total'] == expected['total']
+    assert stats['longest'][1] - stats['longest'][0] == expected['longest']
+    assert stats['shortest'][1] - stats['shortest'][0] == expected['shortest']
+    assert stats['last'] == expected['last']
+
+@pytest.mark.parametrize('seed', range(5))
+def test_range_stats_matches_brute_force(seed):
+    rng = random.Random(seed)
+    outages = random_outages(rng, 300)
+    index = OutageIndex()
+    for start, end in outages:
+        index.add(start, end)
+    horizon = outages[-1][1] + 86400
+    for _ in range(300):
+        lo = rng.randrange(-86400, horizon)
+        check(index, outages, lo, lo + rng.choice([1, 3600, 86400, 7 * 86400]))
+    # Межі доби
+    for day in range(0, horizon, 86400):
+        check(index, outages, day, day + 86400)
+
+def test_range_stats_after_bulk_load_and_out_of_order_insert():
+    rng = random.Random(42)
+    outages = random_outages(rng, 200)
+    index = OutageIndex()
+    index.load([start for start, _ in outages[1::2]], [end for _, end in outages[1::2]])
+    for start, end in outages[0::2]:
+        index.add(start, end)
+    for day in range(0, outages[-1][1] + 86400, 86400):
+        check(index, outages, day, day + 86400)
+
+def test_outage_across_midnight_is_split_between_days():
+    index = OutageIndex()
+    day = 10 * 86400
+    index.add(day - 3600, day + 7200)
+    yesterday = index.range_stats(day - 86400, day)
+    today = index.range_stats(day, day + 86400)
+    assert (yesterday['count'], yesterday['total']) == (1, 3600)
+    assert (today['count'], today['total']) == (1, 7200)
+    assert today['longest'] == (day, day + 7200)
+
+def test_zero_length_outages():
+    index = OutageIndex()
+    for start, end in [(100, 100), (100, 200), (300, 300)]:
+        index.add(start, end)
+    stats = index.range_stats(0, 1000)
+    assert stats['count'] == 3
+    assert stats['total'] == 100
+    assert stats['shortest'][1] - stats['shortest'][0] == 0
+    # Відключення, що закінчилось рівно на межі, в діапазон не потрапляє
+    assert index.range_stats(200, 300) is None
+    assert index.range_stats(299, 301)['count'] == 1
@@ -0,0 +1,209 @@
+"""Журнал (WAL) і знімок: запис, відновлення, обірваний хвіст."""
+import os
+
+import numpy as np
+import pytest
+
+from bot import (SNAPSHOT_HEADER_V1, SNAPSHOT_MAGIC_V1, WAL_HEADER, WAL_MAGIC, WAL_RECORD, JournalWriter, MonitorRegistry, OutageJournal, PowerMonitor,
+                 from_seconds, to_seconds)
+
+@pytest.fixture
+def writer():
+    writer = JournalWriter(flush_interval=0.001)
+    writer.start()
+    yield writer
+    writer.stop()
+
+def restore(path):
+    """Новий монітор зі стану на диску (з власним потоком запису)"""
+    writer = JournalWriter(flush_interval=0.001)
+    writer.start()
+    sensor = PowerMonitor()
+    sensor.attach_journal(OutageJournal(str(path), writer))
+    writer.stop()
+    return sensor
+
+def fill(sensor, base, count):
+    for i in range(count):
+        start = base + i * 600
+        sensor.power_lost(from_seconds(start))
+        sensor.power_restored(from_seconds(start + 300))
+
+def assert_same_state(restored, sensor):
+    for restored_column, column in zip(restored.index.columns(), sensor.index.columns()):
+        np.testing.assert_array_equal(restored_column, column)
+    assert restored.last_outage_start == sensor.last_outage_start
+    assert restored.power_status == sensor.power_status
+
+def test_wal_round_trip(tmp_path, writer):
+    sensor = PowerMonitor()
+    sensor.attach_journal(OutageJournal(str(tmp_path), writer))
+    fill(sensor, 1_000_000, 50)
+    sensor.add_outages([10, 100], [20, 200])
+    sensor.power_lost(from_seconds(2_000_000))
+    writer.stop()
+
+    assert_same_state(restore(tmp_path), sensor)
+
+def test_snapshot_then_wal_tail(tmp_path, writer):
+    sensor = PowerMonitor()
+    sensor.attach_journal(OutageJournal(str(tmp_path), writer))
+    fill(sensor, 1_000_000, 20)
+    sensor.journal.snapshot(sensor)
+    fill(sensor, 2_000_000, 5)
+    writer.stop()
+
+    restored = restore(tmp_path)
+    assert len(restored.index) == 25
+    assert_same_state(restored, sensor)
+    # Після знімка журнал нового покоління містить лише хвіст
+    assert os.path.getsize(tmp_path / 'journal.wal') == WAL_HEADER.size + 10 * WAL_RECORD.size
+
+def test_failed_wal_reset_after_snapshot_keeps_later_events(tmp_path, writer):
+    sensor = PowerMonitor()
+    journal = OutageJournal(str(tmp_path), writer)
+    sensor.attach_journal(journal)
+    fill(sensor, 1_000_000, 4)
+    atomic_write = journal._atomic_write
+
+    def fail_on_wal(path, *chunks):
+        if path == journal.wal_path:
+            raise OSError(5, 'Input/output error')
+        atomic_write(path, *chunks)
+    journal._atomic_write = fail_on_wal
+    sensor.journal.snapshot(sensor)
+    # Знімок нового покоління є, а журнал лишився старим — дозапис іде в нього
+    fill(sensor, 2_000_000, 3)
+    writer.call(lambda: None).result()
+    journal._atomic_write = atomic_write
+    sensor.power_lost(from_seconds(3_000_000))
+    writer.stop()
+
+    restored = restore(tmp_path)
+    assert len(restored.index) == 7
+    assert_same_state(restored, sensor)
+    # Хвіст перенесено в журнал покоління знімка
+    assert os.path.getsize(tmp_path / 'journal.wal') == WAL_HEADER.size + 7 * WAL_RECORD.size
+    assert_same_state(restore(tmp_path), sensor)
+
+def test_snapshot_v1_is_still_readable(tmp_path):
+    starts = np.array([100, 400], dtype='<i8')
+    ends = np.array([200, 500], dtype='<i8')
+    (tmp_path / 'snapshot.bin').write_bytes(
+        SNAPSHOT_HEADER_V1.pack(SNAPSHOT_MAGIC_V1, 3, 2, -1) + starts.tobytes() + ends.tobytes())
+    (tmp_path / 'journal.wal').write_bytes(WAL_HEADER.pack(WAL_MAGIC, 3) + WAL_RECORD.pack(2, 600, 700))
+    sensor = PowerMonitor()
+    assert OutageJournal(str(tmp_path)).load(sensor)[0] == 1
+    assert sensor.index.columns()[0].tolist() == [100, 400, 600]
+
+def test_torn_tail_is_ignored_and_truncated(tmp_path, writer):
+    sensor = PowerMonitor()
+    sensor.attach_journal(OutageJournal(str(tmp_path), writer))
+    fill(sensor, 1_000_000, 3)
+    writer.stop()
+    wal = tmp_path / 'journal.wal'
+    valid_size = os.path.getsize(wal)
+    with open(wal, 'ab') as f:
+        # Запис, обірваний аварійною зупинкою посеред write()
+        f.write(WAL_RECORD.pack(1, to_seconds(from_seconds(3_000_000)), 0)[:13])
+
+    restored = restore(tmp_path)
+    assert_same_state(restored, sensor)
+    assert os.path.getsize(wal) == valid_size
+
+def test_load_leaves_files_untouched(tmp_path, writer):
+    sensor = PowerMonitor()
+    sensor.attach_journal(OutageJournal(str(tmp_path), writer))
+    fill(sensor, 1_000_000, 3)
+    writer.stop()
+    wal = tmp_path / 'journal.wal'
+    with open(wal, 'ab') as f:
+        f.write(b'\x01' * 13)
+    before = wal.read_bytes()
+
+    loaded = PowerMonitor()
+    count, valid_size = OutageJournal(str(tmp_path)).load(loaded)
+    assert_same_state(loaded, sensor)
+    assert count == 6 and valid_size == len(before) - 13
+    assert wal.read_bytes() == before
+
+    # Журналу немає — load() нічого не створює
+    assert OutageJournal(str(tmp_path / 'empty')).load(PowerMonitor()) == (0, None)
+    assert not (tmp_path / 'empty').exists()
+
+def test_snapshot_all_skips_unchanged_sensors(tmp_path, writer):
+    registry = MonitorRegistry()
+    sensors = [registry.add(sensor_id, '1.1') for sensor_id in ('a', 'b')]
+    for sensor in sensors:
+        sensor.attach_journal(OutageJournal(str(tmp_path / sensor.sensor_id), writer))
+    snapshots = []
+    for sensor in sensors:
+        sensor.journal.snapshot = lambda monitor: snapshots.append(monitor.sensor_id)
+
+    registry.snapshot_all()
+    assert snapshots == []  # журнали порожні — знімати нічого
+    fill(sensors[0], 1_000_000, 2)
+    registry.snapshot_all()
+    registry.snapshot_all()
+    assert snapshots == ['a']
+    fill(sensors[1], 1_000_000, 1)
+    registry.snapshot_all()
+    assert snapshots == ['a', 'b']
+
+def test_sensor_with_wal_tail_is_snapshotted_after_restart(tmp_path, writer):
+    sensor = PowerMonitor()
+    sensor.attach_journal(OutageJournal(str(tmp_path), writer))
+    fill(sensor, 1_000_000, 2)
+    writer.stop()
+    assert restore(tmp_path).snapshot_version is None
+
+class FailingJournal:
+    """Журнал, чий диск «переповнений» перші fail_times записів"""
+    def __init__(self, fail_times):
+        self.fail_times = fail_times
+        self.written = []
+
+    def write_records(self, data):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise OSError(28, 'No space left on device')
+        self.written.append(bytes(data))
+
+def test_writer_survives_write_errors(writer):
+    journal = FailingJournal(fail_times=1)
+    writer.submit(journal, 'append', b'first')
+    writer.call(lambda: None).result(timeout=5)
+    assert writer.is_alive()
+    assert writer.errors == 1 and not writer.healthy()
+
+    writer.submit(journal, 'append', b'second')
+    assert writer.call(lambda: 42).result(timeout=5) == 42
+    assert journal.written == [b'second']
+
+def test_writer_fails_futures_after_stop(writer):
+    def boom():
+        raise ValueError('boom')
+    with pytest.raises(ValueError):
+        writer.call(boom).result(timeout=5)
+    writer.stop()
+    with pytest.raises(RuntimeError):
+        writer.call(lambda: 1).result(timeout=5)
+
+def test_failed_append_does_not_leave_torn_record(tmp_path, writer, monkeypatch):
+    sensor = PowerMonitor()
+    sensor.attach_journal(OutageJournal(str(tmp_path), writer))
+    fill(sensor, 1_000_000, 2)
+    writer.call(lambda: None).result(timeout=5)
+    wal = tmp_path / 'journal.wal'
+    size = os.path.getsize(wal)
+
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, 'fsync', lambda fd: (_ for _ in ()).throw(OSError(5, 'EIO')))
+    sensor.power_lost(from_seconds(1_500_000))
+    writer.call(lambda: None).result(timeout=5)
+    assert os.path.getsize(wal) == size
+    monkeypatch.setattr(os, 'fsync', real_fsync)
+
+    sensor.power_restored(from_seconds(1_500_100))
+    writer.stop()
+    assert os.path.getsize(wal) == size + WAL_RECORD.size
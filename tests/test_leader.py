@@ -0,0 +1,42 @@
+import asyncio
+from types import SimpleNamespace
+
+import bot
+
+class StubStore:
+    """Сховище, де продовження оренди зависає або падає"""
+    def __init__(self, renew):
+        self.lease = 0.05
+        self.is_leader = True
+        self.renew = renew
+
+    def renew_lease(self):
+        pass
+
+    def run(self, func):
+        return self.renew()
+
+def run_leader_task(monkeypatch, renew):
+    store = StubStore(renew)
+    polling = []
+
+    async def set_polling(bot_app, enabled):
+        polling.append(enabled)
+    monkeypatch.setattr(bot, 'state_store', store)
+    monkeypatch.setattr(bot, 'set_polling', set_polling)
+    monkeypatch.setattr(bot, 'TELEGRAM_WEBHOOK_URL', '')
+    context = SimpleNamespace(job=SimpleNamespace(data={'bot_app': None}))
+    asyncio.run(bot.leader_task(context))
+    return store, polling
+
+def test_hung_renewal_gives_up_leadership(monkeypatch):
+    store, polling = run_leader_task(monkeypatch, lambda: asyncio.sleep(10, result=True))
+    assert store.is_leader is False
+    assert polling == [False]
+
+def test_failed_renewal_gives_up_leadership(monkeypatch):
+    async def fail():
+        raise RuntimeError("Потік запису зупинено")
+    store, polling = run_leader_task(monkeypatch, fail)
+    assert store.is_leader is False
+    assert polling == [False]
@@ -0,0 +1,91 @@
+"""Структуровані логи через чергу: формат, проріджування, фоновий запис."""
+import json
+import logging
+import queue
+import sys
+import threading
+
+import pytest
+
+import bot
+from bot import JsonFormatter, LogQueueHandler, SampledLogger
+
+@pytest.fixture
+def restore_logging():
+    """setup_logging змінює глобальний стан logging — повернути як було"""
+    root = logging.getLogger()
+    saved = (list(root.handlers), root.level, bot.log.level, bot.request_log.rate,
+             logging._srcfile, logging.logThreads, logging.logProcesses, logging.logMultiprocessing)
+    yield
+    bot.stop_logging()
+    (root.handlers, level, log_level, bot.request_log.rate,
+     logging._srcfile, logging.logThreads, logging.logProcesses, logging.logMultiprocessing) = saved
+    root.setLevel(level)
+    bot.log.setLevel(log_level)
+
+def test_json_formatter_keeps_extra_fields():
+    record = logging.makeLogRecord({'name': 'powerbot', 'levelname': 'INFO', 'msg': 'Світло %s',
+                                    'args': ('зникло',), 'sensor': 'kitchen', 'attempt': 2})
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['msg'] == 'Світло зникло' and entry['level'] == 'INFO' and entry['logger'] == 'powerbot'
+    assert entry['sensor'] == 'kitchen' and entry['attempt'] == 2
+    assert not set(entry) & {'args', 'created', 'levelno', 'pathname'}
+
+def test_json_formatter_includes_exception():
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        record = logging.getLogger('powerbot.test').makeRecord('powerbot.test', logging.ERROR, None, 0, 'fail', (),
+                                                               exc_info=sys.exc_info())
+    entry = json.loads(JsonFormatter().format(record))
+    assert 'ValueError: boom' in entry['exc']
+
+def test_queue_handler_does_not_format_in_caller():
+    records = queue.SimpleQueue()
+    handler = LogQueueHandler(records)
+    logger = logging.getLogger('powerbot.queue-test')
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        payload = list(range(3))
+        logger.warning('стан %s', payload)
+    finally:
+        logger.removeHandler(handler)
+    record = records.get_nowait()
+    # Повідомлення ще не зібране — аргументи лишились як були
+    assert record.args == (payload,) and not hasattr(record, 'message')
+
+def test_sampled_logger_drops_before_creating_records():
+    inner = logging.getLogger('powerbot.sampled-test')
+    inner.setLevel(logging.DEBUG)
+    records = []
+    inner.makeRecord = lambda *args, **kwargs: records.append(args) or logging.Logger.makeRecord(inner, *args, **kwargs)
+    inner.propagate = False
+    sampled = SampledLogger(inner, rate=0)
+    for _ in range(100):
+        sampled.info('кожен запит')
+    assert records == []
+    sampled.rate = 1
+    sampled.info('кожен запит')
+    assert len(records) == 1
+
+def test_setup_logging_writes_json_from_background_thread(restore_logging, capsys):
+    threads = []
+    format = JsonFormatter.format
+
+    def tracked(self, record):
+        threads.append(threading.current_thread())
+        return format(self, record)
+    JsonFormatter.format = tracked
+    try:
+        bot.setup_logging(level='INFO', fmt='json', sample_rate=1)
+        bot.log.info("⚠️ Світло зникло", extra={'sensor': 'garage'})
+        bot.log.debug("не має потрапити")
+        logging.getLogger('httpx').info("бібліотека: кожен запит")
+        bot.stop_logging()
+    finally:
+        JsonFormatter.format = format
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line)['msg'] for line in lines] == ["⚠️ Світло зникло"]
+    assert json.loads(lines[0])['sensor'] == 'garage'
+    assert threads and threading.main_thread() not in threads
@@ -0,0 +1,85 @@
+"""Метрики Prometheus: формат виводу і ендпоінт /metrics."""
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import bot
+from bot import MetricsRegistry, timed
+
+def samples(text):
+    """Рядки-значення як {ім'я з мітками: число}"""
+    return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in text.splitlines() if line and not line.startswith('#')}
+
+def test_counter_and_gauge_format():
+    metrics = MetricsRegistry()
+    events = metrics.counter('test_events_total', 'Подій', ('source', 'result'))
+    events.labels('webhook', 'lost').inc()
+    events.labels('webhook', 'lost').inc(2)
+    events.labels('batch', 'say "hi"\n').inc()
+    metrics.gauge('test_up', 'Живий', lambda: [((), 1)])
+    text = metrics.render()
+
+    assert text.endswith('\n')
+    assert '# HELP test_events_total Подій\n# TYPE test_events_total counter\n' in text
+    assert '# TYPE test_up gauge\ntest_up 1\n' in text
+    assert samples(text) == {
+        'test_events_total{source="webhook",result="lost"}': 3,
+        'test_events_total{source="batch",result="say \\"hi\\"\\n"}': 1,
+        'test_up': 1,
+    }
+
+def test_histogram_buckets_are_cumulative():
+    metrics = MetricsRegistry()
+    latency = metrics.histogram('test_seconds', 'Затримка', ('route',), bounds=(0.1, 1))
+    child = latency.labels('/x')
+    for value in (0.05, 0.1, 0.5, 3):
+        child.observe(value)
+    values = samples(metrics.render())
+    assert values.pop('test_seconds_sum{route="/x"}') == pytest.approx(3.65)
+    assert values == {
+        'test_seconds_bucket{route="/x",le="0.1"}': 2,
+        'test_seconds_bucket{route="/x",le="1.0"}': 3,
+        'test_seconds_bucket{route="/x",le="+Inf"}': 4,
+        'test_seconds_count{route="/x"}': 4,
+    }
+
+def test_timed_observes_even_on_error():
+    metrics = MetricsRegistry()
+    child = metrics.histogram('test_handler_seconds', 'Обробник').labels()
+
+    @timed(child)
+    async def handler(fail):
+        if fail:
+            raise ValueError
+        return 'ok'
+
+    async def run():
+        assert await handler(False) == 'ok'
+        try:
+            await handler(True)
+        except ValueError:
+            pass
+    asyncio.run(run())
+    assert child.counts[-1] == 0 and sum(child.counts) == 2
+
+def test_metrics_endpoint_reports_routes():
+    async def run():
+        app = web.Application(middlewares=[bot.metrics_middleware])
+        app.router.add_get('/health', bot.health_check)
+        app.router.add_get('/metrics', bot.metrics_endpoint)
+        async with TestClient(TestServer(app)) as client:
+            for _ in range(3):
+                await client.get('/health')
+            response = await client.get('/metrics')
+            return response.headers['Content-Type'], await response.text()
+    content_type, text = asyncio.run(run())
+    assert content_type.startswith('text/plain') and 'version=0.0.4' in content_type
+    values = samples(text)
+    assert values['powerbot_http_request_duration_seconds_count{route="/health"}'] >= 3
+    assert 'powerbot_sensors' in values and 'powerbot_journal_writer_up' in values
+    # Кожна родина має HELP і TYPE
+    names = {line.split()[2] for line in text.splitlines() if line.startswith('# TYPE')}
+    assert {'powerbot_outages_total', 'powerbot_telegram_send_duration_seconds'} <= names
@@ -0,0 +1,98 @@
+"""Черга сповіщень: облік відправлених і невдалих повідомлень."""
+import asyncio
+import time
+
+from telegram.error import Conflict, InvalidToken, TelegramError
+
+from bot import Notifier, TokenBucket
+
+class FailingBot:
+    """Бот, що кидає задані помилки за текстом повідомлення"""
+    def __init__(self, errors):
+        self.errors = errors
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        error = self.errors.get(text)
+        if error:
+            raise error
+        self.sent.append((chat_id, text))
+
+def test_unexpected_errors_count_as_failed():
+    bot = FailingBot({
+        'conflict': Conflict('terminated by other getUpdates request'),
+        'token': InvalidToken(),
+        'telegram': TelegramError('boom'),
+        'bug': ValueError('boom'),
+    })
+
+    async def run():
+        notifier = Notifier(bot, workers=2, global_rate=1000, chat_rate=1000)
+        notifier.start()
+        for chat_id, text in enumerate(['conflict', 'token', 'ok', 'telegram', 'bug']):
+            notifier.notify(chat_id, text)
+        notifier.notify(1, 'after')
+        await notifier.stop(timeout=2)
+        return notifier.stats()
+    stats = asyncio.run(run())
+    assert stats['depth'] == 0
+    assert stats['failed'] == 4
+    assert stats['sent'] == 2
+    assert sorted(bot.sent) == [(1, 'after'), (2, 'ok')]
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text, time.monotonic()))
+
+def test_rate_limited_chat_does_not_block_other_chats():
+    bot = RecordingBot()
+
+    async def run():
+        notifier = Notifier(bot, workers=1, global_rate=1000, chat_rate=1000)
+        notifier.start()
+        notifier.chat_buckets[1] = TokenBucket(1000, 1)
+        notifier.chat_buckets[1].pause(0.3)  # як після RetryAfter
+        notifier.notify(1, 'first')
+        notifier.notify(1, 'second')
+        for chat_id in range(2, 6):
+            notifier.notify(chat_id, 'other')
+        started = time.monotonic()
+        await notifier.stop(timeout=2)
+        return started, notifier.stats()
+    started, stats = asyncio.run(run())
+    others = [at for chat_id, _, at in bot.sent if chat_id != 1]
+    assert len(others) == 4 and max(others) - started < 0.2
+    assert [text for chat_id, text, _ in bot.sent if chat_id == 1] == ['first', 'second']
+    assert stats['sent'] == 6 and stats['depth'] == 0
+
+def test_chat_rate_and_order():
+    bot = RecordingBot()
+
+    async def run():
+        notifier = Notifier(bot, workers=4, global_rate=1000, chat_rate=20)
+        notifier.start()
+        for i in range(5):
+            notifier.notify(7, f'm{i}')
+        await notifier.stop(timeout=2)
+    asyncio.run(run())
+    assert [text for _, text, _ in bot.sent] == ['m0', 'm1', 'm2', 'm3', 'm4']
+    times = [at for _, _, at in bot.sent]
+    # 20 повідомлень за секунду в чат: не частіше ніж раз на 50 мс
+    assert all(later - earlier >= 0.045 for earlier, later in zip(times, times[1:]))
+
+def test_newer_message_with_same_key_replaces_queued_one():
+    bot = RecordingBot()
+
+    async def run():
+        notifier = Notifier(bot, workers=1, global_rate=1000, chat_rate=1000)
+        notifier.notify(3, 'lost', key=('power', 's'))
+        notifier.notify(3, 'restored', key=('power', 's'))
+        notifier.start()
+        await notifier.stop(timeout=2)
+        return notifier.stats()
+    stats = asyncio.run(run())
+    assert [text for _, text, _ in bot.sent] == ['restored']
+    assert stats['coalesced'] == 1 and stats['sent'] == 1
@@ -0,0 +1,80 @@
+"""Розбір сторінки графіка ДТЕК і завантаження з умовними GET."""
+import asyncio
+import os
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from bot import SLOT_MAYBE, SLOT_OFF, ScheduleFetcher, parse_dtek_schedule
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'dtek_shutdowns.html')
+DAY1 = (1761602400 + 12 * 3600) // 86400 * 86400
+DAY2 = DAY1 + 86400
+HOUR = 3600
+
+def saved_page():
+    with open(FIXTURE, encoding='utf-8') as f:
+        return f.read()
+
+def test_saved_page_windows():
+    schedule = parse_dtek_schedule(saved_page(), '3.2')
+    assert sorted(schedule.days) == [DAY1, DAY2]
+    assert schedule.updated == '28.10.2025 06:41'
+    assert schedule.windows == [
+        (DAY1 + 8 * HOUR, DAY1 + 10 * HOUR + 1800, SLOT_OFF),   # no, no, first
+        (DAY1 + 17 * HOUR, DAY1 + 18 * HOUR, SLOT_MAYBE),
+        (DAY1 + 18 * HOUR + 1800, DAY1 + 19 * HOUR, SLOT_OFF),  # second
+        (DAY2, DAY2 + 1800, SLOT_MAYBE),                        # mfirst
+        (DAY2 + 22 * HOUR, DAY2 + 24 * HOUR, SLOT_OFF),
+    ]
+
+def test_missing_group_or_script_is_none():
+    assert parse_dtek_schedule(saved_page(), '9.9') is None
+    assert parse_dtek_schedule('<html><body>Технічні роботи</body></html>', '3.2') is None
+
+@pytest.mark.parametrize('fact', [
+    '[1, 2]',
+    '{"data": [1, 2]}',
+    '{"data": {"1761602400": "GPV3.2"}}',
+    '{"data": {"1761602400": {"GPV3.2": "no"}}}',
+    '{"data": {"1761602400": {"GPV3.2": ["no"]}}}',
+    '{"data": {"завтра": {"GPV3.2": {"1": "no"}}}}',
+    '{"data": {',
+])
+def test_unexpected_structure_is_value_error(fact):
+    with pytest.raises(ValueError):
+        parse_dtek_schedule(f'<script>DisconSchedule.fact = {fact};</script>', '3.2')
+
+def test_unknown_hour_values_count_as_power_on():
+    html = '<script>DisconSchedule.fact = {"data": {"1761602400": {"GPV3.2": {"1": ["no"], "2": null, "3": "no"}}}};</script>'
+    assert parse_dtek_schedule(html, '3.2').windows == [(DAY1 + 2 * HOUR, DAY1 + 3 * HOUR, SLOT_OFF)]
+
+def test_fetcher_against_stub_server():
+    pages = {'body': saved_page(), 'etag': '"v1"'}
+    requests = []
+
+    async def shutdowns(request):
+        requests.append(request.headers.get('If-None-Match'))
+        if request.headers.get('If-None-Match') == pages['etag']:
+            return web.Response(status=304)
+        return web.Response(text=pages['body'], content_type='text/html', headers={'ETag': pages['etag']})
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/ua/shutdowns', shutdowns)
+        async with TestServer(app) as server, aiohttp.ClientSession() as session:
+            fetcher = ScheduleFetcher(url=str(server.make_url('/ua/shutdowns')), group='3.2', session=session)
+            results = [await fetcher.refresh(), await fetcher.refresh()]
+            schedule = fetcher.schedule
+            # Сторінка змінилась і зламалась — лишаємо попередній графік
+            pages['body'], pages['etag'] = '<script>DisconSchedule.fact = [];</script>', '"v2"'
+            results.append(await fetcher.refresh())
+            assert fetcher.schedule is schedule
+            return results, fetcher.stats(), schedule
+    results, stats, schedule = asyncio.run(run())
+    assert results == [True, False, False]
+    assert requests == [None, '"v1"', '"v1"']
+    assert stats['fetches'] == 3 and stats['not_modified'] == 1 and stats['errors'] == 1
+    assert len(schedule.windows) == 5 and schedule.fetched_at is not None
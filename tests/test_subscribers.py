@@ -0,0 +1,103 @@
+"""Підписки чатів на групи: індекс, збереження на диск і розсилка."""
+import asyncio
+import json
+
+from telegram.error import Forbidden
+
+import bot
+from bot import Notifier, SubscriberRegistry, get_journal_writer
+
+def wait_for_writer():
+    get_journal_writer().call(lambda: None).result(timeout=5)
+
+def test_group_index_follows_changes(tmp_path):
+    registry = SubscriberRegistry(admin_chat=None)
+    registry.open(str(tmp_path))
+    assert registry.subscribe(1, '1.1') and registry.subscribe(1, '2.1') and registry.subscribe(2, '1.1')
+    assert not registry.subscribe(1, '1.1')
+    assert registry.recipients('1.1') == {1, 2}
+    assert registry.unsubscribe(1, '1.1')
+    assert not registry.unsubscribe(1, '1.1')
+    assert registry.recipients('1.1') == {2}
+    registry.remove(1)
+    assert registry.groups_of(1) == set() and '2.1' not in registry.by_group
+    assert len(registry) == 1
+
+def test_admin_chat_always_receives():
+    assert SubscriberRegistry(admin_chat='-100500').recipients('3.2') == {-100500}
+    assert SubscriberRegistry(admin_chat='@channel').recipients('3.2') == {'@channel'}
+
+def test_subscriptions_survive_restart(tmp_path):
+    registry = SubscriberRegistry(admin_chat=None)
+    registry.open(str(tmp_path))
+    registry.subscribe(10, '1.1')
+    registry.subscribe(10, '4.2')
+    registry.subscribe(-20, '1.1')
+    registry.unsubscribe(10, '4.2')
+    wait_for_writer()
+
+    with open(tmp_path / 'subscribers.json') as f:
+        assert json.load(f) == {'10': ['1.1'], '-20': ['1.1']}
+    reopened = SubscriberRegistry(admin_chat=None)
+    reopened.open(str(tmp_path))
+    assert reopened.chats == {10: {'1.1'}, -20: {'1.1'}}
+    assert reopened.by_group == {'1.1': {10, -20}}
+
+def test_changes_in_event_loop_are_saved_once_after_delay(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, 'SUBSCRIBERS_SAVE_DELAY', 0.05)
+    registry = SubscriberRegistry(admin_chat=None)
+    registry.open(str(tmp_path))
+    saves = []
+    save = registry.save
+    registry.save = lambda: (saves.append(1), save())
+
+    async def run():
+        for chat_id in range(50):
+            registry.subscribe(chat_id, '2.2')
+        assert not (tmp_path / 'subscribers.json').exists()
+        await asyncio.sleep(0.2)
+        registry.unsubscribe(7)
+        registry.flush()
+    asyncio.run(run())
+    wait_for_writer()
+    assert len(saves) == 2 and registry.save_handle is None
+    with open(tmp_path / 'subscribers.json') as f:
+        assert len(json.load(f)) == 49
+
+class BlockedBot:
+    def __init__(self, blocked):
+        self.blocked = blocked
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.blocked:
+            raise Forbidden('bot was blocked by the user')
+        self.sent.append((chat_id, text))
+
+def test_broadcast_reaches_group_and_drops_blocked_chats(tmp_path, monkeypatch):
+    registry = SubscriberRegistry(admin_chat=None)
+    registry.open(str(tmp_path))
+    for chat_id in range(30):
+        registry.subscribe(chat_id, '1.1' if chat_id % 3 else '5.1')
+    monkeypatch.setattr(bot, 'subscribers', registry)
+    monkeypatch.setattr(bot, 'state_store', None)
+    telegram = BlockedBot(blocked={3, 4})
+
+    async def run():
+        notifier = Notifier(telegram, workers=4, global_rate=1000, chat_rate=1000)
+        notifier.on_forbidden = registry.remove
+        notifier.start()
+        app = {'notifier': notifier}
+        bot.deliver(app, '1.1', 'sensor', 'перше')
+        bot.deliver(app, '1.1', 'sensor', 'друге')  # замінює ще не відправлене
+        bot.deliver(app, '5.1', None, 'інша група')
+        await notifier.stop(timeout=2)
+        registry.flush()
+        return notifier.stats()
+    stats = asyncio.run(run())
+
+    group = {chat_id for chat_id in range(30) if chat_id % 3}
+    assert sorted(telegram.sent) == sorted([(chat_id, 'друге') for chat_id in group - {4}] +
+                                           [(chat_id, 'інша група') for chat_id in range(0, 30, 3) if chat_id != 3])
+    assert stats['coalesced'] == len(group) and stats['failed'] == 2
+    assert registry.groups_of(3) == set() and 4 not in registry.recipients('1.1')
@@ -0,0 +1,48 @@
+"""Обробка апдейтів Telegram: порядок у чаті і спільний ліміт."""
+import asyncio
+
+from telegram import Update
+
+from bot import ChatOrderedUpdateProcessor
+
+def update(update_id, chat_id):
+    return Update.de_json({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': 'x', 'chat': {'id': chat_id, 'type': 'private'}}}, None)
+
+def test_waiting_chat_does_not_hold_a_slot():
+    async def run():
+        processor = ChatOrderedUpdateProcessor(max_concurrent_updates=2)
+        release = asyncio.Event()
+        done = []
+
+        async def handle(name, wait=False):
+            if wait:
+                await release.wait()
+            done.append(name)
+        tasks = [asyncio.create_task(processor.process_update(update(1, 1), handle('a1', wait=True))),
+                 asyncio.create_task(processor.process_update(update(2, 1), handle('a2')))]
+        await asyncio.sleep(0.01)
+        # Чат 1 чекає повільний апдейт; чат 2 має обробитись без нього
+        await asyncio.wait_for(processor.process_update(update(3, 2), handle('b1')), 1)
+        assert done == ['b1']
+        release.set()
+        await asyncio.gather(*tasks)
+        return done, processor.chat_locks
+    done, locks = asyncio.run(run())
+    assert done == ['b1', 'a1', 'a2']
+    assert locks == {}
+
+def test_limit_bounds_concurrent_updates():
+    async def run():
+        processor = ChatOrderedUpdateProcessor(max_concurrent_updates=3)
+        active, peak = 0, 0
+
+        async def handle():
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+        await asyncio.gather(*(processor.process_update(update(i, i), handle()) for i in range(10)))
+        return peak
+    assert asyncio.run(run()) == 3